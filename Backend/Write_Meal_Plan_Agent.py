@@ -1,121 +1,65 @@
-from typing import List, Dict, Any
-import os
+from typing import Dict, Any
 from dotenv import load_dotenv
-from pydantic import BaseModel
 from flask import Flask, request, jsonify
 
 # Load environment variables from .env file
 load_dotenv()
 
-# Configure OpenAI API key
-os.environ["OPENAI_API_KEY"] = os.getenv("OPENAI_API_KEY")
-if not os.getenv("OPENAI_API_KEY"):
-    print("Warning: OPENAI_API_KEY not found in environment variables")
+# The swarm runs on Bedrock (AWS credentials from the environment); no
+# OpenAI key is needed.
 
-# Strands imports
-from strands import Agent
-from strands.multiagent.swarm import Swarm, SharedContext
-
-# --- Pydantic schema for incoming form ---
-class PreferenceForm(BaseModel):
-    name: str
-    age: int
-    height_cm: int
-    weight_kg: float
-    activity_level: str  # sedentary, light, moderate, active, very_active
-    dietary_restrictions: List[str] = []  # e.g. ["vegetarian", "gluten-free"]
-    dislikes: List[str] = []
-    caloric_goal: int = None  # optional - will be calculated if not provided
-    goal: str  # "lose", "maintain", "gain"
+from backend_common import intake, swarm_planner
+from backend_common.intake import PreferenceForm
+from backend_common.swarm_planner import nutrition_lookup_tool  # noqa: F401  (re-exported for callers)
+import routes_prefs_meals as meals
 
 app = Flask(__name__)
 
-# --- Placeholder nutrition tool ---
-# In production, replace with a real tool that queries a nutrition DB or API.
-def nutrition_lookup_tool(query: str) -> Dict[str, Any]:
-    # Very small mock database
-    db = {
-        "chicken breast": {"cal": 165, "protein_g": 31, "carbs_g": 0, "fat_g": 3.6},
-        "brown rice (1 cup)": {"cal": 216, "protein_g": 5, "carbs_g": 44, "fat_g": 1.8},
-        "broccoli (1 cup)": {"cal": 55, "protein_g": 3.7, "carbs_g": 11.2, "fat_g": 0.6},
-        "oats (1 cup)": {"cal": 307, "protein_g": 11, "carbs_g": 55, "fat_g": 5.3},
+def form_to_prefs(form: PreferenceForm) -> Dict[str, Any]:
+    """
+    The stored-preferences shape the meal-plan prompt and parser work with,
+    with calorie/macro targets computed locally (raises intake.IntakeError).
+    """
+    targets = intake.compute_targets(form)
+    return {
+        "calorie_target": targets["calorie_target"],
+        "protein_g_target": targets["protein_g_target"],
+        "carb_g_target": targets["carb_g_target"],
+        "fat_g_target": targets["fat_g_target"],
+        "diet": form.dietary_restrictions[0] if form.dietary_restrictions else "balanced",
+        "exclude_ingredients": list(form.dislikes),
+        "meals_per_day": 4,  # 3 meals + 1 snack
     }
-    return db.get(query.lower(), {"cal": 100, "protein_g": 5, "carbs_g": 10, "fat_g": 3})
-
-# --- Agent factory functions ---
-# Each agent is a thin wrapper around an LLM-driven Agent with a role prompt.
-
-def create_intake_agent():
-    prompt = (
-        "You are Intake Agent. Validate the user's form and compute a suggested daily calorie target. "
-        "Return JSON with keys: validated_form, suggested_calories."
-    )
-    return Agent(name="IntakeAgent", system_prompt=prompt)
-
-
-def create_nutrition_agent():
-    prompt = (
-        "You are Nutrition Agent. Given a list of ingredients or dishes, return macronutrients and calories. "
-        "You can call a local nutrition_lookup_tool for exact numbers."
-    )
-    # pass the tool as a Python-callable that the agent can call
-    return Agent(name="NutritionAgent", system_prompt=prompt, tools=[nutrition_lookup_tool])
-
-
-def create_planner_agent():
-    prompt = (
-        "You are Planner Agent. Using the validated form and nutrition info, create a 7-day meal plan (3 meals + 1 snack per day) that meets the daily calorie target and respects restrictions. "
-        "Return JSON with: meal_plan (dict day->meals), shopping_list (list), daily_totals (cal/protein/carbs/fat)."
-    )
-    return Agent(name="PlannerAgent", system_prompt=prompt)
-
-# --- Core orchestration using Strands Swarm ---
-async def run_meal_planner_swarm(form: PreferenceForm) -> Dict[str, Any]:
-    # create agents
-    intake = create_intake_agent()
-    nutrition = create_nutrition_agent()
-    planner = create_planner_agent()
 
-    # build swarm: pass agents list directly (no shared_context parameter)
-    swarm = Swarm([intake, nutrition, planner])
-
-    # prepare form data for the swarm
-    # Use model_dump() for Pydantic v2, or dict() for v1
-    try:
-        # For Pydantic v2
-        form_data = form.model_dump()
-    except AttributeError:
-        # Fallback for Pydantic v1
-        form_data = form.dict()
-
-    # Give a top-level goal for the swarm with the form data included
-    goal = (
-        f"Produce a 7-day meal plan and corresponding shopping list for the user with the following preferences: {form_data}. "
-        "First validate and enrich the user data, then look up nutrition information as needed, "
-        "and finally create a complete meal plan that meets their caloric goals and dietary restrictions."
-    )
-
-    # Run the swarm using the correct API
-    result = await swarm.invoke_async(goal)
-    
-    # Extract the result content
-    if hasattr(result, 'content') and result.content:
-        return result.content
-    elif hasattr(result, 'response'):
-        return result.response
-    else:
-        return str(result)
+# --- Core orchestration using the pooled Strands Swarm (backend_common.swarm_planner) ---
+def create_meal_plan(form: PreferenceForm) -> Dict[str, Any]:
+    """7-day plan for a profile form: targets from backend_common.intake, plan from the swarm."""
+    prefs = form_to_prefs(form)
+    _, task = meals.build_mealplan_prompt(prefs)
+    raw, run = swarm_planner.run(meals._mealplan_model_id(), task)
+    return {"mealplan": meals.parse_mealplan(raw, prefs), "targets": prefs, "run": run}
 
 
 # --- Flask endpoint ---
 @app.route("/plan", methods=["POST"])
 def plan_meals():
     # Parse JSON body
-    data = request.get_json()
-    form = PreferenceForm(**data)
-    # Create meal plan using simple agent
-    plan = create_meal_plan(form)
-    return jsonify({"status": "ok", "plan": plan})
+    data = request.get_json() or {}
+    try:
+        form = PreferenceForm(**data)
+        intake.validate_profile(form)
+    except Exception as e:
+        return jsonify({"status": "error", "msg": f"invalid form: {e}"}), 400
+    try:
+        plan = create_meal_plan(form)
+    except ValueError as e:
+        return jsonify({"status": "error", "msg": f"swarm returned no usable plan: {e}"}), 502
+    return jsonify({"status": "ok", "plan": plan["mealplan"], "targets": plan["targets"], "run": plan["run"]})
+
+
+@app.get("/plan/stats")
+def plan_stats():
+    return jsonify({"status": "ok", "swarm": swarm_planner.stats()})
 
 
 # --- Standalone runner for local testing ---
@@ -1,15 +1,20 @@
 # app.py
+import time
+_BOOT_T0 = time.perf_counter()  # worker readiness is measured from here
 import json
 
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 from datetime import datetime, timezone
 from functools import wraps
+from pymongo.errors import DuplicateKeyError
 import re
 # Shared helpers (make sure these files exist)
-from backend_common.envdb import db, ensure_user_indexes
-from backend_common.security import hash_password, verify_password
-from backend_common.jwt_tools import mint_access_and_refresh, verify_token
+from backend_common.envdb import db, ping, connection_stats
+from backend_common.security import hash_password, verify_password, needs_rehash, HashingBusy, HashingTimeout
+from backend_common.jwt_tools import mint_access_and_refresh, verify_token, claims_from_bearer, token_cache_stats
+from backend_common import agent_pool, chat_context, llm_json
+from backend_common.user_state import get_user_state, user_state_stats
 import os
 from pathlib import Path
 try:
@@ -20,14 +25,16 @@ except Exception:
 
 # If you saved the prefs/meal routes as routes_prefs_meals.py next to this file:
 from routes_prefs_meals import bp as prefs_bp
+BOOT_TIMINGS = {"imports_ms": round((time.perf_counter() - _BOOT_T0) * 1000, 2)}
 app = Flask(__name__)
 if "prefs_meals" not in app.blueprints:
     app.register_blueprint(prefs_bp)  # exposes /preferences, /mealplans/generate
 # DEV: allow your Vite origins (localhost and 127.0.0.1) and Authorization header
+CORS_ORIGINS = ["http://localhost:5173", "http://127.0.0.1:5173"]  # also used by asgi.py
 CORS(
     app,
     resources={r"/*": {
-        "origins": ["http://localhost:5173", "http://127.0.0.1:5173"],
+        "origins": CORS_ORIGINS,
         "methods": ["GET", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"],
         "allow_headers": ["Content-Type", "Authorization"],
         "expose_headers": ["Content-Type"],
@@ -35,7 +42,10 @@ CORS(
     }},
 )
 
-ensure_user_indexes()  # creates unique indexes for users once at startup
+# Indexes are created by `python migrate.py`, not on every worker boot.
+if os.getenv("RUN_MIGRATIONS_ON_START", "0") in ("1", "true", "True"):
+    from migrate import run_migrations
+    run_migrations(verbose=False)
 
 EMAIL_RE = re.compile(r"^[^@\s]+@[^@\s]+\.[^@\s]+$")
 
@@ -47,11 +57,43 @@ def public_user(u):
         "roles": u.get("roles", []),
     }
 
+def _busy(err: Exception = None):
+    """429 when the hashing queue is full, 503 when a hash timed out; both say when to retry."""
+    resp = jsonify({"ok": False, "msg": "server busy, please retry"})
+    resp.headers["Retry-After"] = "1"
+    return resp, (503 if isinstance(err, HashingTimeout) else 429)
+
 @app.get("/health")
 def health():
     db.client.admin.command("ping")
     return {"ok": True}
 
+@app.get("/health/ready")
+def health_ready():
+    """Worker readiness: boot timings plus Mongo connectivity (never 500s)."""
+    out = {"ok": True, "pid": os.getpid(), "boot": BOOT_TIMINGS, "db": connection_stats()}
+    try:
+        out["db"]["ping_ms"] = ping()
+    except Exception as e:
+        out["ok"] = False
+        out["db"]["error"] = str(e)
+    return jsonify(out), (200 if out["ok"] else 503)
+
+_DUPLICATE_MSGS = {"uniq_email": "email already in use", "uniq_username": "username already in use"}
+
+def _duplicate_msg(err: DuplicateKeyError) -> str:
+    details = err.details or {}
+    key_pattern = details.get("keyPattern") or {}
+    if "email" in key_pattern:
+        return _DUPLICATE_MSGS["uniq_email"]
+    if "username" in key_pattern:
+        return _DUPLICATE_MSGS["uniq_username"]
+    text = str(details.get("errmsg") or err)
+    for index_name, msg in _DUPLICATE_MSGS.items():
+        if index_name in text:
+            return msg
+    return "account already exists"
+
 @app.post("/auth/register")
 def register():
     data = request.get_json(force=True, silent=True) or {}
@@ -68,23 +110,28 @@ def register():
     if len(password) < 8:
         return jsonify({"ok": False, "msg": "password must be at least 8 chars"}), 400
 
-    if db.users.find_one({"email": email}):
-        return jsonify({"ok": False, "msg": "email already in use"}), 409
-    if db.users.find_one({"username": username}):
-        return jsonify({"ok": False, "msg": "username already in use"}), 409
+    # No pre-checks: the uniq_email / uniq_username indexes reject duplicates
+    # atomically, so signup is the hash plus a single insert round-trip.
+    try:
+        password_hash = hash_password(password)
+    except HashingBusy as e:  # includes HashingTimeout
+        return _busy(e)
 
     now = datetime.now(timezone.utc)
     user = {
         "email": email,
         "username": username,
-        "passwordHash": hash_password(password),
+        "passwordHash": password_hash,
         "roles": ["user"],
         "createdAt": now,
         "updatedAt": now,
         "profile": {"firstName": None, "lastName": None, "avatarUrl": None},
         "meta": {"emailVerified": False, "loginDisabled": False, "provider": "local"},
     }
-    res = db.users.insert_one(user)
+    try:
+        res = db.users.insert_one(user)
+    except DuplicateKeyError as e:
+        return jsonify({"ok": False, "msg": _duplicate_msg(e)}), 409
     user["_id"] = res.inserted_id
 
     tokens = mint_access_and_refresh(user)
@@ -99,8 +146,21 @@ def login():
     user = db.users.find_one({"email": email})
     if not user or "passwordHash" not in user:
         return jsonify({"ok": False, "msg": "invalid credentials"}), 401
-    if not verify_password(pw, user["passwordHash"]):
-        return jsonify({"ok": False, "msg": "invalid credentials"}), 401
+    try:
+        if not verify_password(pw, user["passwordHash"]):
+            return jsonify({"ok": False, "msg": "invalid credentials"}), 401
+        if needs_rehash(user["passwordHash"]):
+            # stored cost differs from BCRYPT_ROUNDS: upgrade while we have the plaintext
+            try:
+                db.users.update_one(
+                    {"_id": user["_id"], "passwordHash": user["passwordHash"]},
+                    {"$set": {"passwordHash": hash_password(pw),
+                              "updatedAt": datetime.now(timezone.utc)}},
+                )
+            except Exception as e:
+                print("Password rehash skipped:", e)
+    except HashingBusy as e:  # includes HashingTimeout
+        return _busy(e)
 
     tokens = mint_access_and_refresh(user)
     return jsonify({"ok": True, "user": public_user(user), **tokens})
@@ -113,9 +173,14 @@ def refresh():
         claims = verify_token(token)
         if claims.get("typ") != "refresh":
             return jsonify({"ok": False, "msg": "wrong token type"}), 400
-        user = db.users.find_one({"email": claims.get("email")})
+        # cached revocation state instead of a users lookup on every refresh
+        user = get_user_state(claims.get("sub", ""))
         if not user:
             return jsonify({"ok": False, "msg": "user not found"}), 404
+        if user["loginDisabled"]:
+            return jsonify({"ok": False, "msg": "login disabled"}), 403
+        if int(claims.get("ver", 0) or 0) != user["tokenVersion"]:
+            return jsonify({"ok": False, "msg": "refresh token revoked"}), 401
         tokens = mint_access_and_refresh(user)
         return jsonify({"ok": True, **tokens})
     except Exception:
@@ -128,10 +193,8 @@ def require_auth(fn):
         auth = request.headers.get("Authorization", "")
         if not auth.lower().startswith("bearer "):
             return jsonify({"ok": False, "msg": "missing bearer token"}), 401
-        token = auth.split(" ", 1)[1].strip()
         try:
-            claims = verify_token(token)
-            request.user = claims
+            request.user = claims_from_bearer(auth)
         except Exception:
             return jsonify({"ok": False, "msg": "invalid or expired token"}), 401
         return fn(*args, **kwargs)
@@ -141,101 +204,129 @@ def require_auth(fn):
 @require_auth
 def me():
     return jsonify({"ok": True, "claims": getattr(request, "user", {})})
+
+@app.get("/auth/cache/stats")
+@require_auth
+def auth_cache_stats():
+    return jsonify({"ok": True, "tokens": token_cache_stats(), "user_state": user_state_stats(),
+                    "chat_context": chat_context.stats()})
 import json  # ensure this is imported (top of file)
 
 # ---- Strands agent helpers (chat-only) ----
-def _loads_strict_json(txt: str) -> dict:
-    s = str(txt).strip()
-    if s.startswith("```"):
-        s = s.strip("`")
-        nl = s.find("\n")
-        if nl > -1 and "{" not in s[:nl]:
-            s = s[nl+1:].strip()
-    return json.loads(s)
-
-def _mk_agent(model_id: str):
-    from strands.agent import Agent
-    for kwargs in ({"model": model_id},
-                   {"model_id": model_id},
-                   {"model": model_id, "provider": "bedrock"},
-                   {"model_id": model_id, "provider": "bedrock"}):
-        try:
-            return Agent(**kwargs)
-        except TypeError:
-            continue
-    return Agent()
-
-def _agent_invoke(agent, system_prompt: str, user_prompt: str, model_id: str):
-    try:
-        return agent(user_prompt, system_prompt=system_prompt)
-    except TypeError:
-        pass
-    if hasattr(agent, "run"):
-        try:
-            return agent.run(user_prompt, system_prompt=system_prompt)
-        except TypeError:
-            pass
-    try:
-        return agent(user_prompt, system_prompt=system_prompt, model=model_id)
-    except TypeError:
-        pass
-    if hasattr(agent, "run"):
-        return agent.run(user_prompt, system_prompt=system_prompt, model=model_id)
-    raise RuntimeError("Strands Agent invocation not supported by this version")
-
-def _call_strands_chat(messages: list, mealplan: dict) -> str:
+def _chat_prompts(messages: list, mealplan: dict):
+    """Returns (model_id, system_prompt, user_prompt) for one chat turn."""
     model_id = os.getenv("BEDROCK_MODEL_ID", "us.anthropic.claude-sonnet-4-20250514-v1:0")
 
-    def brief_mealplan(mp: dict) -> str:
-        try:
-            days = mp.get("days", [])
-            if not isinstance(days, list) or not days:
-                return "No mealplan."
-            lines = []
-            for d in days[:7]:
-                if not isinstance(d, dict): continue
-                meals = d.get("meals", [])
-                names = []
-                for m in meals[:4]:
-                    if isinstance(m, dict) and isinstance(m.get("name"), str):
-                        names.append(m["name"])
-                lines.append(f"Day {d.get('day','?')}: {', '.join(names)}")
-            return "\n".join(lines) or "No mealplan."
-        except Exception:
-            return "No mealplan."
-
     system = (
         "You are a helpful nutrition coach chatbot. "
         "Answer clearly and concisely. If asked for a grocery list, summarize common ingredients. "
         "If asked for swaps, offer 2–3 options with rationale. "
-        "If asked for macros, compute/explain using provided info. "
+        "If asked for macros, compute/explain using the plan table provided. "
+        "Keep replies short (a few sentences or a brief list) unless asked for detail. "
         "Return PLAIN TEXT (no JSON) unless explicitly asked for JSON."
     )
 
-    last_user = ""
-    for m in reversed(messages or []):
-        if isinstance(m, dict) and (m.get("role") or "").lower() == "user":
-            last_user = str(m.get("content", "")).strip()
-            if last_user:
-                break
-
-    user = (
-        f"Mealplan (short):\n{brief_mealplan(mealplan)}\n\n"
-        f"User says:\n{last_user or '(no message)'}\n\n"
-        "Respond now."
-    )
+    # compact plan table + recent turns under CHAT_CONTEXT_TOKENS (backend_common.chat_context)
+    user, _ = chat_context.build_user_prompt(messages, mealplan)
+    return model_id, system, user
 
-    agent = _mk_agent(model_id)
-    raw = _agent_invoke(agent, system_prompt=system, user_prompt=user, model_id=model_id)
+def _call_strands_chat(messages: list, mealplan: dict) -> str:
+    model_id, system, user = _chat_prompts(messages, mealplan)
+    raw = agent_pool.invoke(model_id, system_prompt=system, user_prompt=user)
+    return _chat_reply_text(raw)
+
+def _chat_reply_text(raw) -> str:
+    """Model output -> reply text (unwraps {"reply": ...} style JSON if the model sent it)."""
+    text = str(raw).strip()
+    if not text.startswith(("{", "```")):
+        return text  # plain prose, possibly quoting JSON: keep it as written
     try:
-        obj = _loads_strict_json(raw)
+        obj = llm_json.extract_object(text)
         for k in ("reply", "output", "message", "text"):
             v = obj.get(k)
             if isinstance(v, str) and v.strip():
                 return v.strip()
         return json.dumps(obj)[:2000]
     except Exception:
-        return str(raw).strip()
+        return text
+
+CHAT_FALLBACK_REPLY = "I can help with your meal plan chat. Ask for grocery lists, swaps, or macros per meal."
+
+def _strands_chat_enabled() -> bool:
+    return os.getenv("USE_STRANDS_CHAT", "1") not in ("0", "false", "False")
+
+def _parse_chat_body(data):
+    """Super defensive parsing of { messages, mealplan } -> (messages, mealplan)."""
+    def as_dict(x):
+        if isinstance(x, dict): return x
+        if isinstance(x, str):
+            try:
+                j = json.loads(x);
+                return j if isinstance(j, dict) else {}
+            except Exception:
+                return {}
+        return {}
+
+    def as_list(x):
+        if isinstance(x, list): return x
+        if isinstance(x, str):
+            try:
+                j = json.loads(x);
+                return j if isinstance(j, list) else []
+            except Exception:
+                return []
+        return []
+
+    if isinstance(data, str):
+        try: data = json.loads(data)
+        except Exception: data = {}
+    if not isinstance(data, dict): data = {}
+
+    msgs_in  = as_list(data.get("messages"))
+    messages = []
+    for m in msgs_in:
+        if isinstance(m, dict):
+            role = str(m.get("role", "")).strip().lower()
+            content = m.get("content", "")
+            if isinstance(content, (int, float)): content = str(content)
+            if isinstance(content, str):
+                messages.append({"role": role, "content": content})
+        elif isinstance(m, str) and m.strip():
+            messages.append({"role": "user", "content": m.strip()})
+
+    return messages, as_dict(data.get("mealplan"))
+
+def _sse(event: str, payload: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(payload)}\n\n"
+
+def _chat_stream_response(messages: list, mealplan: dict):
+    """
+    SSE stream: `chunk` events ({text}) as tokens arrive, then one `done`
+    ({reply, source}). If the agent fails before producing anything the
+    fallback reply is sent as a single chunk, same as the JSON route.
+    """
+    def events():
+        parts = []
+        if _strands_chat_enabled():
+            try:
+                model_id, system, user = _chat_prompts(messages, mealplan)
+                for text in agent_pool.stream(model_id, system_prompt=system, user_prompt=user):
+                    parts.append(text)
+                    yield _sse("chunk", {"text": text})
+            except Exception as e:
+                print("Strands chat stream failed:", e)
+                if parts:
+                    yield _sse("done", {"reply": "".join(parts), "source": "strands", "truncated": True})
+                    return
+        reply = "".join(parts).strip()
+        if reply:
+            yield _sse("done", {"reply": reply, "source": "strands"})
+            return
+        yield _sse("chunk", {"text": CHAT_FALLBACK_REPLY})
+        yield _sse("done", {"reply": CHAT_FALLBACK_REPLY, "source": "fallback"})
+
+    return Response(stream_with_context(events()), mimetype="text/event-stream",
+                    headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 # -------------------- Chat route --------------------
 @app.route("/chat", methods=["POST"])
@@ -244,51 +335,16 @@ def chat():
     """
     Accepts: { messages: [{role, content}] | string, mealplan: {...} | string }
     Returns: { ok: true, reply: string, debug?: {...} }
+    With ?stream=1 the reply is streamed as Server-Sent Events (see /chat/stream).
     """
     try:
-        # ----- super defensive parsing -----
-        def as_dict(x):
-            if isinstance(x, dict): return x
-            if isinstance(x, str):
-                try:
-                    j = json.loads(x);
-                    return j if isinstance(j, dict) else {}
-                except Exception:
-                    return {}
-            return {}
-
-        def as_list(x):
-            if isinstance(x, list): return x
-            if isinstance(x, str):
-                try:
-                    j = json.loads(x);
-                    return j if isinstance(j, list) else []
-                except Exception:
-                    return []
-            return []
-
-        data = request.get_json(silent=True)
-        if isinstance(data, str):
-            try: data = json.loads(data)
-            except Exception: data = {}
-        if not isinstance(data, dict): data = {}
-
-        msgs_in  = as_list(data.get("messages"))
-        messages = []
-        for m in msgs_in:
-            if isinstance(m, dict):
-                role = str(m.get("role", "")).strip().lower()
-                content = m.get("content", "")
-                if isinstance(content, (int, float)): content = str(content)
-                if isinstance(content, str):
-                    messages.append({"role": role, "content": content})
-            elif isinstance(m, str) and m.strip():
-                messages.append({"role": "user", "content": m.strip()})
-
-        mealplan = as_dict(data.get("mealplan"))
+        messages, mealplan = _parse_chat_body(request.get_json(silent=True))
+
+        if request.args.get("stream") in ("1", "true", "True"):
+            return _chat_stream_response(messages, mealplan)
 
         # ----- Strands Agent first (toggle with USE_STRANDS_CHAT) -----
-        if os.getenv("USE_STRANDS_CHAT", "1") not in ("0", "false", "False"):
+        if _strands_chat_enabled():
             try:
                 agent_reply = _call_strands_chat(messages, mealplan)
                 if isinstance(agent_reply, str) and agent_reply.strip():
@@ -297,11 +353,23 @@ def chat():
                 print("Strands chat failed:", e)
 
         # ----- fallback simple reply so UI never breaks -----
-        reply = "I can help with your meal plan chat. Ask for grocery lists, swaps, or macros per meal."
-        return jsonify({"ok": True, "reply": reply, "debug": {"source": "fallback"}})
+        return jsonify({"ok": True, "reply": CHAT_FALLBACK_REPLY, "debug": {"source": "fallback"}})
+
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"chat error: {str(e)}"}), 500
 
+@app.route("/chat/stream", methods=["POST"])
+@require_auth
+def chat_stream():
+    """Same body as /chat; responds with text/event-stream."""
+    try:
+        messages, mealplan = _parse_chat_body(request.get_json(silent=True))
+        return _chat_stream_response(messages, mealplan)
     except Exception as e:
         return jsonify({"ok": False, "msg": f"chat error: {str(e)}"}), 500
 
+BOOT_TIMINGS["ready_ms"] = round((time.perf_counter() - _BOOT_T0) * 1000, 2)
+print(f"worker {os.getpid()} ready in {BOOT_TIMINGS['ready_ms']} ms (imports {BOOT_TIMINGS['imports_ms']} ms)")
+
 if __name__ == "__main__":
     app.run(debug=True)
@@ -0,0 +1,309 @@
+# asgi.py
+"""
+ASGI entry point. The LLM-bound routes are served natively on the event
+loop, so a single process can hold hundreds of Bedrock calls open without
+an OS thread per call; everything else is the unchanged Flask app.
+
+  uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+Native routes (same request/response shapes as the Flask ones):
+  POST /mealplans/generate   like Flask: queues a job, 202 { ok, job_id };
+                             with ?wait=1 (or ASYNC_MEALPLANS=0) generates
+                             inline on the event loop and returns
+                             { ok, prefs_used, mealplan, version }
+  POST /chat                 JSON reply, or SSE with ?stream=1
+  POST /chat/stream          SSE
+  GET  /mealplans/jobs/<id>/events
+                             SSE for a job queued by POST /mealplans/generate:
+                             `progress` on every change, then one `done` /
+                             `failed` (or `timeout`)
+  GET  /llm/stats            async_llm in-flight counts (bearer token required)
+
+Limits come from backend_common.async_llm (LLM_MAX_INFLIGHT_PER_MODEL,
+LLM_MAX_INFLIGHT_PER_USER); a user over their cap gets 429 + Retry-After.
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import traceback
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs
+
+from asgiref.wsgi import WsgiToAsgi
+
+from app import (app as flask_app, CORS_ORIGINS, CHAT_FALLBACK_REPLY, _chat_prompts, _chat_reply_text,
+                 _parse_chat_body, _sse, _strands_chat_enabled)
+from backend_common import async_llm, intake, jobs, mealplans
+from backend_common.envdb import db
+from backend_common.jwt_tools import claims_from_bearer
+from backend_common.recipes import NoRecipesError
+from routes_prefs_meals import (PREFS_PROJECTION, _async_generation_enabled, _oid, _prefs_used,
+                                generate_plan_async)
+
+_wsgi = WsgiToAsgi(flask_app)
+
+# -------------------- request / response helpers --------------------
+
+class _Request:
+    def __init__(self, scope, receive):
+        self.scope = scope
+        self.receive = receive
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", [])}
+        self.query = {k: v[-1] for k, v in parse_qs(scope.get("query_string", b"").decode("latin-1")).items()}
+
+    async def body(self) -> bytes:
+        chunks = []
+        while True:
+            msg = await self.receive()
+            if msg["type"] == "http.disconnect":
+                break
+            chunks.append(msg.get("body", b""))
+            if not msg.get("more_body"):
+                break
+        return b"".join(chunks)
+
+    async def json(self) -> Any:
+        try:
+            return json.loads(await self.body() or b"null")
+        except Exception:
+            return None
+
+    def claims(self) -> Dict[str, Any]:
+        return claims_from_bearer(self.headers.get("authorization", ""))
+
+def _headers(req: _Request, content_type: str, extra: Optional[Dict[str, str]] = None) -> List[Tuple[bytes, bytes]]:
+    out = {"content-type": content_type, **(extra or {})}
+    origin = req.headers.get("origin")
+    if origin in CORS_ORIGINS:  # same policy flask-cors applies to the WSGI routes
+        out["access-control-allow-origin"] = origin
+        out["vary"] = "Origin"
+    return [(k.encode("latin-1"), v.encode("latin-1")) for k, v in out.items()]
+
+async def _json(send, req: _Request, payload: Dict[str, Any], status: int = 200,
+                extra: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload, default=str).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": _headers(req, "application/json", extra)})
+    await send({"type": "http.response.body", "body": body})
+
+async def _busy(send, req: _Request):
+    await _json(send, req, {"ok": False, "msg": "server busy, please retry"}, 429, {"retry-after": "1"})
+
+async def _authed(send, req: _Request) -> Optional[Dict[str, Any]]:
+    if not req.headers.get("authorization", "").lower().startswith("bearer "):
+        await _json(send, req, {"ok": False, "msg": "missing bearer token"}, 401)
+        return None
+    try:
+        return req.claims()
+    except Exception:
+        await _json(send, req, {"ok": False, "msg": "invalid or expired token"}, 401)
+        return None
+
+# -------------------- native routes --------------------
+
+async def generate_mealplan(req: _Request, send):
+    if _async_generation_enabled(req.query.get("wait")):
+        # queueing is one Mongo insert: the Flask route does it, and the job
+        # runs on jobs' executor in this process, streamed by job_events
+        return await _wsgi(req.scope, req.receive, send)
+    claims = await _authed(send, req)
+    if claims is None:
+        return
+    try:
+        user_id = _oid(claims.get("sub", ""))
+        prefs = await asyncio.to_thread(db.user_prefs.find_one, {"user_id": user_id}, PREFS_PROJECTION) or {}
+        prefs = intake.with_targets(prefs)
+        mealplan, source = await generate_plan_async(prefs, user_key=str(user_id))
+        version = await asyncio.to_thread(mealplans.save_plan, user_id, mealplan, source)
+        await _json(send, req, {"ok": True, "prefs_used": _prefs_used(prefs),
+                                "mealplan": mealplan, "version": version})
+    except async_llm.UserBusy:
+        await _busy(send, req)
+    except NoRecipesError as e:
+        await _json(send, req, {"ok": False, "msg": f"cannot build a mealplan: {e}"}, 422)
+    except Exception as e:
+        traceback.print_exc()
+        await _json(send, req, {"ok": False, "msg": f"generate failed: {e}"}, 500)
+
+async def _chat_json(req: _Request, send, messages: list, mealplan: dict, user_key: str):
+    if _strands_chat_enabled():
+        model_id, system, user = _chat_prompts(messages, mealplan)
+        try:
+            reply = _chat_reply_text(await async_llm.invoke(model_id, system, user, user_key))
+            if reply:
+                return await _json(send, req, {"ok": True, "reply": reply, "debug": {"source": "strands"}})
+        except async_llm.UserBusy:
+            return await _busy(send, req)
+        except Exception as e:
+            print("Strands chat failed:", e)
+    await _json(send, req, {"ok": True, "reply": CHAT_FALLBACK_REPLY, "debug": {"source": "fallback"}})
+
+async def _chat_sse(req: _Request, send, messages: list, mealplan: dict, user_key: str):
+    """Same event sequence as app._chat_stream_response; stops pulling from the model on disconnect."""
+    async def emit(event: str, payload: dict, more: bool = True):
+        await send({"type": "http.response.body", "body": _sse(event, payload).encode("utf-8"), "more_body": more})
+
+    started = False
+
+    async def start():
+        nonlocal started
+        if not started:
+            started = True
+            await send({"type": "http.response.start", "status": 200, "headers": _headers(
+                req, "text/event-stream", {"cache-control": "no-cache", "x-accel-buffering": "no"})})
+
+    async def pump():
+        parts: List[str] = []
+        if _strands_chat_enabled():
+            model_id, system, user = _chat_prompts(messages, mealplan)
+            try:
+                async for text in async_llm.stream(model_id, system, user, user_key):
+                    await start()
+                    parts.append(text)
+                    await emit("chunk", {"text": text})
+            except async_llm.UserBusy:
+                if not started:
+                    return await _busy(send, req)
+            except Exception as e:
+                print("Strands chat stream failed:", e)
+                if parts:
+                    return await emit("done", {"reply": "".join(parts), "source": "strands", "truncated": True}, False)
+        await start()
+        reply = "".join(parts).strip()
+        if reply:
+            return await emit("done", {"reply": reply, "source": "strands"}, False)
+        await emit("chunk", {"text": CHAT_FALLBACK_REPLY})
+        await emit("done", {"reply": CHAT_FALLBACK_REPLY, "source": "fallback"}, False)
+
+    async def disconnected():
+        while (await req.receive())["type"] != "http.disconnect":
+            pass
+
+    work = asyncio.ensure_future(pump())
+    watch = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({work, watch}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in (work, watch):
+            t.cancel()
+    if work.done() and not work.cancelled() and work.exception():
+        # headers may already be out, so there is no error response left to send
+        traceback.print_exception(work.exception())
+
+async def chat(req: _Request, send, stream: bool = False):
+    claims = await _authed(send, req)
+    if claims is None:
+        return
+    try:
+        messages, mealplan = _parse_chat_body(await req.json())
+        user_key = str(claims.get("sub", ""))
+        if stream or req.query.get("stream") in ("1", "true", "True"):
+            return await _chat_sse(req, send, messages, mealplan, user_key)
+        await _chat_json(req, send, messages, mealplan, user_key)
+    except Exception as e:
+        traceback.print_exc()
+        await _json(send, req, {"ok": False, "msg": f"chat error: {str(e)}"}, 500)
+
+async def chat_stream(req: _Request, send):
+    await chat(req, send, stream=True)
+
+async def llm_stats(req: _Request, send):
+    if await _authed(send, req) is None:  # per-model load is operational detail, not public
+        return
+    await _json(send, req, {"ok": True, "llm": async_llm.stats()})
+
+JOB_SSE_POLL_SECONDS = float(os.getenv("JOB_SSE_POLL_SECONDS", "1.0"))
+JOB_SSE_TIMEOUT_SECONDS = float(os.getenv("JOB_SSE_TIMEOUT_SECONDS", "300"))
+
+async def job_events(req: _Request, send, job_id: str):
+    """
+    Server-Sent Events for a job from POST /mealplans/generate (served by
+    this app or by the Flask one: state lives in the jobs collection).
+    Bearer header only (read the stream with fetch, not EventSource, so the
+    token stays out of URLs and access logs); the job store is polled with
+    awaited sleeps, so a waiting client costs no thread. A job whose worker
+    died ends as `failed` once its lease goes stale (see jobs.get_job).
+    """
+    claims = await _authed(send, req)
+    if claims is None:
+        return
+    user_id = _oid(claims.get("sub", ""))
+    if not await asyncio.to_thread(jobs.get_job, job_id, user_id):
+        return await _json(send, req, {"ok": False, "msg": "job not found"}, 404)
+
+    async def emit(event: str, payload: dict, more: bool = True):
+        await send({"type": "http.response.body", "body": _sse(event, payload).encode("utf-8"), "more_body": more})
+
+    async def pump():
+        await send({"type": "http.response.start", "status": 200, "headers": _headers(
+            req, "text/event-stream", {"cache-control": "no-cache", "x-accel-buffering": "no"})})
+        deadline = time.monotonic() + JOB_SSE_TIMEOUT_SECONDS
+        last = None
+        while time.monotonic() < deadline:
+            doc = await asyncio.to_thread(jobs.get_job, job_id, user_id)
+            if not doc:
+                return await emit("failed", {"error": "job disappeared"}, False)
+            job = json.loads(json.dumps(jobs.public_job(doc), default=str))
+            if job["status"] in jobs.TERMINAL:
+                return await emit(job["status"], job, False)
+            snapshot = (job["status"], json.dumps(job["progress"], sort_keys=True))
+            if snapshot != last:
+                last = snapshot
+                await emit("progress", {"status": job["status"], "progress": job["progress"]})
+            else:
+                await send({"type": "http.response.body", "body": b": keep-alive\n\n", "more_body": True})
+            await asyncio.sleep(JOB_SSE_POLL_SECONDS)
+        await emit("timeout", {"id": job_id}, False)
+
+    async def disconnected():
+        while (await req.receive())["type"] != "http.disconnect":
+            pass
+
+    work = asyncio.ensure_future(pump())
+    watch = asyncio.ensure_future(disconnected())
+    try:
+        await asyncio.wait({work, watch}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        for t in (work, watch):
+            t.cancel()
+    if work.done() and not work.cancelled() and work.exception():
+        traceback.print_exception(work.exception())
+
+ROUTES = {
+    ("POST", "/mealplans/generate"): generate_mealplan,
+    ("POST", "/chat"): chat,
+    ("POST", "/chat/stream"): chat_stream,
+    ("GET", "/llm/stats"): llm_stats,
+}
+# routes with a path parameter: (method, pattern, handler(req, send, *groups))
+PATTERN_ROUTES = [
+    ("GET", re.compile(r"^/mealplans/jobs/([0-9a-fA-F]{24})/events$"), job_events),
+]
+
+def _route(method: str, path: str):
+    handler = ROUTES.get((method, path))
+    if handler is not None:
+        return handler
+    for m, pattern, fn in PATTERN_ROUTES:
+        match = pattern.match(path) if m == method else None
+        if match:
+            return lambda req, send: fn(req, send, *match.groups())
+    return None
+
+# -------------------- ASGI app --------------------
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            msg = await receive()
+            if msg["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif msg["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    handler = _route(scope.get("method"), scope.get("path", "")) if scope["type"] == "http" else None
+    if handler is None:
+        return await _wsgi(scope, receive, send)  # OPTIONS preflight and every other route
+    await handler(_Request(scope, receive), send)
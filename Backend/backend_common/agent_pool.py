@@ -0,0 +1,267 @@
+# backend_common/agent_pool.py
+import asyncio, os, queue, threading
+from contextlib import contextmanager
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+
+# Process-wide pool of Strands agents and boto3 bedrock-runtime clients.
+#
+# - boto3 sessions and clients are created once per region; every
+#   BedrockModel (single agents and swarm_planner's) is built on the shared
+#   session and handed the shared bedrock-runtime client, which is
+#   thread-safe.
+# - Agents keep conversation state and are NOT safe to share between
+#   concurrent calls, so they are leased: one caller at a time, history
+#   cleared on return, at most AGENT_POOL_MAX_IDLE idle agents per key.
+# - Which Agent constructor / invocation signature works with the installed
+#   strands version is probed once and memoized instead of per request.
+#   Only signature mismatches (TypeError, ImportError) move the probe on;
+#   any other error (credentials, throttling) is raised and nothing is
+#   memoized, so a transient failure cannot pin a worse constructor.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+MAX_IDLE_PER_KEY = max(0, _env_int("AGENT_POOL_MAX_IDLE", 8))
+
+PoolKey = Tuple[str, str, str]  # (model_id, region, system_prompt)
+
+_lock = threading.Lock()
+_sessions: Dict[str, Any] = {}
+_clients: Dict[str, Any] = {}
+_idle: Dict[PoolKey, List[Any]] = {}
+_ctor_choice: Dict[str, int] = {}      # "with_prompt"/"no_prompt" -> candidate index
+_invoke_choice: Dict[type, int] = {}   # agent class -> invocation index
+_stats = {"agents_created": 0, "agents_reused": 0, "agents_discarded": 0, "clients_created": 0}
+
+def default_region() -> str:
+    return os.getenv("AWS_REGION", "us-east-1")
+
+def boto_session(region: Optional[str] = None):
+    """Shared boto3 session; credentials are resolved once per region."""
+    region = region or default_region()
+    with _lock:
+        session = _sessions.get(region)
+        if session is not None:
+            return session
+    import boto3
+    session = boto3.Session(region_name=region)
+    with _lock:
+        return _sessions.setdefault(region, session)
+
+def bedrock_client(region: Optional[str] = None):
+    """Shared bedrock-runtime client (thread-safe) on the shared session."""
+    region = region or default_region()
+    with _lock:
+        client = _clients.get(region)
+        if client is not None:
+            return client
+    client = boto_session(region).client("bedrock-runtime", region_name=region)
+    with _lock:
+        # another thread may have won the race; keep the first one
+        client = _clients.setdefault(region, client)
+        _stats["clients_created"] = len(_clients)
+    return client
+
+# ---------- constructor probing ----------
+
+def bedrock_model(model_id: str, region: Optional[str] = None):
+    """A strands BedrockModel on the pooled session and bedrock-runtime client."""
+    from strands.models import BedrockModel
+    region = region or default_region()
+    try:
+        model = BedrockModel(model_id=model_id, boto_session=boto_session(region))
+    except TypeError:  # strands without boto_session
+        model = BedrockModel(model_id=model_id, region_name=region)
+    if hasattr(model, "client"):
+        model.client = bedrock_client(region)
+    return model
+
+def _ctor_candidates(model_id: str, region: str, system_prompt: str) -> List[Callable[[], Any]]:
+    from strands.agent import Agent
+    sp = {"system_prompt": system_prompt} if system_prompt else {}
+    # every form passes the model: an Agent on strands' default model would
+    # silently answer with the wrong one
+    return [
+        lambda: Agent(model=bedrock_model(model_id, region), **sp),
+        lambda: Agent(model=model_id, provider="bedrock", client=bedrock_client(region), **sp),
+        lambda: Agent(model=model_id, provider="bedrock", **sp),
+        lambda: Agent(model_id=model_id, provider="bedrock", **sp),
+        lambda: Agent(model=model_id, **sp),
+        lambda: Agent(model_id=model_id, **sp),
+    ]
+
+def _build_agent(model_id: str, region: str, system_prompt: str):
+    candidates = _ctor_candidates(model_id, region, system_prompt)
+    memo = "with_prompt" if system_prompt else "no_prompt"
+    known = _ctor_choice.get(memo)
+    if known is not None:
+        agent = candidates[known]()
+    else:
+        agent, last_err = None, None
+        for i, make in enumerate(candidates):
+            try:
+                agent = make()
+            except (TypeError, ImportError) as e:  # this strands version takes another signature
+                last_err = e
+                continue
+            _ctor_choice[memo] = i
+            print(f"Strands Agent constructor #{i} selected ({memo})")
+            break
+        if agent is None:
+            raise RuntimeError(f"could not construct a Strands Agent: {last_err}")
+
+    if hasattr(agent, "client") and hasattr(agent.client, "meta"):
+        try:
+            agent.client.meta.region_name = region
+        except Exception:
+            pass
+    with _lock:
+        _stats["agents_created"] += 1
+    return agent
+
+def _reset_agent(agent):
+    msgs = getattr(agent, "messages", None)
+    if isinstance(msgs, list):
+        msgs.clear()
+
+@contextmanager
+def lease(model_id: str, system_prompt: str = "", region: Optional[str] = None):
+    """Borrow an agent for a single call; it goes back to the pool afterwards."""
+    key: PoolKey = (model_id, region or default_region(), system_prompt or "")
+    agent = None
+    with _lock:
+        idle = _idle.get(key)
+        if idle:
+            agent = idle.pop()
+            _stats["agents_reused"] += 1
+    if agent is None:
+        agent = _build_agent(*key)
+
+    try:
+        yield agent
+    except Exception:
+        # don't recycle an agent whose state we can no longer trust
+        with _lock:
+            _stats["agents_discarded"] += 1
+        raise
+    else:
+        _reset_agent(agent)
+        with _lock:
+            idle = _idle.setdefault(key, [])
+            if len(idle) < MAX_IDLE_PER_KEY:
+                idle.append(agent)
+
+# ---------- invocation probing ----------
+
+# (needs agent.run, call)
+_INVOKERS: List[Tuple[bool, Callable[[Any, str, str, str], Any]]] = [
+    (False, lambda a, sp, up, m: a(up, system_prompt=sp)),
+    (True,  lambda a, sp, up, m: a.run(up, system_prompt=sp)),
+    (False, lambda a, sp, up, m: a(up, system_prompt=sp, model=m)),
+    (True,  lambda a, sp, up, m: a.run(up, system_prompt=sp, model=m)),
+]
+
+def agent_invoke(agent, system_prompt: str, user_prompt: str, model_id: str):
+    """
+    Call the agent using whichever interface the installed version supports.
+    The first working form is remembered per agent class.
+    """
+    known = _invoke_choice.get(type(agent))
+    if known is not None:
+        return _INVOKERS[known][1](agent, system_prompt, user_prompt, model_id)
+
+    for i, (needs_run, call) in enumerate(_INVOKERS):
+        if needs_run and not hasattr(agent, "run"):
+            continue
+        try:
+            out = call(agent, system_prompt, user_prompt, model_id)
+        except TypeError:
+            continue
+        _invoke_choice[type(agent)] = i
+        return out
+    raise RuntimeError("Strands Agent invocation method not supported by this version")
+
+def invoke(model_id: str, system_prompt: str, user_prompt: str, region: Optional[str] = None):
+    """Lease a pooled agent, run one prompt, return the raw result."""
+    with lease(model_id, system_prompt, region) as agent:
+        return agent_invoke(agent, system_prompt, user_prompt, model_id)
+
+async def invoke_async(model_id: str, system_prompt: str, user_prompt: str, region: Optional[str] = None):
+    """
+    Async twin of invoke(). Awaits Agent.invoke_async, so no thread is held
+    while the model works; agents without it run on the default executor.
+    """
+    with lease(model_id, system_prompt, region) as agent:
+        if hasattr(agent, "invoke_async"):
+            return await agent.invoke_async(user_prompt)
+        return await asyncio.to_thread(agent_invoke, agent, system_prompt, user_prompt, model_id)
+
+def _event_text(event) -> Optional[str]:
+    text = event.get("data") if isinstance(event, dict) else None
+    return text if isinstance(text, str) and text else None
+
+async def stream_async(model_id: str, system_prompt: str, user_prompt: str,
+                       region: Optional[str] = None) -> AsyncIterator[str]:
+    """Async twin of stream(): text chunks straight from Agent.stream_async."""
+    with lease(model_id, system_prompt, region) as agent:
+        if not hasattr(agent, "stream_async"):
+            yield str(await asyncio.to_thread(agent_invoke, agent, system_prompt, user_prompt, model_id))
+            return
+        async for event in agent.stream_async(user_prompt):
+            text = _event_text(event)
+            if text:
+                yield text
+
+_STREAM_DONE = object()
+
+def stream(model_id: str, system_prompt: str, user_prompt: str, region: Optional[str] = None) -> Iterator[str]:
+    """
+    Yield text chunks as the model produces them.
+    Uses Agent.stream_async on a helper thread (Flask views are sync); agents
+    without it fall back to one chunk holding the whole reply.
+    """
+    with lease(model_id, system_prompt, region) as agent:
+        if not hasattr(agent, "stream_async"):
+            yield str(agent_invoke(agent, system_prompt, user_prompt, model_id))
+            return
+
+        chunks: "queue.Queue[Any]" = queue.Queue()
+        stop = threading.Event()
+
+        def pump():
+            async def run():
+                async for event in agent.stream_async(user_prompt):
+                    if stop.is_set():
+                        break
+                    text = _event_text(event)
+                    if text:
+                        chunks.put(text)
+            try:
+                asyncio.run(run())
+            except Exception as e:
+                chunks.put(e)
+            finally:
+                chunks.put(_STREAM_DONE)
+
+        threading.Thread(target=pump, name="agent-stream", daemon=True).start()
+        try:
+            while True:
+                item = chunks.get()
+                if item is _STREAM_DONE:
+                    break
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()  # client went away: stop pulling from the model
+
+def pool_stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_stats)
+        out["idle_agents"] = sum(len(v) for v in _idle.values())
+        out["keys"] = len(_idle)
+    out["ctor_choice"] = dict(_ctor_choice)
+    return out
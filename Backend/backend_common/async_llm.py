@@ -0,0 +1,107 @@
+# backend_common/async_llm.py
+import asyncio, os, time
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Dict, Optional
+
+from backend_common import agent_pool
+
+# Concurrency limits for LLM calls made from the event loop (asgi.py).
+#
+# - Per model: at most LLM_MAX_INFLIGHT_PER_MODEL calls are in flight; the
+#   rest wait on an asyncio.Semaphore (a parked coroutine, not a thread).
+# - Per user: at most LLM_MAX_INFLIGHT_PER_USER calls at once; one more is
+#   refused with UserBusy (429) rather than queued behind the others.
+#
+# All state is touched only from the event loop thread, so no locks.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+MAX_INFLIGHT_PER_MODEL = max(1, _env_int("LLM_MAX_INFLIGHT_PER_MODEL", 256))
+MAX_INFLIGHT_PER_USER = max(0, _env_int("LLM_MAX_INFLIGHT_PER_USER", 2))  # 0 = no cap
+LLM_TIMEOUT_SECONDS = max(1, _env_int("LLM_TIMEOUT_SECONDS", 120))
+
+class UserBusy(Exception):
+    """The user already has MAX_INFLIGHT_PER_USER calls in flight."""
+
+_model_slots: Dict[str, asyncio.Semaphore] = {}
+_user_inflight: Dict[str, int] = {}
+_stats = {"calls": 0, "rejected_user_busy": 0, "timeouts": 0, "inflight": 0, "waiting": 0,
+          "max_inflight": 0, "wait_seconds_total": 0.0}
+
+@asynccontextmanager
+async def user_slot(user_key: Optional[str]):
+    """One of the user's MAX_INFLIGHT_PER_USER slots, or UserBusy. No-op without a key."""
+    if not user_key or not MAX_INFLIGHT_PER_USER:
+        yield
+        return
+    if _user_inflight.get(user_key, 0) >= MAX_INFLIGHT_PER_USER:
+        _stats["rejected_user_busy"] += 1
+        raise UserBusy(user_key)
+    _user_inflight[user_key] = _user_inflight.get(user_key, 0) + 1
+    try:
+        yield
+    finally:
+        left = _user_inflight.get(user_key, 1) - 1
+        if left > 0:
+            _user_inflight[user_key] = left
+        else:
+            _user_inflight.pop(user_key, None)
+
+@asynccontextmanager
+async def model_slot(model_id: str):
+    """One of the model's MAX_INFLIGHT_PER_MODEL slots, waiting for it if needed."""
+    sem = _model_slots.get(model_id)
+    if sem is None:
+        sem = _model_slots[model_id] = asyncio.Semaphore(MAX_INFLIGHT_PER_MODEL)
+    queued = time.monotonic()
+    _stats["waiting"] += 1
+    try:
+        await sem.acquire()
+    finally:
+        _stats["waiting"] -= 1
+    _stats["wait_seconds_total"] += time.monotonic() - queued
+    _stats["calls"] += 1
+    _stats["inflight"] += 1
+    _stats["max_inflight"] = max(_stats["max_inflight"], _stats["inflight"])
+    try:
+        yield
+    finally:
+        _stats["inflight"] -= 1
+        sem.release()
+
+@asynccontextmanager
+async def slot(model_id: str, user_key: Optional[str] = None):
+    """user_slot then model_slot: a busy user is refused before queueing for the model."""
+    async with user_slot(user_key):
+        async with model_slot(model_id):
+            yield
+
+async def invoke(model_id: str, system_prompt: str, user_prompt: str,
+                 user_key: Optional[str] = None, timeout: float = LLM_TIMEOUT_SECONDS):
+    """One pooled-agent call under the model and user limits; returns the raw result."""
+    async with slot(model_id, user_key):
+        try:
+            return await asyncio.wait_for(
+                agent_pool.invoke_async(model_id, system_prompt, user_prompt), timeout)
+        except asyncio.TimeoutError:
+            _stats["timeouts"] += 1
+            raise
+
+async def stream(model_id: str, system_prompt: str, user_prompt: str,
+                 user_key: Optional[str] = None) -> AsyncIterator[str]:
+    """Text chunks under the same limits; the slot is held until the stream ends."""
+    async with slot(model_id, user_key):
+        async for text in agent_pool.stream_async(model_id, system_prompt, user_prompt):
+            yield text
+
+def stats() -> Dict[str, Any]:
+    out = dict(_stats)
+    out["wait_seconds_total"] = round(out["wait_seconds_total"], 3)
+    out["users_inflight"] = len(_user_inflight)
+    out["max_inflight_per_model"] = MAX_INFLIGHT_PER_MODEL
+    out["max_inflight_per_user"] = MAX_INFLIGHT_PER_USER
+    return out
@@ -0,0 +1,235 @@
+# backend_common/chat_context.py
+import hashlib, json, os, re, threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend_common.plan_schema import MACRO_KEYS
+
+# The user prompt for one chat turn: the meal plan as a compact table, the
+# most recent conversation turns and the new message, kept under
+# CHAT_CONTEXT_TOKENS (estimated locally, no tokenizer download).
+#
+# Plan table (one row per meal, macros rounded, the day's totals row from
+# the stored day totals when present):
+#
+#   d|meal|kcal|P|C|F
+#   1|Greek yogurt parfait|420|28|52|10
+#   1=|2010|131|222|61
+#
+# If the full table does not fit its share of the budget it degrades to
+# names + kcal, then to day totals only. Serialized tables are cached per
+# content digest of the plan's days and level. The plan comes from the
+# request body, so client-supplied fields such as version are never part of
+# the key: two users with the same version number would share a table.
+# History (the last CHAT_HISTORY_TURNS messages) is added newest first
+# until the budget runs out; each earlier message is clipped to
+# CHAT_MESSAGE_CHARS.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+CONTEXT_TOKENS = max(200, _env_int("CHAT_CONTEXT_TOKENS", 1500))
+HISTORY_TURNS = max(0, _env_int("CHAT_HISTORY_TURNS", 8))
+MESSAGE_CHARS = max(50, _env_int("CHAT_MESSAGE_CHARS", 600))
+PLAN_CACHE_MAX = max(1, _env_int("CHAT_PLAN_CACHE_MAX", 512))
+PLAN_SHARE = 0.6  # of the budget, at most, for the plan table
+
+PLAN_LEVELS = ("full", "kcal", "totals")
+NO_PLAN = "No mealplan."
+TABLE_LEGEND = "Plan table: d=day, kcal, P/C/F = protein/carbs/fat in g; 'N=' rows are day totals."
+
+# ---------- token estimate ----------
+
+_PIECE = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+def estimate_tokens(text: str) -> int:
+    """
+    Rough BPE token count: one per number or symbol, one per word plus one
+    per 6 letters beyond the first 4 (long words split into pieces).
+    Within ~15% of common tokenizers on English prose and tables.
+    """
+    n = 0
+    for piece in _PIECE.findall(text or ""):
+        n += 1 + max(0, len(piece) - 4) // 6 if piece[0].isalpha() else 1
+    return n
+
+# ---------- plan table ----------
+
+def _num(v: Any) -> int:
+    try:
+        return int(round(float(v)))
+    except (TypeError, ValueError):
+        return 0
+
+def _cell(text: Any, limit: int = 48) -> str:
+    s = " ".join(str(text or "").split()).replace("|", "/")
+    return s if len(s) <= limit else s[:limit - 1] + "…"
+
+def _day_totals(d: Dict[str, Any]) -> List[int]:
+    t = d.get("totals")
+    if isinstance(t, dict):
+        return [_num(t.get(k)) for k in MACRO_KEYS]
+    meals = [m for m in d.get("meals") or [] if isinstance(m, dict)]
+    return [_num(sum(float(m.get(k) or 0) for m in meals)) for k in MACRO_KEYS]
+
+def serialize_plan(plan: Dict[str, Any], level: str = "full") -> str:
+    """The plan as a compact table at one of PLAN_LEVELS."""
+    days = [d for d in (plan or {}).get("days") or [] if isinstance(d, dict)]
+    if not days:
+        return NO_PLAN
+    rows = ["d|meal|kcal|P|C|F" if level == "full" else "d|meal|kcal" if level == "kcal" else "d|kcal|P|C|F"]
+    for i, d in enumerate(days, 1):
+        n = d.get("day", i)
+        if level != "totals":
+            for m in d.get("meals") or []:
+                if not isinstance(m, dict):
+                    continue
+                cells = [str(n), _cell(m.get("name"))]
+                cells += [str(_num(m.get(k))) for k in (MACRO_KEYS if level == "full" else MACRO_KEYS[:1])]
+                rows.append("|".join(cells))
+        totals = _day_totals(d)
+        if level == "full":
+            rows.append(f"{n}=|" + "|".join(map(str, totals)))
+        elif level == "kcal":
+            rows.append(f"{n}=||{totals[0]}")
+        else:
+            rows.append(f"{n}|" + "|".join(map(str, totals)))
+    return "\n".join(rows)
+
+# ---------- cache ----------
+
+_cache: "OrderedDict[Tuple[str, str], Tuple[str, int]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "turns": 0, "tokens_total": 0, "history_dropped": 0}
+
+def plan_key(plan: Dict[str, Any]) -> str:
+    """Digest of the plan's days: equal keys mean equal tables, whoever sent the plan."""
+    blob = json.dumps(plan.get("days"), sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.blake2b(blob.encode("utf-8"), digest_size=16).hexdigest()
+
+def plan_table(plan: Dict[str, Any], level: str = "full") -> Tuple[str, int]:
+    """(table, estimated tokens), cached per plan digest and level."""
+    if not isinstance(plan, dict) or not plan.get("days"):
+        return NO_PLAN, estimate_tokens(NO_PLAN)
+    key = (plan_key(plan), level)
+    with _lock:
+        hit = _cache.get(key)
+        if hit is not None:
+            _cache.move_to_end(key)
+            _stats["hits"] += 1
+            return hit
+        _stats["misses"] += 1
+    table = serialize_plan(plan, level)
+    out = (table, estimate_tokens(table))
+    with _lock:
+        _cache[key] = out
+        while len(_cache) > PLAN_CACHE_MAX:
+            _cache.popitem(last=False)
+    return out
+
+def fit_plan(plan: Dict[str, Any], budget: int) -> Tuple[str, str, int]:
+    """(table, level, tokens): the most detailed level that fits budget (else the smallest)."""
+    for level in PLAN_LEVELS:
+        table, tokens = plan_table(plan, level)
+        if table == NO_PLAN:
+            return table, "none", tokens
+        if tokens <= budget:
+            return table, level, tokens
+    return table, level, tokens
+
+# ---------- messages ----------
+
+def _clip(text: str) -> str:
+    text = " ".join(str(text or "").split())
+    return text if len(text) <= MESSAGE_CHARS else text[:MESSAGE_CHARS - 1] + "…"
+
+def split_messages(messages: List[Dict[str, Any]]) -> Tuple[List[Tuple[str, str]], str]:
+    """([(role letter, text), ...] earlier turns oldest first, the last user message)."""
+    turns: List[Tuple[str, str]] = []
+    for m in messages or []:
+        if not isinstance(m, dict):
+            continue
+        role = (m.get("role") or "").lower()
+        text = str(m.get("content", "")).strip()
+        if text and role in ("user", "assistant"):
+            turns.append(("U" if role == "user" else "A", text))
+    for i in range(len(turns) - 1, -1, -1):
+        if turns[i][0] == "U":
+            return turns[:i], turns[i][1]
+    return turns, ""
+
+# ---------- prompt ----------
+
+def build_user_prompt(messages: List[Dict[str, Any]], plan: Optional[Dict[str, Any]],
+                      budget: Optional[int] = None) -> Tuple[str, Dict[str, Any]]:
+    """(user prompt, info) for one chat turn, estimated at or under budget tokens where possible."""
+    budget = budget or CONTEXT_TOKENS
+    history, last_user = split_messages(messages)
+    ask = f"User says:\n{last_user or '(no message)'}\n\nRespond now."  # the question itself is never clipped
+    left = budget - estimate_tokens(ask) - estimate_tokens(TABLE_LEGEND)
+
+    table, level, plan_tokens = fit_plan(plan or {}, max(0, int(left * PLAN_SHARE)))
+    left -= plan_tokens
+
+    kept: List[str] = []
+    recent = history[-HISTORY_TURNS:] if HISTORY_TURNS else []
+    for role, text in reversed(recent):
+        line = f"{role}: {_clip(text)}"
+        cost = estimate_tokens(line)
+        if cost > left:
+            break
+        kept.append(line)
+        left -= cost
+    kept.reverse()
+
+    parts = [TABLE_LEGEND + "\n" + table if table != NO_PLAN else NO_PLAN]
+    if kept:
+        parts.append("Conversation so far (U=user, A=assistant):\n" + "\n".join(kept))
+    parts.append(ask)
+    prompt = "\n\n".join(parts)
+    tokens = estimate_tokens(prompt)
+    with _lock:
+        _stats["turns"] += 1
+        _stats["tokens_total"] += tokens
+        _stats["history_dropped"] += len(history) - len(kept)
+    return prompt, {"tokens": tokens, "plan_level": level, "history_kept": len(kept),
+                    "history_dropped": len(history) - len(kept)}
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_stats)
+        out["cached_tables"] = len(_cache)
+    out["tokens_avg"] = round(out["tokens_total"] / (out["turns"] or 1), 1)
+    return out
+
+# ---------- benchmark ----------
+
+def _bench(runs: int = 2000):
+    import time
+    from backend_common import meal_engine
+    plan = meal_engine.plan_week({"calorie_target": 2200, "meals_per_day": 4})
+    messages = []
+    for i in range(12):
+        messages.append({"role": "user", "content": f"Can you swap the lunch on day {i % 7 + 1} for something "
+                                                     f"with more protein and less than 600 kcal?"})
+        messages.append({"role": "assistant", "content": "Sure - try grilled chicken with quinoa and "
+                                                          "roasted vegetables (about 540 kcal, 45 g protein). " * 3})
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        prompt, info = build_user_prompt(messages, plan)
+    ms = (time.perf_counter() - t0) * 1e3 / runs
+    t0 = time.perf_counter()
+    for _ in range(runs // 10):
+        serialize_plan(plan)
+    cold = (time.perf_counter() - t0) * 1e3 / (runs // 10)
+    raw = json.dumps(plan["days"])
+    print(f"prompt ~{info['tokens']} tokens (budget {CONTEXT_TOKENS}, plan level {info['plan_level']}, "
+          f"history kept {info['history_kept']}/{info['history_kept'] + info['history_dropped']}); "
+          f"plan as JSON ~{estimate_tokens(raw)} tokens, as table ~{plan_table(plan)[1]}")
+    print(f"build {ms:.3f} ms per turn (cached table), table serialization {cold:.3f} ms uncached; {stats()}")
+
+if __name__ == "__main__":
+    _bench()
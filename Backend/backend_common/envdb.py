@@ -1,5 +1,6 @@
 # backend_common/envdb.py
-import os
+import os, threading, time
+from typing import Any, Dict, Optional
 from dotenv import load_dotenv
 from pymongo import MongoClient, ASCENDING
 
@@ -8,13 +9,76 @@ load_dotenv()  # loads .env once when imported
 MONGODB_URI = os.getenv("MONGODB_URI")
 DB_NAME = os.getenv("DB_NAME", "appdb")
 
-if not MONGODB_URI:
-    raise RuntimeError("MONGODB_URI not set in .env")
+def _env_int(name: str, default: Optional[int]) -> Optional[int]:
+    try:
+        v = os.getenv(name)
+        return int(v) if v not in (None, "") else default
+    except Exception:
+        return default
 
-_client = MongoClient(MONGODB_URI, serverSelectionTimeoutMS=8000)
-_client.admin.command("ping")  # fail fast if bad URI
+# Connection pool sizing (per worker process).
+MONGO_MAX_POOL_SIZE = _env_int("MONGO_MAX_POOL_SIZE", 100)
+MONGO_MIN_POOL_SIZE = _env_int("MONGO_MIN_POOL_SIZE", 0)
+MONGO_MAX_IDLE_TIME_MS = _env_int("MONGO_MAX_IDLE_TIME_MS", None)
+MONGO_SERVER_SELECTION_MS = _env_int("MONGO_SERVER_SELECTION_MS", 8000)
 
-db = _client[DB_NAME]
+# The client is created on first use, not at import, and without a blocking
+# ping: a worker can boot (and serve /health) while Atlas is slow or down.
+_client: Optional[MongoClient] = None
+_client_lock = threading.Lock()
+_stats: Dict[str, Any] = {"client_created": False, "client_init_ms": None, "first_ping_ms": None}
+
+def get_client() -> MongoClient:
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                if not MONGODB_URI:
+                    raise RuntimeError("MONGODB_URI not set in .env")
+                t0 = time.perf_counter()
+                kwargs: Dict[str, Any] = {
+                    "serverSelectionTimeoutMS": MONGO_SERVER_SELECTION_MS,
+                    "maxPoolSize": MONGO_MAX_POOL_SIZE,
+                    "minPoolSize": MONGO_MIN_POOL_SIZE,
+                    "connect": False,
+                }
+                if MONGO_MAX_IDLE_TIME_MS is not None:
+                    kwargs["maxIdleTimeMS"] = MONGO_MAX_IDLE_TIME_MS
+                _client = MongoClient(MONGODB_URI, **kwargs)
+                _stats["client_created"] = True
+                _stats["client_init_ms"] = round((time.perf_counter() - t0) * 1000, 2)
+    return _client
+
+class _LazyDatabase:
+    """Stands in for the pymongo Database: `db.users`, `db["x"]`, `db.client` all work."""
+    def _database(self):
+        return get_client()[DB_NAME]
+
+    def __getattr__(self, name):
+        return getattr(self._database(), name)
+
+    def __getitem__(self, name):
+        return self._database()[name]
+
+db = _LazyDatabase()
+
+def ping() -> float:
+    """Round-trip a ping; returns milliseconds and records the first one."""
+    t0 = time.perf_counter()
+    get_client().admin.command("ping")
+    ms = round((time.perf_counter() - t0) * 1000, 2)
+    if _stats["first_ping_ms"] is None:
+        _stats["first_ping_ms"] = ms
+    return ms
+
+def connection_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "db_name": DB_NAME,
+        "maxPoolSize": MONGO_MAX_POOL_SIZE,
+        "minPoolSize": MONGO_MIN_POOL_SIZE,
+        "maxIdleTimeMS": MONGO_MAX_IDLE_TIME_MS,
+    }
 
 def ensure_user_indexes():
     db.users.create_index([("email", ASCENDING)], unique=True, name="uniq_email")
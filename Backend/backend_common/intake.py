@@ -0,0 +1,255 @@
+# backend_common/intake.py
+from typing import Any, Dict, List, Optional, Sequence
+
+from backend_common.meal_engine import DIET_SPLITS
+
+try:  # optional: vectorized targets for bulk onboarding
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+try:  # the form model used by Write_Meal_Plan_Agent's /plan
+    from pydantic import BaseModel
+except ImportError:  # pragma: no cover - dict profiles still work
+    BaseModel = None
+
+# Daily calorie and macro targets from a body profile, computed locally
+# instead of asking an LLM:
+#
+#   BMR   Mifflin-St Jeor: 10*kg + 6.25*cm - 5*age + (5 male | -161 female)
+#         (sex not given: the midpoint, -78)
+#   TDEE  BMR * activity multiplier
+#   kcal  TDEE + goal offset, never below MIN_CALORIES
+#   macros protein by g/kg body weight for the goal, fat by the diet's
+#         share of calories (meal_engine.DIET_SPLITS), carbs the rest
+#
+# compute_targets() does one profile; compute_targets_batch() does many
+# with numpy column maths (same numbers, e.g. for bulk onboarding).
+
+ACTIVITY_MULTIPLIERS = {
+    "sedentary": 1.2,
+    "light": 1.375,
+    "moderate": 1.55,
+    "active": 1.725,
+    "very_active": 1.9,
+}
+_ACTIVITY_ALIASES = {"very-active": "very_active", "very active": "very_active", "lightly_active": "light",
+                     "lightly active": "light", "moderately_active": "moderate", "extra_active": "very_active"}
+
+GOAL_OFFSETS = {"lose": -500.0, "maintain": 0.0, "gain": 300.0}  # kcal/day
+PROTEIN_G_PER_KG = {"lose": 2.0, "maintain": 1.6, "gain": 1.8}
+SEX_OFFSETS = {"male": 5.0, "female": -161.0, None: -78.0}
+MIN_CALORIES = {"male": 1500.0, "female": 1200.0, None: 1200.0}
+
+# accepted ranges (inclusive)
+LIMITS = {"age": (13, 100), "height_cm": (100, 250), "weight_kg": (30, 300)}
+
+PROFILE_FIELDS = ("age", "sex", "height_cm", "weight_kg", "activity_level", "goal")
+TARGET_FIELDS = ("calorie_target", "protein_g_target", "carb_g_target", "fat_g_target")
+
+class IntakeError(ValueError):
+    """The profile is incomplete or out of range."""
+
+def _activity(v: Any) -> str:
+    a = str(v or "moderate").strip().lower()
+    a = _ACTIVITY_ALIASES.get(a, a)
+    if a not in ACTIVITY_MULTIPLIERS:
+        raise IntakeError(f"activity_level must be one of {', '.join(ACTIVITY_MULTIPLIERS)}")
+    return a
+
+def _goal(v: Any) -> str:
+    g = str(v or "maintain").strip().lower()
+    g = {"lose weight": "lose", "weight loss": "lose", "gain weight": "gain", "muscle gain": "gain"}.get(g, g)
+    if g not in GOAL_OFFSETS:
+        raise IntakeError(f"goal must be one of {', '.join(GOAL_OFFSETS)}")
+    return g
+
+def _sex(v: Any) -> Optional[str]:
+    if v in (None, ""):
+        return None
+    s = str(v).strip().lower()
+    s = {"m": "male", "f": "female", "man": "male", "woman": "female"}.get(s, s)
+    if s not in ("male", "female"):
+        raise IntakeError("sex must be male, female or omitted")
+    return s
+
+def validate_profile(data: Any) -> Dict[str, Any]:
+    """Coerced profile {age, sex, height_cm, weight_kg, activity_level, goal, caloric_goal}; raises IntakeError."""
+    if BaseModel is not None and isinstance(data, BaseModel):
+        data = _as_dict(data)
+    if not isinstance(data, dict):
+        raise IntakeError("profile must be an object")
+    out: Dict[str, Any] = {}
+    for key, (lo, hi) in LIMITS.items():
+        try:
+            v = float(data.get(key))
+        except (TypeError, ValueError):
+            raise IntakeError(f"{key} is required and must be a number")
+        if not lo <= v <= hi:
+            raise IntakeError(f"{key} must be between {lo} and {hi}")
+        out[key] = v
+    out["age"] = int(out["age"])
+    out["sex"] = _sex(data.get("sex"))
+    out["activity_level"] = _activity(data.get("activity_level"))
+    out["goal"] = _goal(data.get("goal"))
+    goal_kcal = data.get("caloric_goal") or data.get("calorie_target")
+    try:
+        out["caloric_goal"] = float(goal_kcal) if goal_kcal not in (None, "") else None
+    except (TypeError, ValueError):
+        raise IntakeError("caloric_goal must be a number")
+    out["diet"] = str(data.get("diet") or "balanced").strip().lower()
+    return out
+
+def has_profile(prefs: Dict[str, Any]) -> bool:
+    return all(prefs.get(k) not in (None, "") for k in ("age", "height_cm", "weight_kg"))
+
+def _macros(kcal: float, weight_kg: float, goal: str, diet: str):
+    fat_share = DIET_SPLITS.get(diet, DIET_SPLITS["balanced"])[2]
+    protein = PROTEIN_G_PER_KG[goal] * weight_kg
+    fat = kcal * fat_share / 9.0
+    carbs = max(0.0, (kcal - protein * 4.0 - fat * 9.0) / 4.0)
+    return protein, carbs, fat
+
+def compute_targets(profile: Any) -> Dict[str, Any]:
+    """
+    {calorie_target, protein_g_target, carb_g_target, fat_g_target, bmr, tdee}
+    for one profile (dict or PreferenceForm). An explicit caloric_goal wins
+    over the computed one; macros follow whichever is used.
+    """
+    p = validate_profile(profile)
+    bmr = 10.0 * p["weight_kg"] + 6.25 * p["height_cm"] - 5.0 * p["age"] + SEX_OFFSETS[p["sex"]]
+    tdee = bmr * ACTIVITY_MULTIPLIERS[p["activity_level"]]
+    kcal = p["caloric_goal"] or max(MIN_CALORIES[p["sex"]], tdee + GOAL_OFFSETS[p["goal"]])
+    protein, carbs, fat = _macros(kcal, p["weight_kg"], p["goal"], p["diet"])
+    return {"calorie_target": round(kcal), "protein_g_target": round(protein), "carb_g_target": round(carbs),
+            "fat_g_target": round(fat), "bmr": round(bmr), "tdee": round(tdee)}
+
+def _as_dict(p: Any) -> Dict[str, Any]:
+    if BaseModel is not None and isinstance(p, BaseModel):
+        return p.model_dump() if hasattr(p, "model_dump") else p.dict()
+    return p if isinstance(p, dict) else {}
+
+def _row_error(data: List[Dict[str, Any]], bad) -> IntakeError:
+    """Re-validate the first bad row to get its precise message."""
+    i = int(np.flatnonzero(bad)[0])
+    try:
+        validate_profile(data[i])
+    except IntakeError as e:
+        return IntakeError(f"profile {i}: {e}")
+    return IntakeError(f"profile {i} is invalid")
+
+def compute_targets_batch(profiles: Sequence[Any]) -> List[Dict[str, Any]]:
+    """
+    compute_targets() for many profiles, validated and computed per column;
+    raises IntakeError naming the first bad profile.
+    """
+    if np is None or not profiles:
+        return [compute_targets(p) for p in profiles]
+    data = [_as_dict(p) for p in profiles]
+
+    def num(key, default=None):
+        vals = [d.get(key, default) for d in data]
+        try:
+            return np.array([np.nan if v in (None, "") else v for v in vals], dtype=np.float64)
+        except (TypeError, ValueError):
+            bad = np.array([not isinstance(v, (int, float)) and not str(v).replace(".", "", 1).isdigit()
+                            for v in vals])
+            raise _row_error(data, bad)
+
+    def category(key, parse):
+        raw = [d.get(key) for d in data]
+        try:
+            seen = {v: parse(v) for v in set(map(str, raw))} if raw else {}
+        except IntakeError:
+            bad = np.zeros(len(raw), dtype=bool)
+            for i, v in enumerate(raw):
+                try:
+                    parse(v)
+                except IntakeError:
+                    bad[i] = True
+                    break
+            raise _row_error(data, bad)
+        return [seen[str(v)] for v in raw]
+
+    cols = {k: num(k) for k in LIMITS}
+    for k, (lo, hi) in LIMITS.items():
+        bad = ~((cols[k] >= lo) & (cols[k] <= hi))  # NaN (missing) fails too
+        if bad.any():
+            raise _row_error(data, bad)
+    weight, height = cols["weight_kg"], cols["height_cm"]
+    age = np.floor(cols["age"])
+    sexes = category("sex", lambda v: _sex(None if v == "None" else v))
+    activity = category("activity_level", lambda v: _activity(None if v == "None" else v))
+    goals = category("goal", lambda v: _goal(None if v == "None" else v))
+    diets = [str(d.get("diet") or "balanced").strip().lower() for d in data]
+    fixed = num("caloric_goal")
+    fixed = np.where(np.isnan(fixed), num("calorie_target"), fixed)
+    fixed[fixed == 0] = np.nan
+
+    sex_off = np.array([SEX_OFFSETS[x] for x in sexes])
+    floor = np.array([MIN_CALORIES[x] for x in sexes])
+    mult = np.array([ACTIVITY_MULTIPLIERS[x] for x in activity])
+    goal_off = np.array([GOAL_OFFSETS[x] for x in goals])
+    per_kg = np.array([PROTEIN_G_PER_KG[x] for x in goals])
+    fat_share = np.array([DIET_SPLITS.get(x, DIET_SPLITS["balanced"])[2] for x in diets])
+
+    bmr = 10.0 * weight + 6.25 * height - 5.0 * age + sex_off
+    tdee = bmr * mult
+    kcal = np.where(np.isnan(fixed), np.maximum(floor, tdee + goal_off), fixed)
+    protein = per_kg * weight
+    fat = kcal * fat_share / 9.0
+    carbs = np.maximum(0.0, (kcal - protein * 4.0 - fat * 9.0) / 4.0)
+
+    # np.rint rounds half to even like round(), so results match compute_targets()
+    out_cols = [np.rint(c).astype(np.int64).tolist() for c in (kcal, protein, carbs, fat, bmr, tdee)]
+    keys = TARGET_FIELDS + ("bmr", "tdee")
+    return [dict(zip(keys, vals)) for vals in zip(*out_cols)]
+
+def with_targets(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    prefs with calorie/macro targets filled from the body profile where they
+    are unset; returned unchanged without a complete, valid profile.
+    """
+    if prefs.get("calorie_target") or not has_profile(prefs):
+        return prefs
+    try:
+        targets = compute_targets(prefs)
+    except IntakeError:
+        return prefs
+    return {**prefs, **{k: prefs.get(k) or targets[k] for k in TARGET_FIELDS}}
+
+if BaseModel is not None:
+    from typing import List as _List
+
+    class PreferenceForm(BaseModel):
+        name: str
+        age: int
+        height_cm: int
+        weight_kg: float
+        sex: Optional[str] = None  # "male" / "female"; the midpoint formula when omitted
+        activity_level: str  # sedentary, light, moderate, active, very_active
+        dietary_restrictions: _List[str] = []  # e.g. ["vegetarian", "gluten-free"]
+        dislikes: _List[str] = []
+        caloric_goal: Optional[int] = None  # optional - calculated if not provided
+        goal: str  # "lose", "maintain", "gain"
+else:  # pragma: no cover
+    PreferenceForm = None
+
+# ---------- benchmark ----------
+
+def _bench(n: int = 100_000):
+    import random, time
+    rnd = random.Random(7)
+    profiles = [{"age": rnd.randint(18, 80), "height_cm": rnd.randint(150, 200), "weight_kg": rnd.randint(45, 140),
+                 "sex": rnd.choice(["male", "female", None]), "activity_level": rnd.choice(list(ACTIVITY_MULTIPLIERS)),
+                 "goal": rnd.choice(list(GOAL_OFFSETS))} for _ in range(n)]
+    t0 = time.perf_counter()
+    one = [compute_targets(p) for p in profiles]
+    t1 = time.perf_counter()
+    many = compute_targets_batch(profiles)
+    t2 = time.perf_counter()
+    print(f"{n} profiles: per-profile {(t1 - t0) * 1e3:.0f} ms, batch {(t2 - t1) * 1e3:.0f} ms, "
+          f"identical: {one == many}")
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,175 @@
+# backend_common/jobs.py
+import os, threading, time, traceback
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, Optional
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING
+
+from backend_common.envdb import db
+
+# Background jobs for slow work (Bedrock generation). State lives in the
+# `jobs` collection so any worker can answer a poll for any job.
+#
+# updatedAt is the job's lease: while a job is queued or running in this
+# process, one heartbeat thread bumps it every JOB_HEARTBEAT_SECONDS (a
+# single update_many for all of them). A non-terminal job whose lease is
+# older than JOB_STALE_SECONDS lost its worker (process killed, container
+# replaced); get_job marks it failed so pollers and the SSE stream end.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+JOB_WORKERS = max(1, _env_int("JOB_WORKERS", 4))
+JOB_QUEUE_MAX = max(0, _env_int("JOB_QUEUE_MAX", 16))
+JOB_TTL_SECONDS = _env_int("JOB_TTL_SECONDS", 86400)
+JOB_HEARTBEAT_SECONDS = max(1, _env_int("JOB_HEARTBEAT_SECONDS", 15))
+JOB_STALE_SECONDS = max(3 * JOB_HEARTBEAT_SECONDS, _env_int("JOB_STALE_SECONDS", 90))
+
+TERMINAL = ("done", "failed")
+
+class JobQueueFull(Exception):
+    """Raised when the executor already has JOB_WORKERS + JOB_QUEUE_MAX jobs."""
+
+_executor = ThreadPoolExecutor(max_workers=JOB_WORKERS, thread_name_prefix="job")
+_slots = threading.BoundedSemaphore(JOB_WORKERS + JOB_QUEUE_MAX)
+_live: set = set()  # ObjectIds of jobs queued or running in this process
+_live_lock = threading.Lock()
+_heartbeat_pid: Optional[int] = None
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+def ensure_job_indexes():
+    db.jobs.create_index([("user_id", ASCENDING), ("createdAt", DESCENDING)], name="user_created_idx")
+    db.jobs.create_index([("createdAt", ASCENDING)], name="jobs_ttl", expireAfterSeconds=JOB_TTL_SECONDS)
+
+def create_job(kind: str, user_id: ObjectId, meta: Optional[Dict[str, Any]] = None) -> str:
+    now = _now()
+    doc = {
+        "kind": kind,
+        "user_id": user_id,
+        "status": "queued",
+        "progress": {"stage": "queued", "pct": 0},
+        "meta": meta or {},
+        "result": None,
+        "error": None,
+        "createdAt": now,
+        "updatedAt": now,
+    }
+    return str(db.jobs.insert_one(doc).inserted_id)
+
+def update_job(job_id: str, **fields):
+    fields["updatedAt"] = _now()
+    db.jobs.update_one({"_id": ObjectId(job_id)}, {"$set": fields})
+
+def _stale(doc: Dict[str, Any]) -> bool:
+    seen = doc.get("updatedAt")
+    if doc.get("status") in TERMINAL or not isinstance(seen, datetime):
+        return False
+    if seen.tzinfo is None:  # pymongo returns naive UTC
+        seen = seen.replace(tzinfo=timezone.utc)
+    return _now() - seen > timedelta(seconds=JOB_STALE_SECONDS)
+
+def get_job(job_id: str, user_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """
+    Jobs are only visible to the user that created them. A job whose worker
+    stopped renewing its lease comes back (and is stored) as failed.
+    """
+    try:
+        oid = ObjectId(job_id)
+    except Exception:
+        return None
+    doc = db.jobs.find_one({"_id": oid, "user_id": user_id})
+    if doc and _stale(doc):
+        lost = {"status": "failed", "error": "job worker stopped responding",
+                "progress": {"stage": "failed", "pct": 100}, "updatedAt": _now()}
+        # conditional: a worker that is merely late and finishes first wins
+        db.jobs.update_one({"_id": oid, "status": doc["status"], "updatedAt": doc["updatedAt"]}, {"$set": lost})
+        doc = {**doc, **lost}
+    return doc
+
+def public_job(doc: Dict[str, Any]) -> Dict[str, Any]:
+    out = {
+        "id": str(doc["_id"]),
+        "kind": doc.get("kind"),
+        "status": doc.get("status"),
+        "progress": doc.get("progress") or {},
+        "meta": doc.get("meta") or {},
+        "createdAt": doc["createdAt"].isoformat() if doc.get("createdAt") else None,
+        "updatedAt": doc["updatedAt"].isoformat() if doc.get("updatedAt") else None,
+    }
+    if doc.get("status") == "done":
+        out["result"] = doc.get("result")
+    if doc.get("status") == "failed":
+        out["error"] = doc.get("error")
+    return out
+
+def _beat():
+    """Renew the lease of every job this process still holds."""
+    with _live_lock:
+        ids = list(_live)
+    if not ids:
+        return
+    try:
+        db.jobs.update_many({"_id": {"$in": ids}, "status": {"$nin": list(TERMINAL)}},
+                            {"$set": {"updatedAt": _now()}})
+    except Exception as e:
+        print("Job heartbeat failed:", e)
+
+def _heartbeat():
+    while True:
+        time.sleep(JOB_HEARTBEAT_SECONDS)
+        _beat()
+
+def _ensure_heartbeat():
+    """One daemon thread per process, started again after a fork."""
+    global _heartbeat_pid
+    with _live_lock:
+        if _heartbeat_pid == os.getpid():
+            return
+        _heartbeat_pid = os.getpid()
+    threading.Thread(target=_heartbeat, name="job-heartbeat", daemon=True).start()
+
+def submit(job_id: str, fn: Callable[[Callable[[str, int], None]], Any]):
+    """
+    Run fn(progress) on the bounded executor and record the outcome on the job.
+    fn receives a progress(stage, pct) callback and returns the job result.
+    Raises JobQueueFull instead of queueing without bound.
+    """
+    if not _slots.acquire(blocking=False):
+        update_job(job_id, status="failed", error="job queue full",
+                   progress={"stage": "rejected", "pct": 0})
+        raise JobQueueFull("too many pending jobs")
+    oid = ObjectId(job_id)
+    _ensure_heartbeat()
+    with _live_lock:
+        _live.add(oid)
+
+    def done():
+        with _live_lock:
+            _live.discard(oid)
+        _slots.release()
+
+    def progress(stage: str, pct: int):
+        update_job(job_id, progress={"stage": stage, "pct": int(pct)})
+
+    def run():
+        try:
+            update_job(job_id, status="running", progress={"stage": "running", "pct": 5})
+            result = fn(progress)
+            update_job(job_id, status="done", result=result, progress={"stage": "done", "pct": 100})
+        except Exception as e:
+            traceback.print_exc()
+            update_job(job_id, status="failed", error=str(e), progress={"stage": "failed", "pct": 100})
+        finally:
+            done()
+
+    try:
+        _executor.submit(run)
+    except Exception:
+        done()
+        raise
@@ -0,0 +1,185 @@
+# backend_common/json_patch.py
+import copy
+from typing import Any, Dict, List, Tuple
+
+# RFC 6902 JSON Patch -> minimal MongoDB update document.
+#
+# The patch is applied to an in-memory copy first (so every RFC rule,
+# including `test`, is checked), recording which paths each op dirtied.
+# The dirty paths are then collapsed (an ancestor covers its descendants)
+# and written as $set/$unset of just those paths, or $push for pure
+# appends, so the update and its oplog entry scale with the edit.
+
+class PatchError(ValueError):
+    """Malformed patch, or an op that does not apply to the document."""
+
+Path = Tuple[str, ...]
+
+def parse_pointer(pointer: str) -> Path:
+    if pointer == "":
+        return ()
+    if not isinstance(pointer, str) or not pointer.startswith("/"):
+        raise PatchError(f"invalid JSON pointer: {pointer!r}")
+    return tuple(p.replace("~1", "/").replace("~0", "~") for p in pointer[1:].split("/"))
+
+def _index(container: list, token: str, allow_end: bool = False) -> int:
+    if token == "-" and allow_end:
+        return len(container)
+    if not token.isdigit() or (len(token) > 1 and token[0] == "0"):
+        raise PatchError(f"invalid array index: {token!r}")
+    i = int(token)
+    if i > len(container) or (i == len(container) and not allow_end):
+        raise PatchError(f"array index out of range: {i}")
+    return i
+
+def _resolve(doc: Any, path: Path) -> Any:
+    cur = doc
+    for token in path:
+        if isinstance(cur, list):
+            cur = cur[_index(cur, token)]
+        elif isinstance(cur, dict):
+            if token not in cur:
+                raise PatchError(f"path not found: /{'/'.join(path)}")
+            cur = cur[token]
+        else:
+            raise PatchError(f"path not found: /{'/'.join(path)}")
+    return cur
+
+def _add(doc: Any, path: Path, value: Any) -> Tuple[Any, str]:
+    """Returns (new doc, kind) where kind is 'append', 'insert' or 'set'."""
+    if not path:
+        return value, "set"
+    parent = _resolve(doc, path[:-1])
+    if isinstance(parent, list):
+        i = _index(parent, path[-1], allow_end=True)
+        kind = "append" if i == len(parent) else "insert"
+        parent.insert(i, value)
+        return doc, kind
+    if isinstance(parent, dict):
+        parent[path[-1]] = value
+        return doc, "set"
+    raise PatchError(f"cannot add below a scalar: /{'/'.join(path)}")
+
+def _remove(doc: Any, path: Path) -> Tuple[Any, Any]:
+    if not path:
+        raise PatchError("cannot remove the document root")
+    parent = _resolve(doc, path[:-1])
+    if isinstance(parent, list):
+        return doc, parent.pop(_index(parent, path[-1]))
+    if isinstance(parent, dict) and path[-1] in parent:
+        return doc, parent.pop(path[-1])
+    raise PatchError(f"path not found: /{'/'.join(path)}")
+
+def apply_patch(doc: Any, ops: List[Dict[str, Any]]) -> Tuple[Any, List[Tuple[Path, str]]]:
+    """
+    Apply ops to a deep copy of doc. Returns (patched doc, changes) where each
+    change is (path, kind): kind 'set' means the value at path changed or
+    vanished, 'append' means one element was appended to the array at path.
+    """
+    if not isinstance(ops, list):
+        raise PatchError("patch must be a list of operations")
+    doc = copy.deepcopy(doc)
+    changes: List[Tuple[Path, str]] = []
+
+    def touched(path: Path, kind: str):
+        if kind == "append":
+            changes.append((path[:-1], "append"))
+        elif kind == "insert":
+            changes.append((path[:-1], "set"))  # later elements shift: rewrite that array
+        else:
+            changes.append((path, "set"))
+
+    def removed(path: Path, container: Any):
+        # removing from an array shifts the tail: rewrite the array itself
+        changes.append((path[:-1], "set") if isinstance(container, list) else (path, "set"))
+
+    for op in ops:
+        if not isinstance(op, dict) or "op" not in op or "path" not in op:
+            raise PatchError("each operation needs 'op' and 'path'")
+        kind, path = op["op"], parse_pointer(op["path"])
+        if kind in ("add", "replace", "test") and "value" not in op:
+            raise PatchError(f"'{kind}' needs a value")
+
+        if kind == "add":
+            doc, how = _add(doc, path, copy.deepcopy(op["value"]))
+            touched(path, how)
+        elif kind == "remove":
+            container = _resolve(doc, path[:-1]) if path else None
+            doc, _ = _remove(doc, path)
+            removed(path, container)
+        elif kind == "replace":
+            if not path:
+                doc = copy.deepcopy(op["value"])
+            else:
+                _resolve(doc, path)  # must exist
+                parent = _resolve(doc, path[:-1])
+                if isinstance(parent, list):
+                    parent[_index(parent, path[-1])] = copy.deepcopy(op["value"])
+                else:
+                    parent[path[-1]] = copy.deepcopy(op["value"])
+            changes.append((path, "set"))
+        elif kind in ("move", "copy"):
+            src = parse_pointer(op.get("from", ""))
+            if kind == "move" and path[:len(src)] == src and path != src:
+                raise PatchError("cannot move a value into one of its children")
+            if kind == "move":
+                container = _resolve(doc, src[:-1]) if src else None
+                doc, value = _remove(doc, src)
+                removed(src, container)
+            else:
+                value = copy.deepcopy(_resolve(doc, src))
+            doc, how = _add(doc, path, value)
+            touched(path, how)
+        elif kind == "test":
+            if _resolve(doc, path) != op["value"]:
+                raise PatchError(f"test failed at {op['path']}")
+        else:
+            raise PatchError(f"unknown op: {kind!r}")
+    return doc, changes
+
+def _dotted(root: str, path: Path) -> str:
+    for token in path:
+        if not token or "." in token or token.startswith("$"):
+            raise PatchError(f"key not storable in MongoDB: {token!r}")
+    return ".".join((root,) + path) if root else ".".join(path)
+
+def _covers(a: Path, b: Path) -> bool:
+    """a is b or an ancestor of b."""
+    return b[:len(a)] == a
+
+def to_mongo_update(doc: Any, ops: List[Dict[str, Any]], root: str = "") -> Tuple[Any, Dict[str, Any]]:
+    """
+    (patched doc, update) for a document stored under `root` (e.g. "plan").
+    The update holds only the paths the patch touched.
+    """
+    patched, changes = apply_patch(doc, ops)
+    if any(path == () for path, _ in changes):
+        return patched, {"$set": {root: patched}} if root else {"$set": patched}
+
+    sets = {p for p, k in changes if k == "set"}
+    appends: Dict[Path, int] = {}
+    for p, k in changes:
+        if k == "append":
+            appends[p] = appends.get(p, 0) + 1
+
+    # an append is only a $push if nothing else touches that array
+    for p in list(appends):
+        if any(_covers(p, s) or _covers(s, p) for s in sets) or \
+                any(q != p and (_covers(p, q) or _covers(q, p)) for q in appends):
+            sets.add(p)
+            del appends[p]
+
+    # ancestors cover descendants
+    minimal = [p for p in sets if not any(q != p and _covers(q, p) for q in sets)]
+    update: Dict[str, Dict[str, Any]] = {}
+    for p in sorted(minimal):
+        try:
+            value = _resolve(patched, p)
+        except PatchError:
+            update.setdefault("$unset", {})[_dotted(root, p)] = ""
+            continue
+        update.setdefault("$set", {})[_dotted(root, p)] = value
+    for p, n in appends.items():
+        arr = _resolve(patched, p)
+        update.setdefault("$push", {})[_dotted(root, p)] = {"$each": arr[len(arr) - n:]}
+    return patched, update
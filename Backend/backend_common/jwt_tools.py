@@ -1,6 +1,10 @@
 # backend_common/jwt_tools.py
-import os, time, jwt
-from typing import Dict, Any
+import hashlib, os, threading, time, jwt
+from collections import OrderedDict
+from typing import Dict, Any, Tuple
+from dotenv import load_dotenv
+
+load_dotenv()  # like envdb: scripts and tests may import this module first
 
 ALG = "HS256"
 
@@ -13,20 +17,67 @@ def _env_int(name: str, default: int) -> int:
     except Exception:
         return default
 
+# Read once at import, after the .env above.
+JWT_SECRET = os.getenv("JWT_SECRET", "dev-secret-change-me")
+JWT_ISSUER = os.getenv("JWT_ISSUER", "mealapp-api")
+JWT_AUDIENCE = os.getenv("JWT_AUDIENCE", "mealapp-client")
+JWT_CACHE_MAX = max(0, _env_int("JWT_CACHE_MAX", 4096))
+
 def make_token(payload: Dict[str, Any], *, ttl_seconds: int) -> str:
-    secret = os.getenv("JWT_SECRET", "dev-secret-change-me")
-    iss = os.getenv("JWT_ISSUER", "mealapp-api")
-    aud = os.getenv("JWT_AUDIENCE", "mealapp-client")
     iat = _now()
     exp = iat + ttl_seconds
-    claims = {**payload, "iss": iss, "aud": aud, "iat": iat, "exp": exp}
-    return jwt.encode(claims, secret, algorithm=ALG)
+    claims = {**payload, "iss": JWT_ISSUER, "aud": JWT_AUDIENCE, "iat": iat, "exp": exp}
+    return jwt.encode(claims, JWT_SECRET, algorithm=ALG)
 
 def verify_token(token: str) -> Dict[str, Any]:
-    secret = os.getenv("JWT_SECRET", "dev-secret-change-me")
-    iss = os.getenv("JWT_ISSUER", "mealapp-api")
-    aud = os.getenv("JWT_AUDIENCE", "mealapp-client")
-    return jwt.decode(token, secret, algorithms=[ALG], audience=aud, issuer=iss)
+    return jwt.decode(token, JWT_SECRET, algorithms=[ALG], audience=JWT_AUDIENCE, issuer=JWT_ISSUER)
+
+# ---------- verified-claims cache ----------
+# Keyed by a digest of the token (never the token itself). Entries are only
+# served until the token's own `exp`, so expiry semantics are unchanged.
+
+_cache: "OrderedDict[str, Tuple[int, Dict[str, Any]]]" = OrderedDict()
+_cache_lock = threading.Lock()
+_cache_stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+def verify_token_cached(token: str) -> Dict[str, Any]:
+    """verify_token with a bounded LRU of already-verified claims."""
+    if JWT_CACHE_MAX <= 0:
+        return verify_token(token)
+    key = hashlib.sha256(token.encode("utf-8")).hexdigest()
+    now = _now()
+    with _cache_lock:
+        hit = _cache.get(key)
+        if hit and hit[0] > now:
+            _cache.move_to_end(key)
+            _cache_stats["hits"] += 1
+            return dict(hit[1])
+        if hit:
+            del _cache[key]
+        _cache_stats["misses"] += 1
+
+    claims = verify_token(token)  # raises on bad/expired tokens; failures are not cached
+    with _cache_lock:
+        _cache[key] = (int(claims.get("exp", now)), claims)
+        while len(_cache) > JWT_CACHE_MAX:
+            _cache.popitem(last=False)
+            _cache_stats["evictions"] += 1
+    return dict(claims)
+
+def claims_from_bearer(auth_header: str) -> Dict[str, Any]:
+    """Shared by require_auth and the blueprint: 'Bearer <jwt>' -> verified claims."""
+    if not (auth_header or "").lower().startswith("bearer "):
+        raise ValueError("missing bearer token")
+    return verify_token_cached(auth_header.split(" ", 1)[1].strip())
+
+def token_cache_stats() -> Dict[str, Any]:
+    with _cache_lock:
+        s = dict(_cache_stats)
+        s["size"] = len(_cache)
+    lookups = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+    s["max"] = JWT_CACHE_MAX
+    return s
 
 def mint_access_and_refresh(user: Dict[str, Any]) -> Dict[str, str]:
     """Generate short-lived access + longer refresh tokens."""
@@ -34,7 +85,8 @@ def mint_access_and_refresh(user: Dict[str, Any]) -> Dict[str, str]:
     refresh_ttl = _env_int("JWT_REFRESH_TTL_DAYS", 7) * 86400
     sub = str(user["_id"])
     roles = user.get("roles", [])
-    base = {"sub": sub, "email": user["email"], "roles": roles}
+    # `ver` lets /auth/refresh reject tokens minted before a revocation
+    base = {"sub": sub, "email": user["email"], "roles": roles, "ver": int(user.get("tokenVersion", 0) or 0)}
     access_token  = make_token({**base, "typ": "access"},  ttl_seconds=access_ttl)
     refresh_token = make_token({**base, "typ": "refresh"}, ttl_seconds=refresh_ttl)
     return {"access_token": access_token, "refresh_token": refresh_token}
@@ -0,0 +1,149 @@
+# backend_common/llm_json.py
+import json, re
+from typing import Any, Dict, Optional
+
+try:  # optional faster parser; same results for the JSON models emit
+    import orjson
+    _loads = orjson.loads
+    BACKEND = "orjson"
+except ImportError:  # pragma: no cover
+    orjson = None
+    _loads = json.loads
+    BACKEND = "json"
+
+# Pull the JSON object out of a model reply. Models wrap it in ```json
+# fences, put "Here is your plan:" in front or a note after, and sometimes
+# leave a trailing comma. Up to three attempts, cheapest first:
+#
+#   1. first "{" to last "}" decoded whole (bare JSON, one object inside
+#      fences/prose), retried once without trailing commas
+#   2. raw_decode from the first "{" (an object followed by prose with braces)
+#   3. _spans(): a regex jumps between braces, quotes and backslashes,
+#      tracking string/escape state and depth, and each balanced top-level
+#      span is tried in turn (prose like "{this}" before the real object)
+#
+# This costs more than the old strip-the-fences json.loads (about 4x per
+# reply on the bundled corpus) in exchange for getting every shape in it
+# right (16/16 against 9/16).
+#
+#   python -m backend_common.llm_json      # benchmark over data/llm_json_corpus.jsonl
+
+_decoder = json.JSONDecoder()
+
+class JSONExtractError(ValueError):
+    """No parseable JSON object in the text."""
+
+_TOKENS = {"{": re.compile(r'[{}"\\]'), "[": re.compile(r'[\[\]"\\]')}
+_TRAILING_COMMA = re.compile(r'("(?:\\.|[^"\\])*")|,(\s*[}\]])')
+
+def _spans(s: str, opener: str = "{"):
+    """Yield (start, end) of each balanced top-level {...} (or [...]) outside strings."""
+    closer = "}" if opener == "{" else "]"
+    depth, start, in_str, skip = 0, -1, False, -1
+    # only braces, quotes and backslashes matter; the regex jumps between them
+    for m in _TOKENS[opener].finditer(s):
+        i, ch = m.start(), m.group()
+        if i == skip:
+            continue  # escaped character
+        if in_str:
+            if ch == "\\":
+                skip = i + 1
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            if depth:
+                in_str = True
+        elif ch == opener:
+            if depth == 0:
+                start = i
+            depth += 1
+        elif ch == closer and depth:
+            depth -= 1
+            if depth == 0:
+                yield start, i + 1
+
+def _strip_trailing_commas(s: str) -> str:
+    """Drop commas that directly precede } or ] (strings are matched whole and kept)."""
+    return _TRAILING_COMMA.sub(r"\1\2", s)  # unmatched groups expand to ""
+
+def _parse(s: str) -> Any:
+    try:
+        return _loads(s)
+    except ValueError:  # orjson.JSONDecodeError and json.JSONDecodeError both subclass it
+        return _loads(_strip_trailing_commas(s))
+
+def extract_json(raw: Any, opener: str = "{") -> Any:
+    """
+    The first complete JSON object (or array, opener="[") in a model reply.
+    Fast path: the whole reply already is JSON. Raises JSONExtractError.
+    """
+    s = str(raw).strip()
+    first = s.find(opener)
+    if first < 0:
+        raise JSONExtractError("no JSON object found in model output")
+    # common shapes first, all at C speed: bare JSON, or one object between
+    # a preamble/fence and an epilogue (optionally with trailing commas)
+    last = s.rfind("}" if opener == "{" else "]")
+    if last > first:
+        try:
+            return _parse(s[first:last + 1])
+        except ValueError:
+            pass
+    try:
+        return _decoder.raw_decode(s, first)[0]  # object followed by prose containing braces
+    except ValueError:
+        pass
+    for start, end in _spans(s, opener):
+        try:
+            return _parse(s[start:end])
+        except ValueError:
+            continue  # e.g. "{like this}" in prose before the real object
+    raise JSONExtractError("no JSON object found in model output")
+
+def extract_object(raw: Any) -> Dict[str, Any]:
+    """extract_json that insists on an object (what every caller here wants)."""
+    obj = extract_json(raw, "{")
+    if not isinstance(obj, dict):
+        raise JSONExtractError("model output is not a JSON object")
+    return obj
+
+def try_extract_object(raw: Any) -> Optional[Dict[str, Any]]:
+    try:
+        return extract_object(raw)
+    except JSONExtractError:
+        return None
+
+# ---------- benchmark ----------
+
+def _legacy_loads(txt: str) -> dict:
+    """The old _loads_strict_json, kept only as the benchmark baseline."""
+    s = str(txt).strip()
+    if s.startswith("```"):
+        s = s.strip("`")
+        nl = s.find("\n")
+        if nl > -1 and "{" not in s[:nl]:
+            s = s[nl+1:].strip()
+    return json.loads(s)
+
+def _bench(runs: int = 200):
+    import time
+    from pathlib import Path
+    corpus = Path(__file__).resolve().parent.parent / "data" / "llm_json_corpus.jsonl"
+    cases = [json.loads(line) for line in corpus.read_text(encoding="utf-8").splitlines() if line.strip()]
+    print(f"{len(cases)} cases from {corpus.name}, parser backend: {BACKEND}")
+    for name, fn in (("legacy", _legacy_loads), ("extract", extract_object)):
+        def run(text):
+            try:
+                return fn(text)
+            except ValueError:
+                return None
+        correct = sum(run(c["text"]) == c.get("expect") for c in cases)
+        t0 = time.perf_counter()
+        for _ in range(runs):
+            for c in cases:
+                run(c["text"])
+        us = (time.perf_counter() - t0) * 1e6 / (runs * len(cases))
+        print(f"  {name:8s} correct {correct}/{len(cases)}  {us:.1f} us/reply")
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,151 @@
+# backend_common/macro_audit.py
+import os
+from typing import Any, Dict, List, Tuple
+
+from backend_common import nutrition
+from backend_common.plan_schema import MACRO_KEYS, normalize_plan
+
+try:  # optional: per-meal sums in one scatter-add
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Check model-claimed macros against the local nutrition table. Every meal's
+# ingredient lines (the structured `ingredients` list the prompt asks for,
+# else quantities found in recipe_text) are gathered for the whole plan,
+# resolved in one nutrition.resolve_many() call, scaled in one
+# macros_for() call and summed per meal with one scatter-add. A meal whose
+# claimed calories are off by more than MEALPLAN_AUDIT_TOLERANCE is then
+# flagged (audit.status = "flagged") or, in correct mode, rewritten with the
+# computed macros (audit keeps the claimed ones).
+#
+# Only exact and whole-name matches count as resolved (AUDIT_MATCHES): a
+# prefix or fuzzy hit is close enough to show someone, not to overrule the
+# model's numbers. Meals whose quantified lines mostly don't resolve are
+# left alone (status "unverified"): a partial sum would under-count, not
+# correct.
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except Exception:
+        return default
+
+AUDIT_MODES = ("off", "flag", "correct")
+MEALPLAN_AUDIT = os.getenv("MEALPLAN_AUDIT", "flag").strip().lower()
+AUDIT_TOLERANCE = _env_float("MEALPLAN_AUDIT_TOLERANCE", 0.15)  # relative calorie deviation
+AUDIT_MIN_COVERAGE = _env_float("MEALPLAN_AUDIT_MIN_COVERAGE", 0.8)  # share of lines that must resolve
+AUDIT_MATCHES = ("exact", "words")  # nutrition match kinds trusted by the audit
+
+def meal_lines(meal: Dict[str, Any]) -> List[str]:
+    """Quantified ingredient lines for one meal."""
+    ings = meal.get("ingredients")
+    if isinstance(ings, list) and ings:
+        lines = [str(x) for x in ings if isinstance(x, (str, int, float)) and str(x).strip()]
+        return [x for x in lines if nutrition.has_quantity(x)]
+    return nutrition.ingredients_in_text(meal.get("recipe_text", ""))
+
+def _sums(owners: List[int], ids: List[int], grams: List[float], n_meals: int):
+    """(n_meals x 4) computed macros from the resolved lines."""
+    rows = nutrition.macros_for(ids, grams) if ids else []
+    if np is not None:
+        out = np.zeros((n_meals, 4))
+        if ids:
+            np.add.at(out, np.asarray(owners, dtype=np.int64), rows)
+        return out.tolist()
+    out = [[0.0] * 4 for _ in range(n_meals)]
+    for m, r in zip(owners, rows):
+        for j in range(4):
+            out[m][j] += r[j]
+    return out
+
+def audit_meals(meals: List[Dict[str, Any]], mode: str = None,
+                tolerance: float = None) -> Tuple[List[Dict[str, Any]], Dict[str, int]]:
+    """
+    (audited copies of meals, counts per status). Meals come back with an
+    `audit` entry: status ok|flagged|corrected|unverified, computed macros,
+    coverage and, when corrected, the claimed macros.
+    """
+    mode = (mode or MEALPLAN_AUDIT) if (mode or MEALPLAN_AUDIT) in AUDIT_MODES else "flag"
+    tolerance = AUDIT_TOLERANCE if tolerance is None else tolerance
+    counts = {"ok": 0, "flagged": 0, "corrected": 0, "unverified": 0}
+    if mode == "off":
+        return meals, counts
+
+    texts, line_owner = [], []
+    for m, meal in enumerate(meals):
+        for line in meal_lines(meal):
+            texts.append(line)
+            line_owner.append(m)
+    _, _, hits = nutrition.resolve_many(texts)
+
+    owners, ids, grams = [], [], []
+    resolved = [0] * len(meals)
+    asked = [0] * len(meals)
+    for m, hit in zip(line_owner, hits):
+        asked[m] += 1
+        if hit is not None and hit[2] in AUDIT_MATCHES:
+            resolved[m] += 1
+            owners.append(m)
+            ids.append(hit[0])
+            grams.append(hit[1])
+    sums = _sums(owners, ids, grams, len(meals))
+
+    out = []
+    for m, meal in enumerate(meals):
+        meal = dict(meal)
+        coverage = resolved[m] / asked[m] if asked[m] else 0.0
+        computed = {k: round(v, 1) for k, v in zip(MACRO_KEYS, sums[m])}
+        claimed = {k: meal.get(k, 0.0) for k in MACRO_KEYS}
+        audit: Dict[str, Any] = {"computed": computed, "coverage": round(coverage, 2)}
+        if coverage < AUDIT_MIN_COVERAGE or computed["calories"] <= 0:
+            audit["status"] = "unverified"
+        else:
+            dev = (float(claimed["calories"] or 0) - computed["calories"]) / computed["calories"]
+            audit["deviation"] = round(dev, 3)
+            if abs(dev) <= tolerance:
+                audit["status"] = "ok"
+            elif mode == "correct":
+                audit["status"] = "corrected"
+                audit["claimed"] = claimed
+                meal.update(computed)
+            else:
+                audit["status"] = "flagged"
+        counts[audit["status"]] += 1
+        meal["audit"] = audit
+        out.append(meal)
+    return out, counts
+
+def audit_plan(plan: Dict[str, Any], mode: str = None, tolerance: float = None) -> Dict[str, Any]:
+    """audit_meals over every meal of every day in one pass; totals are recomputed."""
+    days = plan.get("days") or []
+    flat = [m for d in days for m in d.get("meals", [])]
+    audited, counts = audit_meals(flat, mode, tolerance)
+    if audited is flat:
+        return plan
+    it = iter(audited)
+    return normalize_plan({"days": [{**d, "meals": [next(it) for _ in d.get("meals", [])]} for d in days]})
+
+# ---------- benchmark ----------
+
+def _bench(runs: int = 50):
+    import time
+    from backend_common import meal_engine
+    plan = meal_engine.plan_week({"calorie_target": 2200, "meals_per_day": 4})
+    # a model-like plan: structured ingredients, some claims off by 40%
+    for d in plan["days"]:
+        for j, m in enumerate(d["meals"]):
+            m["ingredients"] = ["150 g chicken breast", "1 cup brown rice", "1 tbsp olive oil", "1 cup broccoli"]
+            if j == 0:
+                m["calories"] = m["calories"] * 1.4
+    audit_plan(plan)
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        out = audit_plan(plan, mode="correct")
+    ms = (time.perf_counter() - t0) * 1e3 / runs
+    statuses = [m["audit"]["status"] for d in out["days"] for m in d["meals"]]
+    print(f"{len(statuses)} meals, {sum(len(meal_lines(m)) for d in plan['days'] for m in d['meals'])} lines: "
+          f"{ms:.2f} ms per plan; " + ", ".join(f"{s}={statuses.count(s)}" for s in sorted(set(statuses))))
+
+if __name__ == "__main__":
+    _bench()
@@ -0,0 +1,182 @@
+# backend_common/macro_solver.py
+from typing import List, NamedTuple, Optional, Sequence
+
+import numpy as np
+
+# Batched beam search for "pick one recipe + serving size per meal slot so
+# the day's (kcal, protein, carbs, fat) lands on the target vector".
+#
+# Every recipe of a slot is scored at once (closed-form best serving), the
+# best OPTIONS (recipe, serving) pairs per slot are kept, and the search
+# extends BEAM partial days by all options of the next slot in one
+# broadcasted operation. Work is O(slots * beam * options) regardless of
+# catalog size plus one O(N) shortlist pass per slot, which can be shared
+# by all days of a week (prepare_slots).
+#
+#   python -m backend_common.macro_solver      # synthetic benchmark
+
+SERVING_STEPS = np.array([0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0], dtype=np.float32)
+WEIGHTS = np.array([4.0, 2.0, 1.0, 1.0], dtype=np.float32)  # kcal, protein, carbs, fat
+BEAM = 64
+OPTIONS = 128
+
+class DaySolution(NamedTuple):
+    picks: List[int]          # recipe id per slot
+    servings: List[float]     # serving multiplier per slot
+    totals: List[float]       # kcal, protein_g, carbs_g, fat_g
+    deviation: List[float]    # (totals - target) / target
+    cost: float
+
+def _cost(totals: np.ndarray, target: np.ndarray, weights: np.ndarray) -> np.ndarray:
+    """Weighted squared relative error along the last axis."""
+    safe = np.where(target > 0, target, 1.0)
+    rel = (totals - target) / safe
+    rel = np.where(target > 0, rel, 0.0)
+    return (rel * rel * weights).sum(axis=-1)
+
+class SlotOptions(NamedTuple):
+    ids: np.ndarray        # (O,) recipe id
+    servings: np.ndarray   # (O,) serving multiplier
+    macros: np.ndarray     # (O, 4) macros at that serving
+    fit: np.ndarray        # (O,) cost against the slot's share of the target
+
+def _slot_options(macros: np.ndarray, pool: np.ndarray, slot_target: np.ndarray,
+                  weights: np.ndarray, servings: np.ndarray, limit: int) -> SlotOptions:
+    """
+    Best `limit` (recipe, serving) options for one slot by fit to the slot's share.
+    For a recipe with per-target ratios a = m / t the cost at serving s is
+    s^2*A - 2s*B + C (A = sum w a^2, B = sum w a, C = sum w), so the optimum
+    s* = B/A comes from two mat-vec products; only the two serving steps that
+    bracket s* are evaluated.
+    """
+    m = macros[pool]                                             # (P, 4)
+    live = slot_target > 0
+    a = np.where(live, m / np.where(live, slot_target, 1.0), 0.0).astype(np.float32)
+    A = (a * a) @ weights
+    B = a @ weights
+    C = float(weights[live].sum())
+    s_star = B / np.maximum(A, 1e-9)
+    hi = np.clip(np.searchsorted(servings, s_star), 0, servings.size - 1)
+    lo = np.clip(hi - 1, 0, servings.size - 1)
+    s2 = np.stack([servings[lo], servings[hi]], axis=1)          # (P, 2)
+    fit = (s2 * s2 * A[:, None] - 2.0 * s2 * B[:, None] + C).ravel()
+
+    k = min(limit, fit.size)
+    keep = np.argpartition(fit, k - 1)[:k] if k < fit.size else np.arange(fit.size)
+    r = keep // 2
+    sv = s2.ravel()[keep]
+    return SlotOptions(pool[r], sv, m[r] * sv[:, None], fit[keep])
+
+def prepare_slots(macros: np.ndarray, pools: Sequence[np.ndarray], slot_kcal: Sequence[float],
+                  target: Sequence[float], weights: np.ndarray = WEIGHTS,
+                  servings: np.ndarray = SERVING_STEPS, options: int = OPTIONS) -> List[SlotOptions]:
+    """
+    Per-slot shortlists, independent of any per-day bias. Keeps 4x `options`
+    so a week of solve_day calls can re-rank them with different biases
+    without touching the full catalog again.
+    """
+    target = np.asarray(target, dtype=np.float32)
+    slot_kcal = np.asarray(slot_kcal, dtype=np.float32)
+    shares = slot_kcal / max(float(slot_kcal.sum()), 1e-6)
+    return [
+        _slot_options(macros, np.asarray(pool, dtype=np.int64), target * shares[k],
+                      weights, servings, options * 4)
+        for k, pool in enumerate(pools)
+    ]
+
+def solve_day(macros: np.ndarray, pools: Sequence[np.ndarray], slot_kcal: Sequence[float],
+              target: Sequence[float], bias: Optional[np.ndarray] = None,
+              weights: np.ndarray = WEIGHTS, servings: np.ndarray = SERVING_STEPS,
+              beam: int = BEAM, options: int = OPTIONS, top_n: int = 1,
+              prepared: Optional[List[SlotOptions]] = None) -> List[DaySolution]:
+    """
+    macros: (N, 4) float array for the whole catalog.
+    pools:  candidate recipe ids per slot (any size; may overlap between slots).
+    bias:   optional (N,) additive cost per recipe (repeat penalty, preferences).
+    prepared: output of prepare_slots() to reuse across days (pools then unused).
+    Returns up to top_n solutions, best first. A recipe is used at most once per day.
+    """
+    target = np.asarray(target, dtype=np.float32)
+    slot_kcal = np.asarray(slot_kcal, dtype=np.float32)
+    shares = slot_kcal / max(float(slot_kcal.sum()), 1e-6)
+    if prepared is None:
+        prepared = prepare_slots(macros, pools, slot_kcal, target, weights, servings, options)
+
+    slot_opts = []
+    for so in prepared:
+        fit = so.fit + bias[so.ids] if bias is not None else so.fit
+        k = min(options, fit.size)
+        keep = np.argpartition(fit, k - 1)[:k] if k < fit.size else np.arange(fit.size)
+        slot_opts.append((so.ids[keep], so.servings[keep], so.macros[keep]))
+
+    n_slots = len(slot_opts)
+    sums = np.zeros((1, 4), dtype=np.float32)
+    extra = np.zeros(1, dtype=np.float32)
+    picks = np.zeros((1, 0), dtype=np.int64)
+    serv = np.zeros((1, 0), dtype=np.float32)
+
+    for k, (ids, sv, om) in enumerate(slot_opts):
+        # remaining slots are assumed to hit their share exactly (lookahead)
+        rest = target * float(shares[k + 1:].sum())
+        opt_bias = bias[ids] if bias is not None else np.zeros(ids.size, dtype=np.float32)
+        cand = sums[:, None, :] + om[None, :, :]                   # (B, O, 4)
+        score = _cost(cand + rest, target, weights) + extra[:, None] + opt_bias[None, :]
+        if picks.shape[1]:
+            dup = (picks[:, :, None] == ids[None, None, :]).any(axis=1)
+            score = np.where(dup, np.inf, score)
+
+        flat = score.ravel()
+        width = beam if k < n_slots - 1 else max(beam, top_n)
+        keep = min(width, int(np.isfinite(flat).sum()) or flat.size)
+        sel = np.argpartition(flat, keep - 1)[:keep] if keep < flat.size else np.arange(flat.size)
+        b, o = np.divmod(sel, ids.size)
+
+        sums = cand[b, o]
+        extra = extra[b] + opt_bias[o]
+        picks = np.concatenate([picks[b], ids[o][:, None]], axis=1)
+        serv = np.concatenate([serv[b], sv[o][:, None]], axis=1)
+
+    final = _cost(sums, target, weights) + extra
+    order = np.argsort(final, kind="stable")[:top_n]
+    safe = np.where(target > 0, target, 1.0)
+    return [
+        DaySolution(
+            picks=[int(x) for x in picks[i]],
+            servings=[float(x) for x in serv[i]],
+            totals=[float(x) for x in sums[i]],
+            deviation=[float(x) for x in (sums[i] - target) / safe],
+            cost=float(final[i]),
+        )
+        for i in order
+    ]
+
+def catalog_matrix(calories, protein_g, carbs_g, fat_g) -> np.ndarray:
+    """(N, 4) float32 matrix from four array('f') columns (no per-row Python work)."""
+    cols = [np.frombuffer(c, dtype=np.float32) if not isinstance(c, np.ndarray) else c
+            for c in (calories, protein_g, carbs_g, fat_g)]
+    return np.stack(cols, axis=1).astype(np.float32, copy=False)
+
+def _bench(n: int = 50000, slots: int = 6, runs: int = 20):
+    import time
+    rng = np.random.default_rng(7)
+    p = rng.uniform(2, 60, n); c = rng.uniform(0, 100, n); f = rng.uniform(0, 45, n)
+    macros = np.stack([4 * p + 4 * c + 9 * f, p, c, f], axis=1).astype(np.float32)
+    pools = [rng.choice(n, size=n // 3, replace=False) for _ in range(slots)]
+    slot_kcal = [2400 / slots] * slots
+    target = [2400, 160, 270, 75]
+    solve_day(macros, pools, slot_kcal, target)  # warm-up
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        best = solve_day(macros, pools, slot_kcal, target)[0]
+    cold = (time.perf_counter() - t0) * 1000 / runs
+    prepared = prepare_slots(macros, pools, slot_kcal, target)
+    t0 = time.perf_counter()
+    for _ in range(runs):
+        solve_day(macros, pools, slot_kcal, target, prepared=prepared)
+    warm = (time.perf_counter() - t0) * 1000 / runs
+    print(f"{n} recipes x {slots} slots: {cold:.1f} ms/day cold, {warm:.1f} ms/day prepared, "
+          f"deviation {[round(d, 3) for d in best.deviation]}")
+
+if __name__ == "__main__":
+    _bench()
+    _bench(n=20000, slots=8)
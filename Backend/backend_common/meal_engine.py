@@ -0,0 +1,403 @@
+# backend_common/meal_engine.py
+import os
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from backend_common.plan_schema import MACRO_KEYS, normalize_plan
+from backend_common.recipes import RecipeCatalog, get_catalog, iter_bits
+
+try:  # optional: vectorized solver over whole slot pools (backend_common.macro_solver)
+    import numpy as np
+    from backend_common import macro_solver
+except ImportError:  # pragma: no cover - pure-Python solver still works
+    np = None
+    macro_solver = None
+
+# Deterministic local meal planner. For each day it picks one recipe per
+# meal slot and a serving size so the day lands on the calorie target and
+# close to the protein/carb/fat targets. Same prefs in -> same plan out,
+# in a few milliseconds, with no model call.
+#
+# Calories come first: a day outside CALORIE_TOLERANCE costs far more than
+# any macro miss, and after solving, a day still outside it is repaired by
+# stepping servings and, when servings run out, adding or dropping a meal
+# (_fit_calories), so local plans pass within_tolerance like model plans
+# must.
+
+def _env_float(name: str, default: float) -> float:
+    try:
+        return float(os.getenv(name, default))
+    except Exception:
+        return default
+
+CALORIE_TOLERANCE = _env_float("MEALPLAN_CALORIE_TOLERANCE", 0.10)  # +-10% of target
+
+# share of calories from (protein, carbs, fat) when no gram targets are set
+DIET_SPLITS = {
+    "balanced":     (0.25, 0.45, 0.30),
+    "high-protein": (0.35, 0.35, 0.30),
+    "keto":         (0.25, 0.05, 0.70),
+    "low-carb":     (0.30, 0.20, 0.50),
+    "vegetarian":   (0.22, 0.50, 0.28),
+    "vegan":        (0.20, 0.55, 0.25),
+}
+
+SLOT_PLANS = {
+    1: ("dinner",),
+    2: ("breakfast", "dinner"),
+    3: ("breakfast", "lunch", "dinner"),
+    4: ("breakfast", "lunch", "dinner", "snack"),
+    5: ("breakfast", "snack", "lunch", "snack", "dinner"),
+    6: ("breakfast", "snack", "lunch", "snack", "dinner", "snack"),
+}
+SLOT_SHARE = {"breakfast": 0.25, "lunch": 0.32, "dinner": 0.33, "snack": 0.10}
+
+SERVING_STEPS = (0.5, 0.75, 1.0, 1.25, 1.5, 1.75, 2.0, 2.5, 3.0)
+
+# relative-error weights for (kcal, protein, carbs, fat)
+WEIGHTS = (4.0, 2.0, 1.0, 1.0)
+CALORIE_PENALTY = 1000.0   # per unit of relative kcal error beyond CALORIE_TOLERANCE (plus its square)
+MAX_EXTRA_MEALS = 3        # meals _fit_calories may add to (or drop from) a day
+REPEAT_PENALTY = 0.15     # per use of the same recipe in the last few days
+CUISINE_BONUS = 0.02
+MAX_CANDIDATES = 24        # per slot, nearest by calories (pure-Python solver)
+
+# "numpy" searches every recipe of each slot; "py" the MAX_CANDIDATES nearest
+MEALPLAN_SOLVER = (os.getenv("MEALPLAN_SOLVER") or ("numpy" if macro_solver else "py")).strip().lower()
+
+Target = Tuple[float, float, float, float]
+
+def slots_for(meals_per_day: int) -> Tuple[str, ...]:
+    n = max(1, int(meals_per_day))
+    if n in SLOT_PLANS:
+        return SLOT_PLANS[n]
+    return SLOT_PLANS[6] + ("snack",) * (n - 6)
+
+def day_targets(prefs: Dict[str, Any]) -> Target:
+    """(kcal, protein_g, carbs_g, fat_g) per day from prefs, filling gaps from the diet split."""
+    def num(key) -> Optional[float]:
+        try:
+            v = prefs.get(key)
+            return float(v) if v not in (None, "") else None
+        except Exception:
+            return None
+
+    kcal = num("calorie_target") or 2200.0
+    split = DIET_SPLITS.get(str(prefs.get("diet") or "balanced").strip().lower(), DIET_SPLITS["balanced"])
+    return (
+        kcal,
+        num("protein_g_target") or kcal * split[0] / 4.0,
+        num("carb_g_target") or kcal * split[1] / 4.0,
+        num("fat_g_target") or kcal * split[2] / 9.0,
+    )
+
+def _snap(x: float) -> float:
+    return min(SERVING_STEPS, key=lambda s: abs(s - x))
+
+def _cost(totals: Sequence[float], target: Target) -> float:
+    c = 0.0
+    for w, got, want in zip(WEIGHTS, totals, target):
+        if want > 0:
+            r = (got - want) / want
+            c += w * r * r
+    if target[0] > 0:
+        over = abs(totals[0] - target[0]) / target[0] - CALORIE_TOLERANCE
+        if over > 0:
+            c += CALORIE_PENALTY * (over + over * over)
+    return c
+
+class _DayProblem:
+    def __init__(self, cat: RecipeCatalog, slots: Sequence[str], target: Target,
+                 candidates: List[List[int]], bias: Dict[int, float],
+                 pools: Optional[List[List[int]]] = None, shared: Optional[Dict[str, Any]] = None):
+        self.cat = cat
+        self.slots = slots
+        self.target = target
+        self.candidates = candidates
+        self.bias = bias  # recipe id -> additive score (repeats +, preferred cuisine -)
+        self.pools = pools or candidates  # every usable recipe per slot
+        self.shared = shared if shared is not None else {}  # per-week solver state
+        total_share = sum(SLOT_SHARE[s] for s in slots)
+        self.slot_kcal = [target[0] * SLOT_SHARE[s] / total_share for s in slots]
+
+    def servings(self, picks: Sequence[int]) -> List[float]:
+        return [_snap(self.slot_kcal[k] / max(1.0, self.cat.calories[i])) for k, i in enumerate(picks)]
+
+    def totals(self, picks: Sequence[int], servings: Sequence[float]) -> List[float]:
+        t = [0.0, 0.0, 0.0, 0.0]
+        for i, s in zip(picks, servings):
+            for j, v in enumerate(self.cat.macros(i)):
+                t[j] += v * s
+        return t
+
+    def score(self, picks: Sequence[int], servings: Optional[Sequence[float]] = None) -> float:
+        servings = servings or self.servings(picks)
+        return _cost(self.totals(picks, servings), self.target) + sum(self.bias.get(i, 0.0) for i in picks)
+
+def _candidates(cat: RecipeCatalog, mask: int, kcal: float) -> List[int]:
+    ids = list(iter_bits(mask))
+    ids.sort(key=lambda i: (abs(cat.calories[i] - kcal), i))
+    return ids[:MAX_CANDIDATES]
+
+def solve_day_py(problem: _DayProblem) -> Tuple[List[int], List[float]]:
+    """Greedy start, then coordinate descent over slots, then serving fine-tune."""
+    picks: List[int] = []
+    for k, cands in enumerate(problem.candidates):
+        pool = [i for i in cands if i not in picks] or cands
+        # per-slot macro fit at the slot's share of the day
+        share = problem.slot_kcal[k] / problem.target[0]
+        slot_target = tuple(v * share for v in problem.target)
+        picks.append(min(pool, key=lambda i: (
+            _cost([v * _snap(problem.slot_kcal[k] / max(1.0, problem.cat.calories[i]))
+                   for v in problem.cat.macros(i)], slot_target) + problem.bias.get(i, 0.0), i)))
+
+    best = problem.score(picks)
+    for _ in range(3):
+        improved = False
+        for k, cands in enumerate(problem.candidates):
+            for i in cands:
+                if i == picks[k] or i in picks:
+                    continue
+                trial = picks[:k] + [i] + picks[k + 1:]
+                sc = problem.score(trial)
+                if sc < best - 1e-9:
+                    picks, best, improved = trial, sc, True
+        if not improved:
+            break
+
+    return picks, fine_tune_servings(problem, picks, problem.servings(picks))
+
+def _catalog_matrix(cat: RecipeCatalog):
+    m = getattr(cat, "_macro_matrix", None)
+    if m is None or len(m) != len(cat):
+        m = macro_solver.catalog_matrix(cat.calories, cat.protein_g, cat.carbs_g, cat.fat_g)
+        cat._macro_matrix = m
+    return m
+
+def solve_day_np(problem: _DayProblem) -> Tuple[List[int], List[float]]:
+    """Beam search over the full slot pools (backend_common.macro_solver), then serving fine-tune."""
+    macros = _catalog_matrix(problem.cat)
+    prepared = problem.shared.get("prepared")
+    if prepared is None:
+        pools = [np.fromiter(p, dtype=np.int64, count=len(p)) for p in problem.pools]
+        weights = np.asarray(WEIGHTS, dtype=np.float32)
+        servings = np.asarray(SERVING_STEPS, dtype=np.float32)
+        prepared = macro_solver.prepare_slots(macros, pools, problem.slot_kcal, problem.target, weights, servings)
+        problem.shared.update(prepared=prepared, weights=weights, servings=servings)
+
+    bias = None
+    if problem.bias:
+        bias = np.zeros(len(problem.cat), dtype=np.float32)
+        for i, b in problem.bias.items():
+            bias[i] = b
+    best = macro_solver.solve_day(macros, None, problem.slot_kcal, problem.target, bias=bias,
+                                  weights=problem.shared["weights"], servings=problem.shared["servings"],
+                                  prepared=prepared)[0]
+    return best.picks, fine_tune_servings(problem, best.picks, [_snap(s) for s in best.servings])
+
+SOLVERS = {"py": solve_day_py, "numpy": solve_day_np}
+
+def fine_tune_servings(problem: _DayProblem, picks: Sequence[int], servings: List[float]) -> List[float]:
+    """Nudge single servings by one step while that lowers the day's cost."""
+    servings = list(servings)
+    best = problem.score(picks, servings)
+    for _ in range(len(SERVING_STEPS) * len(picks)):
+        move = None
+        for k in range(len(picks)):
+            pos = SERVING_STEPS.index(servings[k])
+            for step in (-1, 1):
+                if 0 <= pos + step < len(SERVING_STEPS):
+                    trial = servings[:k] + [SERVING_STEPS[pos + step]] + servings[k + 1:]
+                    sc = problem.score(picks, trial)
+                    if sc < best - 1e-9:
+                        best, move = sc, trial
+        if move is None:
+            break
+        servings = move
+    return servings
+
+def _kcal_error(problem: _DayProblem, picks: Sequence[int], servings: Sequence[float]) -> float:
+    """Relative calorie error of the day (+ over, - under)."""
+    return problem.totals(picks, servings)[0] / problem.target[0] - 1.0
+
+def _fit_calories(problem: _DayProblem, picks: List[int],
+                  servings: List[float]) -> Tuple[List[int], List[float]]:
+    """
+    Add a meal while the day is short of the calorie tolerance with servings
+    already stepped as far as they help (or drop one while it is over), up to
+    MAX_EXTRA_MEALS; each change is followed by a serving fine-tune.
+    """
+    pool = problem.shared.get("spare") or sorted(set().union(*map(set, problem.pools)))
+    for _ in range(MAX_EXTRA_MEALS):
+        err = _kcal_error(problem, picks, servings)
+        if abs(err) <= CALORIE_TOLERANCE:
+            break
+        if err < 0:
+            extra = [i for i in pool if i not in picks]
+            if not extra:
+                break
+            trials = [(picks + [i], servings + [_snap(-err * problem.target[0] / max(1.0, problem.cat.calories[i]))])
+                      for i in extra]
+        else:
+            if len(picks) < 2:
+                break
+            trials = [(picks[:k] + picks[k + 1:], servings[:k] + servings[k + 1:]) for k in range(len(picks))]
+        p, s = min(trials, key=lambda t: (problem.score(t[0], t[1]), t[0]))
+        picks, servings = p, fine_tune_servings(problem, p, s)
+    return picks, servings
+
+def _meal(cat: RecipeCatalog, i: int, servings: float) -> Dict[str, Any]:
+    kcal, p, c, f = cat.macros(i)
+    text = cat.recipe_text[i] if servings == 1.0 else f"{servings:g} servings. {cat.recipe_text[i]}"
+    return {
+        "name": cat.names[i],
+        "calories": round(kcal * servings, 1),
+        "protein_g": round(p * servings, 1),
+        "carbs_g": round(c * servings, 1),
+        "fat_g": round(f * servings, 1),
+        "recipe_text": text,
+        "servings": servings,
+    }
+
+def _filters(prefs: Dict[str, Any]) -> Tuple[str, List[str], Optional[int]]:
+    """(diet, exclusions, max prep minutes) for RecipeCatalog.filter."""
+    excludes = [str(x) for x in (prefs.get("exclude_ingredients") or []) if str(x).strip()]
+    try:
+        max_prep = int(prefs.get("max_prep_minutes") or 0) or None
+    except Exception:
+        max_prep = None
+    return prefs.get("diet") or "balanced", excludes, max_prep
+
+def plan_week(prefs: Dict[str, Any], days: int = 7, catalog: Optional[RecipeCatalog] = None,
+              solver=None) -> Dict[str, Any]:
+    """Build a {days: [{day, meals: [...], totals}], totals} plan from the local catalog."""
+    cat = catalog or get_catalog()
+    solve = solver or SOLVERS.get(MEALPLAN_SOLVER if macro_solver else "py", solve_day_py)
+    slots = slots_for(int(prefs.get("meals_per_day") or 3))
+    target = day_targets(prefs)
+    diet, excludes, max_prep = _filters(prefs)
+
+    preferred = 0
+    for c in prefs.get("cuisine_preferences") or []:
+        preferred |= cat.by_cuisine.get(str(c).strip().lower(), 0)
+
+    total_share = sum(SLOT_SHARE[s] for s in slots)
+    masks = {s: cat.filter(s, diet, excludes, max_prep) for s in set(slots)}
+    for s in masks:
+        if bin(masks[s]).count("1") < slots.count(s):
+            # fewer recipes than slots of that kind (many snacks a day): borrow so a day never repeats
+            masks[s] |= cat.filter(None, diet, excludes, max_prep)
+    candidates = [_candidates(cat, masks[s], target[0] * SLOT_SHARE[s] / total_share) for s in slots]
+    pools = None
+    if solve is not solve_day_py:
+        ids = {s: list(iter_bits(masks[s])) for s in masks}
+        pools = [ids[s] for s in slots]
+    # any compliant recipe can be an extra meal (_fit_calories)
+    shared: Dict[str, Any] = {"spare": list(iter_bits(cat.filter(None, diet, excludes, max_prep)))}
+
+    recent: List[List[int]] = []
+    out_days: List[Dict[str, Any]] = []
+    for d in range(1, days + 1):
+        bias: Dict[int, float] = {}
+        for picks in recent[-3:]:
+            for i in picks:
+                bias[i] = bias.get(i, 0.0) + REPEAT_PENALTY
+        for i in iter_bits(preferred):
+            bias[i] = bias.get(i, 0.0) - CUISINE_BONUS
+
+        problem = _DayProblem(cat, slots, target, candidates, bias, pools, shared)
+        picks, servings = _fit_calories(problem, *solve(problem))
+        recent.append(picks)
+        out_days.append({"day": d, "meals": [_meal(cat, i, s) for i, s in zip(picks, servings)]})
+
+    return normalize_plan({"days": out_days, "notes": _diet_notes(cat, diet, recent)})
+
+def _diet_notes(cat: RecipeCatalog, diet: str, picks: List[List[int]]) -> List[str]:
+    """A note naming the meals outside the diet (filter drops it only when nothing else is left)."""
+    compliant = cat.diet_mask(diet)
+    if compliant is None:
+        return []
+    off = sorted({cat.names[i] for day in picks for i in day if not compliant >> i & 1})
+    if not off:
+        return []
+    return [f"No {diet} recipe avoids the excluded ingredients, so these meals are not {diet}: {', '.join(off)}"]
+
+def replacement_meal(prefs: Dict[str, Any], day_meals: List[Dict[str, Any]], idx: int,
+                     catalog: Optional[RecipeCatalog] = None) -> Dict[str, Any]:
+    """
+    One catalog meal to swap in at day_meals[idx]. Its target is the replaced
+    meal's own macros, so the day's totals stay where they were; recipes
+    already on that day (including the replaced one) are skipped.
+    """
+    cat = catalog or get_catalog()
+    slots = slots_for(len(day_meals))
+    slot = slots[idx] if idx < len(slots) else "snack"
+
+    def num(v) -> float:
+        try:
+            return float(v or 0)
+        except Exception:
+            return 0.0
+
+    old = day_meals[idx]
+    target: Target = tuple(num(old.get(k)) for k in MACRO_KEYS)
+    if target[0] <= 0:  # nothing to preserve: aim at the slot's share of the day
+        day = day_targets(prefs)
+        share = SLOT_SHARE[slot] / sum(SLOT_SHARE[s] for s in slots)
+        target = tuple(v * share for v in day)
+
+    diet, excludes, max_prep = _filters(prefs)
+    mask = cat.filter(slot, diet, excludes, max_prep)
+    taken = {str(m.get("name", "")).strip().lower() for m in day_meals if isinstance(m, dict)}
+    ids = [i for i in iter_bits(mask) if cat.names[i].lower() not in taken] or list(iter_bits(mask))
+
+    if macro_solver is not None and MEALPLAN_SOLVER == "numpy":
+        best = macro_solver.solve_day(_catalog_matrix(cat), [np.asarray(ids, dtype=np.int64)], [target[0]], target,
+                                      weights=np.asarray(WEIGHTS, dtype=np.float32),
+                                      servings=np.asarray(SERVING_STEPS, dtype=np.float32))[0]
+        return _meal(cat, best.picks[0], _snap(best.servings[0]))
+
+    best_i, best_s, best_c = ids[0], 1.0, float("inf")
+    for i in ids:
+        m = cat.macros(i)
+        for sv in SERVING_STEPS:
+            c = _cost([v * sv for v in m], target)
+            if c < best_c:
+                best_i, best_s, best_c = i, sv, c
+    return _meal(cat, best_i, best_s)
+
+def _day_totals(d: Dict[str, Any]) -> List[float]:
+    """The day's stored totals (normalized plans), else the sum of its meals."""
+    t = d.get("totals")
+    if isinstance(t, dict) and all(k in t for k in MACRO_KEYS):
+        return [float(t[k] or 0) for k in MACRO_KEYS]
+    totals = [0.0, 0.0, 0.0, 0.0]
+    for m in d.get("meals", []):
+        for j, k in enumerate(MACRO_KEYS):
+            try:
+                totals[j] += float(m.get(k, 0) or 0)
+            except Exception:
+                pass
+    return totals
+
+def plan_deviation(plan: Dict[str, Any], prefs: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Per day: (calories, protein_g, carbs_g, fat_g) totals and relative deviation from the targets."""
+    target = day_targets(prefs)
+    keys = MACRO_KEYS
+    out = []
+    for d in plan.get("days", []):
+        totals = _day_totals(d)
+        out.append({
+            "day": d.get("day"),
+            "totals": dict(zip(keys, (round(t, 1) for t in totals))),
+            "deviation": dict(zip(keys, (round((t - w) / w, 4) if w else 0.0 for t, w in zip(totals, target)))),
+        })
+    return out
+
+def within_tolerance(plan: Dict[str, Any], prefs: Dict[str, Any], tolerance: float = CALORIE_TOLERANCE) -> bool:
+    """True when every day's calories are within +-tolerance of the target."""
+    kcal = day_targets(prefs)[0]
+    for d in plan.get("days", []):
+        got = _day_totals(d)[0]
+        if abs(got - kcal) > tolerance * kcal:
+            return False
+    return True
@@ -0,0 +1,161 @@
+# backend_common/mealplans.py
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Tuple
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, InsertOne, ReturnDocument
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+
+from backend_common.envdb import db
+
+# Meal plans live in their own `mealplans` collection, one document per
+# (user_id, version), so user_prefs stays small and plan history is cheap.
+# Older accounts may still have the plan embedded as user_prefs.meal_plan;
+# reads fall back to it until migrate_embedded_plans() has run.
+#
+# In-place edits to a version (single-meal swaps, JSON patches) bump its
+# `rev` counter (absent = 0) instead of creating a new version, and only
+# apply if the version is still at the rev the edit was computed from.
+
+_LATEST_FIELDS = {"plan": 1, "version": 1, "source": 1, "createdAt": 1, "rev": 1}
+
+def ensure_mealplan_indexes():
+    db.mealplans.create_index([("user_id", ASCENDING), ("version", DESCENDING)],
+                              unique=True, name="user_version_uniq")
+
+def save_plan(user_id: ObjectId, plan: Dict[str, Any], source: str = "manual") -> int:
+    """Append a new version; returns its version number."""
+    for _ in range(5):
+        last = db.mealplans.find_one({"user_id": user_id}, {"version": 1}, sort=[("version", DESCENDING)])
+        version = (last["version"] if last else 0) + 1
+        try:
+            db.mealplans.insert_one({
+                "user_id": user_id,
+                "version": version,
+                "plan": plan,
+                "source": source,
+                "createdAt": datetime.now(timezone.utc),
+            })
+            return version
+        except DuplicateKeyError:
+            continue  # a concurrent save took this version; try the next one
+    raise RuntimeError("could not allocate a meal plan version")
+
+def save_plans_bulk(items: List[Tuple[ObjectId, Dict[str, Any], str]]) -> Dict[ObjectId, int]:
+    """
+    Append one new version per (user_id, plan, source) with a single $max
+    aggregate and one unordered bulk_write. Users whose version was taken
+    concurrently are retried through save_plan. Returns {user_id: version}.
+    """
+    if not items:
+        return {}
+    user_ids = list({uid for uid, _, _ in items})
+    last = {d["_id"]: d["v"] for d in db.mealplans.aggregate([
+        {"$match": {"user_id": {"$in": user_ids}}},
+        {"$group": {"_id": "$user_id", "v": {"$max": "$version"}}},
+    ])}
+
+    now = datetime.now(timezone.utc)
+    ops, planned = [], []
+    for uid, plan, source in items:
+        last[uid] = last.get(uid, 0) + 1
+        planned.append((uid, last[uid], plan, source))
+        ops.append(InsertOne({"user_id": uid, "version": last[uid], "plan": plan,
+                              "source": source, "createdAt": now}))
+
+    failed = set()
+    try:
+        db.mealplans.bulk_write(ops, ordered=False)
+    except BulkWriteError as e:
+        for err in e.details.get("writeErrors", []):
+            if err.get("code") != 11000:
+                raise
+            failed.add(err["index"])
+
+    versions: Dict[ObjectId, int] = {}
+    for n, (uid, version, plan, source) in enumerate(planned):
+        versions[uid] = save_plan(uid, plan, source) if n in failed else version
+    return versions
+
+def latest_plan(user_id: ObjectId) -> Optional[Dict[str, Any]]:
+    """{plan, version, source, createdAt} for the newest version, or None."""
+    doc = db.mealplans.find_one({"user_id": user_id}, _LATEST_FIELDS, sort=[("version", DESCENDING)])
+    if doc:
+        return doc
+    legacy = db.user_prefs.find_one({"user_id": user_id, "meal_plan": {"$exists": True}}, {"meal_plan": 1})
+    if legacy and legacy.get("meal_plan"):
+        return {"plan": legacy["meal_plan"], "version": 0, "source": "legacy", "createdAt": None}
+    return None
+
+def get_version(user_id: ObjectId, version: int) -> Optional[Dict[str, Any]]:
+    return db.mealplans.find_one({"user_id": user_id, "version": version}, _LATEST_FIELDS)
+
+def versioned(user_id: ObjectId, doc: Dict[str, Any]) -> Dict[str, Any]:
+    """latest_plan() result with a real version (legacy embedded plans get one saved)."""
+    if doc.get("version"):
+        return doc
+    version = save_plan(user_id, doc["plan"], source="legacy")
+    return {**doc, "version": version, "source": "legacy", "rev": 0}
+
+def _at_rev(rev: int) -> Any:
+    return rev if rev else {"$in": [0, None]}
+
+def update_version(user_id: ObjectId, version: int, rev: int, update: Dict[str, Any]) -> Optional[int]:
+    """
+    Apply a Mongo update to one version only if it is still at `rev`
+    (optimistic concurrency); returns the new rev, or None on a conflict.
+    """
+    update = {k: dict(v) for k, v in update.items()}
+    update.setdefault("$set", {})["updatedAt"] = datetime.now(timezone.utc)
+    update.setdefault("$inc", {})["rev"] = 1
+    doc = db.mealplans.find_one_and_update(
+        {"user_id": user_id, "version": version, "rev": _at_rev(rev)},
+        update,
+        projection={"rev": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["rev"] if doc else None
+
+def set_meal(user_id: ObjectId, version: int, rev: int, pos: int, idx: int, meal: Dict[str, Any],
+             day_totals: Optional[Dict[str, float]] = None,
+             plan_totals: Optional[Dict[str, float]] = None) -> Optional[int]:
+    """
+    Replace meal `idx` of the day at index `pos` of plan.days in place (plus
+    that day's and the plan's totals when given), only if the version is
+    still at `rev`: pos and the totals come from the snapshot read at that
+    rev, and the guard keeps both valid. Returns the new rev, or None on a
+    conflict or if that meal does not exist (get_version tells which).
+    """
+    day_path = f"plan.days.{pos}"
+    sets: Dict[str, Any] = {f"{day_path}.meals.{idx}": meal, "updatedAt": datetime.now(timezone.utc)}
+    if day_totals is not None:
+        sets[f"{day_path}.totals"] = day_totals
+    if plan_totals is not None:
+        sets["plan.totals"] = plan_totals
+    doc = db.mealplans.find_one_and_update(
+        {"user_id": user_id, "version": version, "rev": _at_rev(rev),
+         f"{day_path}.meals.{idx}": {"$exists": True}},
+        {"$set": sets, "$inc": {"rev": 1}},
+        projection={"rev": 1},
+        return_document=ReturnDocument.AFTER,
+    )
+    return doc["rev"] if doc else None
+
+def plan_history(user_id: ObjectId, limit: int = 20) -> List[Dict[str, Any]]:
+    """Version metadata only; plan bodies are not fetched."""
+    cur = db.mealplans.find({"user_id": user_id}, {"version": 1, "source": 1, "createdAt": 1},
+                            sort=[("version", DESCENDING)], limit=limit)
+    return [{
+        "version": d["version"],
+        "source": d.get("source"),
+        "createdAt": d["createdAt"].isoformat() if d.get("createdAt") else None,
+    } for d in cur]
+
+def migrate_embedded_plans() -> int:
+    """Move user_prefs.meal_plan blobs into `mealplans`; returns how many moved."""
+    moved = 0
+    for doc in db.user_prefs.find({"meal_plan": {"$exists": True}}, {"user_id": 1, "meal_plan": 1}):
+        if doc.get("meal_plan") and not db.mealplans.find_one({"user_id": doc["user_id"]}, {"_id": 1}):
+            save_plan(doc["user_id"], doc["meal_plan"], source="legacy")
+            moved += 1
+        db.user_prefs.update_one({"_id": doc["_id"]}, {"$unset": {"meal_plan": ""}})
+    return moved
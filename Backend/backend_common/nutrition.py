@@ -0,0 +1,468 @@
+# backend_common/nutrition.py
+import bisect, csv, mmap, os, re, struct, threading
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from backend_common.recipes import norm_term
+
+try:  # optional: batch macro maths over the mapped columns
+    import numpy as np
+except ImportError:  # pragma: no cover
+    np = None
+
+# Local nutrition lookup. data/foods.csv (per-100 g values, USDA-style) is
+# compiled once into data/foods.bin, a columnar file that is memory-mapped
+# on load:
+#
+#   header  magic, row count, key count, csv size + mtime (staleness check)
+#   columns kcal, protein_g, carbs_g, fat_g, cup_g, unit_g   float32 x rows
+#   keys    food id per key (uint32), key offsets (uint32), utf-8 key blob
+#   names   name offsets (uint32), utf-8 name blob
+#
+# Keys are the normalized names and aliases. On load they go into a dict
+# (exact hits), a sorted list (prefix hits) and a trigram index (fuzzy
+# hits). Resolved queries are cached, so a repeated lookup is a dict probe
+# plus a few float reads.
+#
+#   python -m backend_common.nutrition      # benchmark
+
+_DATA = Path(__file__).resolve().parent.parent / "data"
+FOODS_CSV = Path(os.getenv("FOODS_CSV", _DATA / "foods.csv"))
+FOODS_BIN = Path(os.getenv("FOODS_BIN", FOODS_CSV.with_suffix(".bin")))
+
+_MAGIC = b"NUT1"
+_HEADER = struct.Struct("<4sIIQQ")  # magic, rows, keys, csv size, csv mtime_ns
+COLUMNS = ("kcal", "protein_g", "carbs_g", "fat_g", "cup_g", "unit_g")
+MACRO_KEYS = ("calories", "protein_g", "carbs_g", "fat_g")
+
+# How a food name was matched. CONFIDENT_MATCHES carry macros; an
+# "approximate" hit (part of the name, a loose spelling) only names the
+# nearest food as a suggestion and is reported as found=false, because
+# "rice milk" -> white rice or "water" -> tuna is worse than no answer.
+CONFIDENT_MATCHES = ("exact", "words", "prefix", "fuzzy")
+FUZZY_MIN_SCORE = 0.75   # Dice coefficient over trigrams ("brocoli" -> broccoli)
+APPROX_MIN_SCORE = 0.45  # below this nothing is suggested at all
+PREFIX_MIN_SCORE = 0.6   # typed share of the key ("chicken br" -> chicken breast)
+
+# ---------- normalization ----------
+
+_PUNCT = re.compile(r"[^a-z0-9\- ]+")
+# words that describe preparation or size, not the food
+_DESCRIPTORS = {
+    "fresh", "raw", "cooked", "chopped", "diced", "sliced", "minced", "grated", "shredded",
+    "boneless", "skinless", "grilled", "roasted", "baked", "steamed", "boiled", "frozen",
+    "canned", "organic", "large", "medium", "small", "plain", "lean", "extra", "of",
+    "finely", "thinly", "crumbled", "toasted", "whole", "a", "an", "some",
+    # cuts and forms (plural-folded, as norm_key leaves them)
+    "leave", "leaf", "strip", "piece", "floret", "cube", "cubed", "chunk", "wedge",
+    "scrambled", "poached", "halved", "peeled", "ripe", "drained", "rinsed",
+}
+
+def norm_key(s: str) -> str:
+    """Lowercase, drop punctuation, fold plurals word by word."""
+    return " ".join(norm_term(w) for w in _PUNCT.sub(" ", str(s).lower()).split())
+
+def _trigrams(key: str) -> set:
+    k = f"  {key} "
+    return {k[i:i + 3] for i in range(len(k) - 2)}
+
+# ---------- binary table ----------
+
+def _u32(values: Sequence[int]) -> bytes:
+    return struct.pack(f"<{len(values)}I", *values)
+
+def _blob(strings: Sequence[str]) -> Tuple[List[int], bytes]:
+    offsets, out, pos = [0], [], 0
+    for s in strings:
+        b = s.encode("utf-8")
+        out.append(b)
+        pos += len(b)
+        offsets.append(pos)
+    return offsets, b"".join(out)
+
+def _num(v: Any) -> float:
+    try:
+        return float(v) if str(v).strip() else 0.0
+    except ValueError:
+        return 0.0
+
+def compile_csv(csv_path: Path = FOODS_CSV) -> bytes:
+    """The binary table for a foods CSV."""
+    with open(csv_path, newline="", encoding="utf-8") as fh:
+        rows = list(csv.DictReader(fh))
+    names = [r["name"].strip() for r in rows]
+    keys: Dict[str, int] = {}
+    for i, r in enumerate(rows):
+        for k in [r["name"]] + (r.get("aliases") or "").split(";"):
+            k = norm_key(k)
+            if k and k not in keys:  # first food to claim a key keeps it
+                keys[k] = i
+
+    st = os.stat(csv_path)
+    parts = [_HEADER.pack(_MAGIC, len(rows), len(keys), st.st_size, st.st_mtime_ns)]
+    for col in COLUMNS:
+        parts.append(struct.pack(f"<{len(rows)}f", *(_num(r.get(col)) for r in rows)))
+    key_offsets, key_blob = _blob(list(keys))
+    parts += [_u32(list(keys.values())), _u32(key_offsets), key_blob]
+    name_offsets, name_blob = _blob(names)
+    parts += [_u32(name_offsets), name_blob]
+    return b"".join(parts)
+
+def _fresh(path: Path, csv_path: Path) -> bool:
+    try:
+        with open(path, "rb") as fh:
+            magic, _, _, size, mtime = _HEADER.unpack(fh.read(_HEADER.size))
+        st = os.stat(csv_path)
+        return magic == _MAGIC and size == st.st_size and mtime == st.st_mtime_ns
+    except (OSError, struct.error):
+        return False
+
+class FoodTable:
+    """Read-only view over a compiled table (mmap or bytes)."""
+
+    def __init__(self, buf):
+        self._buf = buf
+        mv = memoryview(buf)
+        magic, n, nk, _, _ = _HEADER.unpack_from(mv, 0)
+        if magic != _MAGIC:
+            raise ValueError("not a foods table")
+        pos = _HEADER.size
+
+        def take(nbytes: int) -> memoryview:
+            nonlocal pos
+            out = mv[pos:pos + nbytes]
+            pos += nbytes
+            return out
+
+        self.columns = {c: take(4 * n).cast("f") for c in COLUMNS}
+        key_ids = take(4 * nk).cast("I")
+        key_off = take(4 * (nk + 1)).cast("I")
+        key_blob = bytes(take(key_off[nk]))
+        name_off = take(4 * (n + 1)).cast("I")
+        name_blob = bytes(take(name_off[n]))
+
+        self.names = [name_blob[name_off[i]:name_off[i + 1]].decode("utf-8") for i in range(n)]
+        self.keys = {key_blob[key_off[j]:key_off[j + 1]].decode("utf-8"): key_ids[j] for j in range(nk)}
+        self.sorted_keys = sorted(self.keys)
+        self.by_trigram: Dict[str, List[str]] = {}
+        self.trigram_count: Dict[str, int] = {}
+        for k in self.keys:
+            grams = _trigrams(k)
+            self.trigram_count[k] = len(grams)
+            for g in grams:
+                self.by_trigram.setdefault(g, []).append(k)
+        self._arrays = None
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def per100(self, i: int) -> Tuple[float, float, float, float]:
+        c = self.columns
+        return (c["kcal"][i], c["protein_g"][i], c["carbs_g"][i], c["fat_g"][i])
+
+    def arrays(self):
+        """(rows x 4) macros per 100 g as a float64 numpy array, or None without numpy."""
+        if self._arrays is None and np is not None:
+            self._arrays = np.stack([np.frombuffer(self.columns[c], dtype=np.float32)
+                                     for c in COLUMNS[:4]], axis=1).astype(np.float64)
+        return self._arrays
+
+    # ---------- matching ----------
+
+    def _prefix(self, key: str) -> Optional[str]:
+        """Shortest known key that starts with `key` ("chicken br" -> "chicken breast")."""
+        j = bisect.bisect_left(self.sorted_keys, key)
+        best = None
+        while j < len(self.sorted_keys) and self.sorted_keys[j].startswith(key):
+            k = self.sorted_keys[j]
+            if best is None or len(k) < len(best):
+                best = k
+            j += 1
+        return best
+
+    def _fuzzy(self, key: str) -> Tuple[Optional[str], float]:
+        grams = _trigrams(key)
+        shared: Dict[str, int] = {}
+        for g in grams:
+            for k in self.by_trigram.get(g, ()):
+                shared[k] = shared.get(k, 0) + 1
+        best, score = None, 0.0
+        for k, s in shared.items():
+            dice = 2 * s / (len(grams) + self.trigram_count[k])
+            if dice > score or (dice == score and len(k) < len(best)):
+                best, score = k, dice
+        return best, score
+
+    def match(self, food: str) -> Optional[Tuple[int, str, float]]:
+        """
+        (food id, how, score) for a food name, or None.
+        how: exact | words (the name minus descriptors is a key: "grilled
+        chicken breast strips") | prefix | fuzzy | approximate (see
+        CONFIDENT_MATCHES).
+        """
+        key = norm_key(food)
+        if not key:
+            return None
+        if key in self.keys:
+            return self.keys[key], "exact", 1.0
+        words = [w for w in key.split() if w not in _DESCRIPTORS] or key.split()
+        name = " ".join(words)
+        if name in self.keys:
+            return self.keys[name], "words", 1.0
+        k = self._prefix(name)
+        if k and len(name) / len(k) >= PREFIX_MIN_SCORE:
+            return self.keys[k], "prefix", len(name) / len(k)
+        fk, fuzzy = self._fuzzy(name)
+        if fk and fuzzy >= FUZZY_MIN_SCORE:
+            return self.keys[fk], "fuzzy", round(fuzzy, 3)
+        # a key covering only part of the name ("ice cream" -> cream) is a
+        # different food as often as not: suggestion only
+        for size in range(len(words) - 1, 0, -1):
+            for start in range(len(words) - size + 1):
+                k = " ".join(words[start:start + size])
+                if k in self.keys:
+                    return self.keys[k], "approximate", round(size / len(words), 3)
+        if fk and fuzzy >= APPROX_MIN_SCORE:
+            return self.keys[fk], "approximate", round(fuzzy, 3)
+        return None
+
+# ---------- quantities ----------
+
+_FRACTIONS = {"½": 0.5, "¼": 0.25, "¾": 0.75, "⅓": 1 / 3, "⅔": 2 / 3}
+_QTY = r"(?:\d+\s+\d+/\d+|\d+/\d+|\d*\.\d+|\d+|[½¼¾⅓⅔])"
+_UNIT = (r"(?:kg|g|grams?|gr|oz|ounces?|lbs?|pounds?|ml|l|liters?|litres?|cups?|tbsps?|tablespoons?|"
+         r"tsps?|teaspoons?|pieces?|pcs?|slices?|servings?|cloves?|fillets?|scoops?|handful|cans?|tins?|pinch(?:es)?)")
+_ARTICLE = re.compile(r"^\s*an?\s+(?=\S)", re.I)  # "a pinch of salt", "an apple" -> one
+_LEADING = re.compile(rf"^\s*(?P<qty>{_QTY})?\s*(?P<unit>{_UNIT}\b)?\.?\s*(?:of\s+)?(?P<food>.*)$", re.I)
+_PAREN = re.compile(rf"[(,\s]\s*(?P<qty>{_QTY})\s*(?P<unit>{_UNIT}\b)?\.?\s*\)?\s*$", re.I)
+
+# grams per unit; cup/tbsp/tsp use the food's cup weight when it has one
+_GRAMS = {"g": 1, "gram": 1, "gr": 1, "kg": 1000, "oz": 28.35, "ounce": 28.35, "lb": 453.6, "pound": 453.6,
+          "ml": 1, "l": 1000, "liter": 1000, "litre": 1000, "handful": 30,
+          "can": 240, "tin": 240,  # drained weight of a standard 15 oz / 400 g can
+          "pinch": 0.4}
+_CUP_FRACTION = {"cup": 1.0, "tbsp": 1 / 16, "tablespoon": 1 / 16, "tsp": 1 / 48, "teaspoon": 1 / 48}
+_DEFAULT_CUP_G = 240.0
+_PIECES = {"piece", "pc", "slice", "serving", "clove", "fillet", "scoop"}
+DEFAULT_GRAMS = 100.0  # no quantity given: report per 100 g
+
+def _qty(s: Optional[str]) -> Optional[float]:
+    if not s:
+        return None
+    s = s.strip()
+    if s in _FRACTIONS:
+        return _FRACTIONS[s]
+    whole = 0.0
+    if " " in s:
+        w, s = s.split(None, 1)
+        whole = float(w)
+    if "/" in s:
+        a, b = s.split("/")
+        return whole + (float(a) / float(b) if float(b) else 0.0)
+    return whole + float(s)
+
+def _unit(u: Optional[str]) -> Optional[str]:
+    if not u:
+        return None
+    u = u.lower()
+    if u.endswith("s") and u not in ("lbs",) and len(u) > 2:
+        u = u[:-1]
+    return {"lbs": "lb", "tbsps": "tbsp", "tsps": "tsp", "pcs": "pc", "pinche": "pinch"}.get(u, u)
+
+def parse_quantity(text: str) -> Tuple[Optional[float], Optional[str], str]:
+    """("150 g chicken breast") -> (150.0, "g", "chicken breast"); also "brown rice (1 cup)"."""
+    s = str(text).strip()
+    m = _PAREN.search(s)
+    if m and m.start() > 0:
+        return _qty(m.group("qty")), _unit(m.group("unit")), s[:m.start()].strip(" ,")
+    m = _LEADING.match(_ARTICLE.sub("1 ", s, count=1))
+    if not m:
+        return None, None, s
+    return _qty(m.group("qty")), _unit(m.group("unit")), m.group("food").strip(" ,")
+
+def grams_for(table: FoodTable, i: int, qty: Optional[float], unit: Optional[str]) -> float:
+    """Weight in grams of `qty unit` of food i."""
+    if qty is None and unit is None:
+        return DEFAULT_GRAMS
+    q = 1.0 if qty is None else qty
+    if unit in _GRAMS:
+        return q * _GRAMS[unit]
+    if unit in _CUP_FRACTION:
+        cup = table.columns["cup_g"][i] or _DEFAULT_CUP_G
+        return q * cup * _CUP_FRACTION[unit]
+    # a count ("3 eggs", "2 slices bread"): use the food's unit weight
+    each = table.columns["unit_g"][i]
+    if each:
+        return q * each
+    return q * DEFAULT_GRAMS if unit in _PIECES or unit is None else q
+
+# ---------- loading ----------
+
+_table: Optional[FoodTable] = None
+_table_lock = threading.Lock()
+
+def _open_table(csv_path: Path = FOODS_CSV, bin_path: Path = FOODS_BIN) -> FoodTable:
+    if not _fresh(bin_path, csv_path):
+        data = compile_csv(csv_path)
+        try:
+            tmp = bin_path.with_name(f"{bin_path.name}.{os.getpid()}.tmp")  # concurrent builders don't collide
+            tmp.write_bytes(data)
+            os.replace(tmp, bin_path)
+        except OSError:  # read-only checkout: keep the table in memory
+            return FoodTable(data)
+    with open(bin_path, "rb") as fh:
+        return FoodTable(mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ))
+
+def get_table() -> FoodTable:
+    global _table
+    if _table is None:
+        with _table_lock:
+            if _table is None:
+                _table = _open_table()
+    return _table
+
+# ---------- lookups ----------
+
+@lru_cache(maxsize=8192)
+def resolve(text: str) -> Optional[Tuple[int, float, str, float]]:
+    """
+    (food id, grams, how, score) for one ingredient line, or None if unknown.
+    Check how against CONFIDENT_MATCHES before trusting the numbers.
+    """
+    table = get_table()
+    qty, unit, food = parse_quantity(text)
+    hit = table.match(food)
+    if hit is None:
+        return None
+    i, how, score = hit
+    return i, grams_for(table, i, qty, unit), how, score
+
+def _result(table: FoodTable, text: str, i: int, grams: float, how: str, score: float,
+            macros: Sequence[float]) -> Dict[str, Any]:
+    """macros: already rounded to 0.1."""
+    out = {"query": text, "found": True, "food": table.names[i], "grams": round(grams, 1),
+           "match": how, "score": round(score, 3)}
+    out.update(zip(MACRO_KEYS, macros))
+    return out
+
+def _not_found(table: FoodTable, text: str, hit) -> Dict[str, Any]:
+    if hit is None:
+        return {"query": text, "found": False}
+    return {"query": text, "found": False, "match": hit[2], "score": round(hit[3], 3),
+            "suggestion": table.names[hit[0]]}
+
+def confident(hit) -> bool:
+    """True for a resolve() hit whose macros can be used."""
+    return hit is not None and hit[2] in CONFIDENT_MATCHES
+
+@lru_cache(maxsize=8192)
+def _lookup(text: str) -> Dict[str, Any]:
+    hit = resolve(text)
+    table = get_table()
+    if not confident(hit):
+        return _not_found(table, text, hit)
+    i, grams, how, score = hit
+    return _result(table, text, i, grams, how, score, [round(v * grams / 100.0, 1) for v in table.per100(i)])
+
+def lookup(text: str) -> Dict[str, Any]:
+    """Calories and macros for one ingredient line ("1 cup brown rice")."""
+    return dict(_lookup(str(text)))
+
+def resolve_many(texts: Iterable[str]) -> Tuple[List[int], List[float], List[Optional[Tuple[int, float, str, float]]]]:
+    """
+    (food ids, grams) for the lines that resolved confidently, plus the
+    per-line hits (None = unknown; approximate hits included).
+    """
+    hits = [resolve(str(t)) for t in texts]
+    ids = [h[0] for h in hits if confident(h)]
+    grams = [h[1] for h in hits if confident(h)]
+    return ids, grams, hits
+
+def macros_for(ids: Sequence[int], grams: Sequence[float]):
+    """(len(ids) x 4) macros for the given foods and weights; numpy array when available."""
+    table = get_table()
+    per100 = table.arrays()
+    if per100 is not None:
+        return per100[np.asarray(ids, dtype=np.int64)] * (np.asarray(grams, dtype=np.float64)[:, None] / 100.0)
+    return [[v * g / 100.0 for v in table.per100(i)] for i, g in zip(ids, grams)]
+
+def lookup_many(texts: Sequence[str]) -> List[Dict[str, Any]]:
+    """lookup() for many lines at once; one vectorized scaling step for all hits."""
+    texts = [str(t) for t in texts]
+    ids, grams, hits = resolve_many(texts)
+    table = get_table()
+    rows = macros_for(ids, grams) if ids else []
+    if hasattr(rows, "tolist"):
+        rows = rows.tolist()
+    # Python's round, not np.round, so results match lookup() to the last digit
+    rows = iter([[round(v, 1) for v in r] for r in rows])
+    out = []
+    for text, hit in zip(texts, hits):
+        if not confident(hit):
+            out.append(_not_found(table, text, hit))
+        else:
+            i, g, how, score = hit
+            out.append(_result(table, text, i, g, how, score, next(rows)))
+    return out
+
+def totals(results: Iterable[Dict[str, Any]]) -> Dict[str, float]:
+    """Summed macros of the found lookup results."""
+    t = {k: 0.0 for k in MACRO_KEYS}
+    for r in results:
+        if r.get("found"):
+            for k in MACRO_KEYS:
+                t[k] += r[k]
+    return {k: round(v, 1) for k, v in t.items()}
+
+def split_items(text: str) -> List[str]:
+    """One ingredient per entry from "a; b", "a\\nb" or "a, b" lists (commas only between items)."""
+    parts = re.split(r"[;\n]+", str(text))
+    if len(parts) == 1 and "," in text and not _PAREN.search(text):
+        parts = text.split(",")
+    return [p.strip(" -*\t") for p in parts if p.strip(" -*\t")]
+
+_IN_TEXT = re.compile(rf"(?<![\w/.])(?P<line>{_QTY}(?!\s*(?:minutes?|mins?|hours?|hrs?|seconds?|degrees?|°)\b)\s*(?:{_UNIT}\b\.?)?\s*(?:of\s+)?"
+                      r"(?:(?!and\b|with\b|on\b|in\b|over\b|for\b|to\b|then\b)[a-z][a-z\-]*\s*){1,3})", re.I)
+
+def ingredients_in_text(text: str) -> List[str]:
+    """Quantified ingredients mentioned in free text ("Grill 150 g chicken breast with 1 cup rice")."""
+    return [m.group("line").strip() for m in _IN_TEXT.finditer(str(text or ""))]
+
+def has_quantity(text: str) -> bool:
+    qty, unit, _ = parse_quantity(text)
+    return qty is not None or unit is not None
+
+# ---------- benchmark ----------
+
+def _bench(runs: int = 20000):
+    import time
+    t0 = time.perf_counter()
+    table = get_table()
+    print(f"{len(table)} foods, {len(table.keys)} keys, loaded in {(time.perf_counter() - t0) * 1e3:.1f} ms")
+    queries = ["150 g chicken breast", "brown rice (1 cup)", "2 tbsp olive oil", "3 large eggs",
+               "1/2 cup rolled oats", "grilled salmon fillet", "brocoli", "greek yoghurt 200g",
+               "1 medium banana", "chiken thigh"]
+    for q in queries:
+        r = lookup(q)
+        print(f"  {q!r:26s} -> {r.get('food')!s:16s} {r.get('grams', 0):6.1f} g "
+              f"{r.get('calories', 0):6.1f} kcal ({r.get('match', 'miss')})")
+    resolve.cache_clear()
+    _lookup.cache_clear()
+    t0 = time.perf_counter()
+    for q in queries:
+        resolve(q)
+    cold = (time.perf_counter() - t0) * 1e6 / len(queries)
+    t0 = time.perf_counter()
+    for _ in range(runs // len(queries)):
+        for q in queries:
+            lookup(q)
+    warm = (time.perf_counter() - t0) * 1e6 / runs
+    t0 = time.perf_counter()
+    for _ in range(200):
+        lookup_many(queries * 5)
+    batch = (time.perf_counter() - t0) * 1e6 / (200 * len(queries) * 5)
+    print(f"uncached resolve {cold:.1f} us, cached lookup {warm:.2f} us, lookup_many {batch:.2f} us/item")
+
+if __name__ == "__main__":
+    _bench()
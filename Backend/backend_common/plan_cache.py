@@ -0,0 +1,143 @@
+# backend_common/plan_cache.py
+import copy, hashlib, json, os, threading, time
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Optional, Tuple
+from pymongo import ASCENDING
+
+from backend_common.envdb import db
+
+# Two-tier cache for generated meal plans:
+#   L1 - per-process LRU with TTL
+#   L2 - shared `mealplan_cache` collection (Mongo TTL index does the expiry)
+# Keys are content hashes of the normalized prefs + model id + prompt version,
+# so every user with the same profile shares one generation.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+CACHE_TTL_SECONDS = _env_int("MEALPLAN_CACHE_TTL_SECONDS", 7 * 86400)
+CACHE_MAX_ENTRIES = _env_int("MEALPLAN_CACHE_MAX_ENTRIES", 512)
+
+def normalize_prefs(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Only the fields that change the prompt, with the same defaults the prompt uses."""
+    def as_int(v, default):
+        try:
+            return int(float(v))
+        except Exception:
+            return default
+
+    excludes = prefs.get("exclude_ingredients") or []
+    if not isinstance(excludes, list):
+        excludes = [excludes]
+    return {
+        "calorie_target": as_int(prefs.get("calorie_target") or 2200, 2200),
+        "meals_per_day": as_int(prefs.get("meals_per_day") or 3, 3),
+        "diet": str(prefs.get("diet") or "balanced").strip().lower(),
+        "exclude_ingredients": sorted({str(x).strip().lower() for x in excludes if str(x).strip()}),
+    }
+
+def cache_key(prefs: Dict[str, Any], model_id: str, prompt_version: str) -> str:
+    canonical = json.dumps(
+        {"p": normalize_prefs(prefs), "m": model_id, "v": prompt_version},
+        sort_keys=True, separators=(",", ":"),
+    )
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+class PlanCache:
+    def __init__(self, ttl_seconds: int = CACHE_TTL_SECONDS, max_entries: int = CACHE_MAX_ENTRIES,
+                 collection: str = "mealplan_cache"):
+        self.ttl = ttl_seconds
+        self.max_entries = max_entries
+        self.collection = collection
+        self._lru: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._stats = {"hits_local": 0, "hits_shared": 0, "misses": 0, "stores": 0,
+                       "evictions": 0, "miss_seconds_total": 0.0}
+
+    def _coll(self):
+        return db[self.collection]
+
+    def ensure_indexes(self):
+        self._coll().create_index([("expiresAt", ASCENDING)], name="cache_ttl", expireAfterSeconds=0)
+
+    def _bump(self, key: str, n: float = 1):
+        with self._lock:
+            self._stats[key] += n
+
+    def _put_local(self, key: str, plan: Dict[str, Any]):
+        with self._lock:
+            self._lru[key] = (time.monotonic() + self.ttl, plan)
+            self._lru.move_to_end(key)
+            while len(self._lru) > self.max_entries:
+                self._lru.popitem(last=False)
+                self._stats["evictions"] += 1
+
+    def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Returns a private copy; callers may mutate it freely."""
+        with self._lock:
+            hit = self._lru.get(key)
+            if hit and hit[0] > time.monotonic():
+                self._lru.move_to_end(key)
+                self._stats["hits_local"] += 1
+                return copy.deepcopy(hit[1])
+            if hit:
+                del self._lru[key]
+
+        try:
+            doc = self._coll().find_one(
+                {"_id": key, "expiresAt": {"$gt": datetime.now(timezone.utc)}},
+                {"plan": 1},
+            )
+        except Exception as e:
+            print("Mealplan cache read failed:", e)
+            doc = None
+        if doc and isinstance(doc.get("plan"), dict):
+            self._put_local(key, doc["plan"])
+            self._bump("hits_shared")
+            return copy.deepcopy(doc["plan"])
+
+        self._bump("misses")
+        return None
+
+    def put(self, key: str, plan: Dict[str, Any], meta: Optional[Dict[str, Any]] = None):
+        plan = copy.deepcopy(plan)
+        self._put_local(key, plan)
+        now = datetime.now(timezone.utc)
+        try:
+            self._coll().replace_one(
+                {"_id": key},
+                {"plan": plan, "meta": meta or {}, "createdAt": now,
+                 "expiresAt": now + timedelta(seconds=self.ttl)},
+                upsert=True,
+            )
+        except Exception as e:
+            print("Mealplan cache write failed:", e)
+        self._bump("stores")
+
+    def record_miss_latency(self, seconds: float):
+        """Time spent generating after a miss; used to estimate what hits save."""
+        self._bump("miss_seconds_total", float(seconds))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            s = dict(self._stats)
+            s["local_entries"] = len(self._lru)
+        hits = s["hits_local"] + s["hits_shared"]
+        lookups = hits + s["misses"]
+        avg_miss = s["miss_seconds_total"] / s["stores"] if s["stores"] else 0.0
+        s.update({
+            "hits": hits,
+            "hit_rate": round(hits / lookups, 4) if lookups else 0.0,
+            "avg_generation_seconds": round(avg_miss, 3),
+            "est_seconds_saved": round(hits * avg_miss, 1),
+            "llm_calls_saved": hits,
+            "ttl_seconds": self.ttl,
+            "max_entries": self.max_entries,
+        })
+        return s
+
+plan_cache = PlanCache()
@@ -0,0 +1,180 @@
+# backend_common/plan_schema.py
+import math
+from typing import Any, Dict, List, Optional
+
+# Shape every stored plan follows, whoever produced it (model, local engine,
+# cache, manual save, patch, single-meal swap):
+#
+#   {"days": [{"day": 1,
+#              "meals": [{"name", "calories", "protein_g", "carbs_g", "fat_g", "recipe_text", ...}],
+#              "totals": {"calories", "protein_g", "carbs_g", "fat_g"}}],
+#    "totals": {... whole plan ...},
+#    "notes": ["..."]}            optional: what the planner could not honour
+#
+# normalize_plan() validates, coerces and sums in one pass and returns new
+# dicts (inputs are not mutated), so readers use the stored totals instead
+# of re-adding meals.
+
+MACRO_KEYS = ("calories", "protein_g", "carbs_g", "fat_g")
+# optional meal fields carried through as-is when present
+_EXTRA_KEYS = ("servings", "ingredients", "audit", "image")
+
+class PlanValidationError(ValueError):
+    """The plan (or a day/meal of it) does not have the stored shape."""
+
+def _num(v: Any) -> float:
+    if v is None or v == "":
+        return 0.0
+    if isinstance(v, (int, float)) and not isinstance(v, bool):
+        f = float(v)
+    else:
+        try:
+            f = float(str(v).strip().split()[0].rstrip("gkcal"))  # "450", "450 kcal", "32g"
+        except (ValueError, IndexError):
+            return 0.0
+    return round(f, 1) if math.isfinite(f) and f >= 0 else 0.0
+
+def normalize_meal(m: Any) -> Dict[str, Any]:
+    if not isinstance(m, dict):
+        raise PlanValidationError("a meal is not an object")
+    out = {
+        "name": str(m.get("name") or "Meal"),
+        "calories": _num(m.get("calories")),
+        "protein_g": _num(m.get("protein_g")),
+        "carbs_g": _num(m.get("carbs_g")),
+        "fat_g": _num(m.get("fat_g")),
+        "recipe_text": str(m.get("recipe_text") or ""),
+    }
+    for k in _EXTRA_KEYS:
+        if k in m:
+            out[k] = m[k]
+    if isinstance(out.get("ingredients"), list):
+        out["ingredients"] = [str(x) for x in out["ingredients"] if isinstance(x, (str, int, float))]
+    elif "ingredients" in out:
+        del out["ingredients"]
+    return out
+
+def _zero() -> Dict[str, float]:
+    return {k: 0.0 for k in MACRO_KEYS}
+
+def _rounded(t: Dict[str, float]) -> Dict[str, float]:
+    return {k: round(v, 1) for k, v in t.items()}
+
+def normalize_day(d: Any, day: Optional[int] = None) -> Dict[str, Any]:
+    """One day with coerced meals and its totals; raises PlanValidationError."""
+    if not isinstance(d, dict) or not isinstance(d.get("meals"), list) or not d["meals"]:
+        raise PlanValidationError("a day is missing meals")
+    meals = [normalize_meal(m) for m in d["meals"]]
+    totals = _zero()
+    for m in meals:
+        for k in MACRO_KEYS:
+            totals[k] += m[k]
+    if day is None:
+        try:
+            day = int(d.get("day"))
+        except (TypeError, ValueError):
+            raise PlanValidationError("a day has no day number")
+    return {"day": day, "meals": meals, "totals": _rounded(totals)}
+
+def normalize_plan(plan: Any, days: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Validated copy of a plan with per-day and whole-plan totals.
+    days: required number of days (None = any, at least one). Days without a
+    usable number are numbered by position.
+    """
+    if not isinstance(plan, dict) or not isinstance(plan.get("days"), list) or not plan["days"]:
+        raise PlanValidationError("plan has no days")
+    if days is not None and len(plan["days"]) != days:
+        raise PlanValidationError(f"plan has {len(plan['days'])} days, expected {days}")
+
+    out_days: List[Dict[str, Any]] = []
+    totals = _zero()
+    for pos, d in enumerate(plan["days"], start=1):
+        n = d.get("day") if isinstance(d, dict) else None
+        if isinstance(n, str) and n.strip().isdigit():
+            n = int(n)
+        day = normalize_day(d, n if isinstance(n, int) and not isinstance(n, bool) else pos)
+        for k in MACRO_KEYS:
+            totals[k] += day["totals"][k]
+        out_days.append(day)
+    out = {"days": out_days, "totals": _rounded(totals)}
+    if isinstance(plan.get("notes"), list) and plan["notes"]:
+        out["notes"] = [str(n) for n in plan["notes"]]
+    return out
+
+def with_totals(plan: Dict[str, Any]) -> Dict[str, Any]:
+    """normalize_plan for plans that may predate stored totals; returns them unchanged if broken."""
+    try:
+        return normalize_plan(plan)
+    except PlanValidationError:
+        return plan
+
+# ---------- keeping totals right under partial updates ----------
+
+def _at(doc: Any, parts: List[str]) -> Any:
+    for p in parts:
+        doc = doc[int(p)] if isinstance(doc, list) else doc[p]
+    return doc
+
+def refresh_update(plan: Dict[str, Any], update: Dict[str, Any], root: str = "plan") -> Dict[str, Any]:
+    """
+    Given the normalized plan after an edit and the partial Mongo update that
+    made the edit, return an update whose written values are the normalized
+    ones and which also refreshes the totals of every touched day and of the
+    plan. Client-written totals are dropped (they are derived).
+    """
+    prefix = root + "."
+    sets: Dict[str, Any] = {}
+    unsets: Dict[str, Any] = {}
+    pushes: Dict[str, Any] = {}
+    touched_days = set()
+    whole_plan = whole_days = False
+
+    for op, fields in update.items():
+        for path, value in fields.items():
+            if path == root:
+                whole_plan = True
+                continue
+            if not path.startswith(prefix):
+                (sets if op == "$set" else unsets if op == "$unset" else pushes)[path] = value
+                continue
+            parts = path[len(prefix):].split(".")
+            if parts[0] == "totals" or (len(parts) >= 3 and parts[0] == "days" and parts[2] == "totals"):
+                continue
+            if parts == ["days"]:
+                whole_days = True
+                continue
+            if parts[0] == "days" and len(parts) >= 2:
+                touched_days.add(int(parts[1]))
+            try:
+                current = _at(plan, parts)
+            except (KeyError, IndexError, ValueError, TypeError):
+                if op != "$unset":
+                    raise PlanValidationError(f"{path[len(prefix):]} is not part of a meal plan")
+                unsets[path] = ""  # an optional field really went away
+                continue
+            if op == "$push":
+                pushes[path] = {"$each": current[len(current) - len(value["$each"]):]}
+            else:
+                sets[path] = current  # required fields that were removed come back normalized
+
+    if whole_plan:
+        return {"$set": {root: plan}}
+    if whole_days:
+        others = {k: v for k, v in sets.items() if not k.startswith(prefix)}
+        return {"$set": {**others, prefix + "days": plan["days"], prefix + "totals": plan["totals"]}}
+
+    for i in sorted(touched_days):
+        day_path = f"{prefix}days.{i}"
+        if day_path in sets:
+            sets[day_path] = plan["days"][i]  # already carries its totals
+        else:
+            sets[day_path + ".totals"] = plan["days"][i]["totals"]
+    sets[prefix + "totals"] = plan["totals"]
+
+    out: Dict[str, Any] = {"$set": sets}
+    if unsets:
+        out["$unset"] = unsets
+    if pushes:
+        out["$push"] = pushes
+    return out
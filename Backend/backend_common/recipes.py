@@ -0,0 +1,166 @@
+# backend_common/recipes.py
+import csv, os, threading
+from array import array
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Recipe catalog for the local planner. Loaded once per process from
+# data/recipes.csv into parallel arrays (one slot per recipe id) plus
+# inverted indexes. Index values are Python ints used as bitsets - bit i is
+# recipe i - so filters are a handful of AND/OR/NOT operations.
+
+RECIPES_CSV = Path(os.getenv("RECIPES_CSV", Path(__file__).resolve().parent.parent / "data" / "recipes.csv"))
+
+SLOTS = ("breakfast", "lunch", "dinner", "snack")
+
+# Common ways people write an exclusion -> catalog allergen tag
+ALLERGEN_ALIASES = {
+    "milk": "dairy", "lactose": "dairy", "cheese": "dairy",
+    "egg": "eggs",
+    "nut": "tree nuts", "nuts": "tree nuts", "tree nut": "tree nuts",
+    "peanut": "peanuts",
+    "seafood": "shellfish", "shrimp": "shellfish", "prawn": "shellfish", "crab": "shellfish",
+    "wheat": "gluten",
+    "soya": "soy",
+}
+
+class NoRecipesError(ValueError):
+    """No recipe in the catalog avoids every exclusion."""
+
+def norm_term(s: str) -> str:
+    """Lowercase, trim, and fold simple plurals so 'Eggs'/'egg' and 'tomatoes'/'tomato' match."""
+    t = " ".join(str(s).lower().split())
+    if len(t) > 4 and t.endswith("oes"):
+        return t[:-2]
+    if len(t) > 3 and t.endswith("s") and not t.endswith("ss"):
+        return t[:-1]
+    return t
+
+def _split(cell: str) -> List[str]:
+    return [x.strip().lower() for x in (cell or "").split(";") if x.strip()]
+
+class RecipeCatalog:
+    def __init__(self, rows: Iterable[Dict[str, str]]):
+        self.names: List[str] = []
+        self.recipe_text: List[str] = []
+        self.calories = array("f")
+        self.protein_g = array("f")
+        self.carbs_g = array("f")
+        self.fat_g = array("f")
+        self.prep_minutes = array("H")
+        self.slot = array("B")  # index into SLOTS
+
+        self.by_slot: Dict[str, int] = {}
+        self.by_diet: Dict[str, int] = {}
+        self.by_cuisine: Dict[str, int] = {}
+        self.by_allergen: Dict[str, int] = {}
+        self.by_ingredient: Dict[str, int] = {}
+
+        for row in rows:
+            self._add(row)
+        self.all = (1 << len(self.names)) - 1
+
+    def _index(self, idx: Dict[str, int], key: str, bit: int):
+        idx[key] = idx.get(key, 0) | bit
+
+    def _add(self, row: Dict[str, str]):
+        i = len(self.names)
+        bit = 1 << i
+        slot = (row.get("slot") or "dinner").strip().lower()
+        self.names.append(row["name"].strip())
+        self.recipe_text.append((row.get("recipe_text") or "").strip())
+        self.calories.append(float(row["calories"]))
+        self.protein_g.append(float(row["protein_g"]))
+        self.carbs_g.append(float(row["carbs_g"]))
+        self.fat_g.append(float(row["fat_g"]))
+        self.prep_minutes.append(int(float(row.get("prep_minutes") or 0)))
+        self.slot.append(SLOTS.index(slot) if slot in SLOTS else SLOTS.index("dinner"))
+
+        self._index(self.by_slot, slot, bit)
+        self._index(self.by_cuisine, (row.get("cuisine") or "").strip().lower(), bit)
+        diets = set(_split(row.get("diets")))
+        if "vegetarian" in diets or "vegan" in diets:
+            diets.update(("vegetarian", "pescatarian"))  # looser diets accept stricter recipes
+        for d in diets:
+            self._index(self.by_diet, d, bit)
+        for a in _split(row.get("allergens")):
+            self._index(self.by_allergen, a, bit)
+        for ing in _split(row.get("ingredients")):
+            # whole ingredient and each word, so "chicken" excludes "chicken breast"
+            self._index(self.by_ingredient, norm_term(ing), bit)
+            for word in ing.split():
+                self._index(self.by_ingredient, norm_term(word), bit)
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    # ---------- queries ----------
+
+    def excluded_mask(self, excludes: Iterable[str]) -> int:
+        """Recipes hit by any exclusion (allergen tag or ingredient word)."""
+        mask = 0
+        for raw in excludes:
+            term = norm_term(raw)
+            if not term:
+                continue
+            for key in {term, str(raw).strip().lower(), ALLERGEN_ALIASES.get(term, "")}:
+                if key:
+                    mask |= self.by_allergen.get(key, 0) | self.by_ingredient.get(key, 0)
+        return mask
+
+    def diet_mask(self, diet: Optional[str]) -> Optional[int]:
+        """Recipes tagged with diet; None when the diet restricts nothing (balanced, unknown)."""
+        d = (diet or "").strip().lower()
+        if d and d not in ("balanced", "none", "any"):
+            return self.by_diet.get(d)
+        return None
+
+    def filter(self, slot: Optional[str] = None, diet: Optional[str] = None,
+               excludes: Iterable[str] = (), max_prep_minutes: Optional[int] = None) -> int:
+        """
+        Bitset of usable recipes. Exclusions are hard: a slot they empty
+        borrows compliant recipes from the other slots, and NoRecipesError is
+        raised when none are left anywhere. The diet borrows the same way;
+        only when no recipe of that diet avoids the exclusions is it dropped,
+        and callers check the result against diet_mask (plan_week notes it).
+        Prep time is relaxed last when it would leave nothing.
+        """
+        excluded = self.excluded_mask(excludes)
+        usable = self.all & ~excluded
+        if not usable:
+            raise NoRecipesError("no recipe avoids all of the excluded ingredients")
+        base = self.by_slot.get(slot, 0) if slot else self.all
+        allowed = (base & usable) or usable
+
+        compliant = self.diet_mask(diet)
+        if compliant is not None:
+            allowed = (allowed & compliant) or (usable & compliant) or allowed
+
+        if max_prep_minutes:
+            quick = 0
+            for i in iter_bits(allowed):
+                if self.prep_minutes[i] <= max_prep_minutes:
+                    quick |= 1 << i
+            allowed = quick or allowed
+        return allowed
+
+    def macros(self, i: int) -> tuple:
+        return (self.calories[i], self.protein_g[i], self.carbs_g[i], self.fat_g[i])
+
+def iter_bits(mask: int) -> Iterator[int]:
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+_catalog: Optional[RecipeCatalog] = None
+_catalog_lock = threading.Lock()
+
+def get_catalog() -> RecipeCatalog:
+    global _catalog
+    if _catalog is None:
+        with _catalog_lock:
+            if _catalog is None:
+                with open(RECIPES_CSV, newline="", encoding="utf-8") as fh:
+                    _catalog = RecipeCatalog(csv.DictReader(fh))
+    return _catalog
@@ -1,8 +1,90 @@
 # backend_common/security.py
+import os, re, threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional
 import bcrypt
 
-def hash_password(plain: str) -> str:
-    return bcrypt.hashpw(plain.encode("utf-8"), bcrypt.gensalt(rounds=12)).decode("utf-8")
+# bcrypt is pure CPU (~250ms at cost 12), so it runs on a small process pool
+# instead of the request thread. At most BCRYPT_MAX_PENDING hashes may be
+# queued or running; beyond that callers get HashingBusy (routes send 429).
+# A hash that takes longer than BCRYPT_TIMEOUT_SECONDS raises HashingTimeout,
+# a HashingBusy, so the same handlers turn it into 503 + Retry-After.
+# BCRYPT_WORKERS=0 hashes inline, as before.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+BCRYPT_ROUNDS = min(31, max(4, _env_int("BCRYPT_ROUNDS", 12)))
+BCRYPT_WORKERS = max(0, _env_int("BCRYPT_WORKERS", min(4, os.cpu_count() or 1)))
+BCRYPT_MAX_PENDING = max(1, _env_int("BCRYPT_MAX_PENDING", max(1, BCRYPT_WORKERS) * 8))
+BCRYPT_TIMEOUT_SECONDS = _env_int("BCRYPT_TIMEOUT_SECONDS", 10)
+
+_COST_RE = re.compile(r"^\$2[abxy]?\$(\d{2})\$")
+
+class HashingBusy(Exception):
+    """The hashing pool is saturated; the caller should retry later."""
+
+class HashingTimeout(HashingBusy):
+    """A hash did not finish within BCRYPT_TIMEOUT_SECONDS (workers overloaded)."""
+
+# module-level so they can be pickled into worker processes
+def _hashpw(plain: bytes, rounds: int) -> bytes:
+    return bcrypt.hashpw(plain, bcrypt.gensalt(rounds=rounds))
+
+def _checkpw(plain: bytes, hashed: bytes) -> bool:
+    return bcrypt.checkpw(plain, hashed)
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(BCRYPT_MAX_PENDING)
+
+def _get_pool() -> ProcessPoolExecutor:
+    """Created lazily, and again after a fork (e.g. gunicorn --preload)."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ProcessPoolExecutor(max_workers=BCRYPT_WORKERS)
+            _pool_pid = os.getpid()
+        return _pool
+
+def _reset_pool():
+    global _pool
+    with _pool_lock:
+        _pool = None
+
+def _run(fn, *args):
+    if BCRYPT_WORKERS <= 0:
+        return fn(*args)
+    if not _slots.acquire(blocking=False):
+        raise HashingBusy("password hashing is saturated")
+    try:
+        fut = _get_pool().submit(fn, *args)
+        try:
+            return fut.result(timeout=BCRYPT_TIMEOUT_SECONDS)
+        except FutureTimeout:
+            fut.cancel()  # drops it if still queued; a running hash finishes unobserved
+            raise HashingTimeout(f"password hashing took over {BCRYPT_TIMEOUT_SECONDS}s")
+        except BrokenProcessPool:
+            _reset_pool()
+            return fn(*args)
+    finally:
+        _slots.release()
+
+def hash_password(plain: str, rounds: Optional[int] = None) -> str:
+    return _run(_hashpw, plain.encode("utf-8"), rounds or BCRYPT_ROUNDS).decode("utf-8")
 
 def verify_password(plain: str, hashed: str) -> bool:
-    return bcrypt.checkpw(plain.encode("utf-8"), hashed.encode("utf-8"))
+    return _run(_checkpw, plain.encode("utf-8"), hashed.encode("utf-8"))
+
+def hash_cost(hashed: str) -> Optional[int]:
+    m = _COST_RE.match(hashed or "")
+    return int(m.group(1)) if m else None
+
+def needs_rehash(hashed: str) -> bool:
+    """True when the stored hash was made with a different cost than BCRYPT_ROUNDS."""
+    return hash_cost(hashed) != BCRYPT_ROUNDS
@@ -0,0 +1,190 @@
+# backend_common/swarm_planner.py
+import os, threading, time
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from backend_common import agent_pool, nutrition
+
+# Multi-agent meal-plan backend (MEALPLAN_BACKEND=swarm). A Strands Swarm of
+# a Nutrition agent (local nutrition_lookup_tool) and a Planner agent that
+# hands back the plan JSON; the caller parses it like any single-prompt
+# reply, so the swarm sits behind the same interface as the Strands backend.
+#
+# Building agents and a Swarm is not free and a Swarm runs one task at a
+# time, so whole swarms are pooled like agent_pool's agents: leased for one
+# generation, reset, and returned (at most SWARM_POOL_MAX_IDLE per model).
+#
+# Every run records per-agent wall time and token usage; stats() returns
+# the running totals (GET /mealplans/backends/stats, bench_backends.py).
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+MAX_IDLE = max(0, _env_int("SWARM_POOL_MAX_IDLE", 4))
+MAX_HANDOFFS = max(1, _env_int("SWARM_MAX_HANDOFFS", 6))
+TIMEOUT_SECONDS = max(1, _env_int("SWARM_TIMEOUT_SECONDS", 300))
+
+NUTRITION_PROMPT = (
+    "You are Nutrition Agent. Given dishes or ingredients, return calories and macros. "
+    "Call nutrition_lookup_tool ONCE with all ingredients separated by ';' and with quantities "
+    "(e.g. '150 g chicken breast; 1 cup brown rice'), then hand off to PlannerAgent with the numbers."
+)
+PLANNER_PROMPT = (
+    "You are Planner Agent. Build the requested meal plan so every day meets the calorie target and "
+    "respects the restrictions. Hand off to NutritionAgent if you need ingredient numbers. "
+    "Your final answer must be STRICT JSON ONLY in exactly the schema of the task: "
+    "no markdown, no code fences, no explanations."
+)
+
+def nutrition_lookup_tool(query: str) -> Dict[str, Any]:
+    """
+    Calories and macros for one or more ingredients, e.g.
+    "150 g chicken breast; 1 cup brown rice; 2 tbsp olive oil".
+    Items without a quantity are per 100 g. Unknown items, and names that only
+    partly match a known food, come back with found=false (plus a suggestion).
+    """
+    items = nutrition.lookup_many(nutrition.split_items(query))
+    return {"items": items, "totals": nutrition.totals(items)}
+
+def _as_tool(fn):
+    try:
+        from strands import tool
+    except ImportError:  # older strands: plain callables are accepted
+        return fn
+    return tool(fn)
+
+def _build_swarm(model_id: str, region: str):
+    from strands import Agent
+    from strands.multiagent import Swarm
+
+    def model():
+        return agent_pool.bedrock_model(model_id, region)  # pooled session and client
+
+    nutrition_agent = Agent(name="NutritionAgent", system_prompt=NUTRITION_PROMPT, model=model(),
+                            tools=[_as_tool(nutrition_lookup_tool)])
+    planner = Agent(name="PlannerAgent", system_prompt=PLANNER_PROMPT, model=model())
+    with _lock:
+        _stats["swarms_created"] += 1
+    # the planner starts (and usually finishes); nutrition is consulted on demand.
+    # Calorie/macro targets arrive precomputed (backend_common.intake), so
+    # there is no intake agent.
+    return Swarm([planner, nutrition_agent], max_handoffs=MAX_HANDOFFS,
+                 execution_timeout=float(TIMEOUT_SECONDS))
+
+# ---------- pool ----------
+
+_lock = threading.Lock()
+_idle: Dict[Tuple[str, str], List[Any]] = {}
+_stats: Dict[str, Any] = {"runs": 0, "failures": 0, "swarms_created": 0, "swarms_reused": 0,
+                          "wall_ms_total": 0.0, "tokens_in": 0, "tokens_out": 0}
+_agent_stats: Dict[str, Dict[str, float]] = {}
+
+def _reset(swarm):
+    for node in getattr(swarm, "nodes", {}).values():
+        reset = getattr(node, "reset_executor_state", None)
+        if reset:
+            reset()
+        else:
+            agent_pool._reset_agent(getattr(node, "executor", None))
+
+@contextmanager
+def lease(model_id: str, region: Optional[str] = None):
+    """Borrow a built swarm for one task; it goes back to the pool afterwards."""
+    key = (model_id, region or agent_pool.default_region())
+    swarm = None
+    with _lock:
+        idle = _idle.get(key)
+        if idle:
+            swarm = idle.pop()
+            _stats["swarms_reused"] += 1
+    if swarm is None:
+        swarm = _build_swarm(*key)
+    yield swarm  # an exception here skips the return below: a failed swarm is not recycled
+    _reset(swarm)
+    with _lock:
+        idle = _idle.setdefault(key, [])
+        if len(idle) < MAX_IDLE:
+            idle.append(swarm)
+
+# ---------- results and accounting ----------
+
+def _usage(obj) -> Tuple[int, int]:
+    u = getattr(obj, "accumulated_usage", None) or {}
+    return int(u.get("inputTokens", 0) or 0), int(u.get("outputTokens", 0) or 0)
+
+def final_text(result) -> str:
+    """Text of the last agent that ran (the planner's JSON, normally)."""
+    history = getattr(result, "node_history", None) or []
+    results = getattr(result, "results", None) or {}
+    for node in reversed(history):
+        node_result = results.get(getattr(node, "node_id", None))
+        inner = getattr(node_result, "result", None)
+        if inner is not None and not isinstance(inner, Exception):
+            return str(inner)
+    return str(result)
+
+def record(result, wall_ms: float) -> Dict[str, Any]:
+    """Fold one run into the running stats; returns that run's per-agent numbers."""
+    run: Dict[str, Any] = {"wall_ms": round(wall_ms, 1), "agents": {}}
+    tin, tout = _usage(result)
+    for name, node_result in (getattr(result, "results", None) or {}).items():
+        nin, nout = _usage(node_result)
+        run["agents"][name] = {"ms": float(getattr(node_result, "execution_time", 0) or 0),
+                               "tokens_in": nin, "tokens_out": nout}
+    run["handoffs"] = [getattr(n, "node_id", str(n)) for n in (getattr(result, "node_history", None) or [])]
+    run["tokens_in"], run["tokens_out"] = tin, tout
+    with _lock:
+        _stats["runs"] += 1
+        _stats["wall_ms_total"] += wall_ms
+        _stats["tokens_in"] += tin
+        _stats["tokens_out"] += tout
+        for name, a in run["agents"].items():
+            s = _agent_stats.setdefault(name, {"calls": 0, "ms_total": 0.0, "tokens_in": 0, "tokens_out": 0})
+            s["calls"] += 1
+            s["ms_total"] += a["ms"]
+            s["tokens_in"] += a["tokens_in"]
+            s["tokens_out"] += a["tokens_out"]
+    return run
+
+def _failed():
+    with _lock:
+        _stats["failures"] += 1
+
+# ---------- entry points ----------
+
+def run(model_id: str, task: str, region: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """(final reply text, per-run stats) for one task."""
+    started = time.monotonic()
+    try:
+        with lease(model_id, region) as swarm:
+            result = swarm(task)
+    except Exception:
+        _failed()
+        raise
+    return final_text(result), record(result, (time.monotonic() - started) * 1e3)
+
+async def run_async(model_id: str, task: str, region: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+    """Async twin of run()."""
+    started = time.monotonic()
+    try:
+        with lease(model_id, region) as swarm:
+            result = await swarm.invoke_async(task)
+    except Exception:
+        _failed()
+        raise
+    return final_text(result), record(result, (time.monotonic() - started) * 1e3)
+
+def stats() -> Dict[str, Any]:
+    with _lock:
+        out = dict(_stats)
+        out["idle_swarms"] = sum(len(v) for v in _idle.values())
+        agents = {name: dict(s) for name, s in _agent_stats.items()}
+    runs = out["runs"] or 1
+    out["wall_ms_avg"] = round(out.pop("wall_ms_total") / runs, 1)
+    for s in agents.values():
+        s["ms_avg"] = round(s.pop("ms_total") / (s["calls"] or 1), 1)
+    out["agents"] = agents
+    return out
@@ -0,0 +1,81 @@
+# backend_common/user_state.py
+import os, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+from bson import ObjectId
+
+from backend_common.envdb import db
+
+# Small per-process cache of the user fields /auth/refresh needs to decide
+# whether a refresh token is still honoured: tokenVersion, loginDisabled,
+# plus email/roles for minting. Entries live USER_STATE_TTL_SECONDS, which
+# bounds how long a revocation made on another worker can go unnoticed.
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+USER_STATE_TTL_SECONDS = max(0, _env_int("USER_STATE_TTL_SECONDS", 60))
+USER_STATE_MAX = max(1, _env_int("USER_STATE_MAX", 10000))
+
+_FIELDS = {"email": 1, "roles": 1, "tokenVersion": 1, "meta.loginDisabled": 1}
+
+_cache: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0}
+
+def _load(sub: str) -> Optional[Dict[str, Any]]:
+    try:
+        oid = ObjectId(sub)
+    except Exception:
+        return None
+    u = db.users.find_one({"_id": oid}, _FIELDS)
+    if not u:
+        return None
+    return {
+        "_id": u["_id"],
+        "email": u.get("email"),
+        "roles": u.get("roles", []),
+        "tokenVersion": int(u.get("tokenVersion", 0) or 0),
+        "loginDisabled": bool((u.get("meta") or {}).get("loginDisabled", False)),
+    }
+
+def get_user_state(sub: str) -> Optional[Dict[str, Any]]:
+    """Cached user state by token subject; None if the user does not exist."""
+    now = time.monotonic()
+    with _lock:
+        hit = _cache.get(sub)
+        if hit and hit[0] > now:
+            _cache.move_to_end(sub)
+            _stats["hits"] += 1
+            return hit[1]
+        _stats["misses"] += 1
+
+    state = _load(sub)
+    if USER_STATE_TTL_SECONDS:
+        with _lock:
+            _cache[sub] = (now + USER_STATE_TTL_SECONDS, state)
+            _cache.move_to_end(sub)
+            while len(_cache) > USER_STATE_MAX:
+                _cache.popitem(last=False)
+    return state
+
+def invalidate_user_state(sub: str):
+    with _lock:
+        _cache.pop(str(sub), None)
+
+def revoke_tokens(user_id: ObjectId):
+    """Invalidate every outstanding refresh token for a user (password change, logout-all)."""
+    db.users.update_one({"_id": user_id}, {"$inc": {"tokenVersion": 1}})
+    invalidate_user_state(str(user_id))
+
+def user_state_stats() -> Dict[str, Any]:
+    with _lock:
+        s = dict(_stats)
+        s["size"] = len(_cache)
+    lookups = s["hits"] + s["misses"]
+    s["hit_rate"] = round(s["hits"] / lookups, 4) if lookups else 0.0
+    s["ttl_seconds"] = USER_STATE_TTL_SECONDS
+    return s
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+"""
+Regenerate meal plans for many users at once (the nightly "everyone's week" run).
+
+Instead of one POST /mealplans/generate per user (prefs read, model call and
+write each), this:
+  - reads every user's prefs through one projected cursor,
+  - fills unset calorie/macro targets from body profiles in one vectorized pass,
+  - generates once per distinct preference profile,
+  - fans the distinct profiles out over a bounded thread pool, with a
+    per-model requests-per-minute limit on Bedrock calls,
+  - writes the new plan versions with one bulk_write per batch.
+
+Usage:
+  python batch_generate.py                          # every user with prefs
+  python batch_generate.py --limit 1000 --workers 16 --rpm 120
+  python batch_generate.py --user-ids ids.txt       # one ObjectId per line
+  python batch_generate.py --dry-run                # count profiles, write nothing
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Dict, List
+
+from bson import ObjectId
+
+from backend_common.envdb import db
+from backend_common import intake, mealplans
+from routes_prefs_meals import PREFS_PROJECTION, _prefs_from_doc, generate_plan
+
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
+
+BATCH_WORKERS = max(1, _env_int("BATCH_WORKERS", 8))
+BATCH_MODEL_RPM = max(0, _env_int("BATCH_MODEL_RPM", 60))   # 0 = unlimited
+BATCH_WRITE_SIZE = max(1, _env_int("BATCH_WRITE_SIZE", 500))
+
+class RateLimiter:
+    """Token bucket per model id: at most `rpm` calls a minute, bursts up to `burst`."""
+
+    def __init__(self, rpm: int, burst: int = 1):
+        self.rpm = rpm
+        self.burst = max(1, burst)
+        self._buckets: Dict[str, List[float]] = {}  # model_id -> [tokens, last refill]
+        self._lock = threading.Lock()
+
+    def acquire(self, model_id: str):
+        if self.rpm <= 0:
+            return
+        rate = self.rpm / 60.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                bucket = self._buckets.setdefault(model_id, [float(self.burst), now])
+                bucket[0] = min(self.burst, bucket[0] + (now - bucket[1]) * rate)
+                bucket[1] = now
+                if bucket[0] >= 1.0:
+                    bucket[0] -= 1.0
+                    return
+                delay = (1.0 - bucket[0]) / rate
+            time.sleep(delay)
+
+def profile_key(prefs: Dict[str, Any]) -> str:
+    """Users with the same key get the same plan (every field generation reads)."""
+    canonical = json.dumps(prefs, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+def load_profiles(user_ids=None, limit: int = 0):
+    """One cursor over user_prefs -> ({profile_key: prefs}, {profile_key: [user_id, ...]})."""
+    query: Dict[str, Any] = {"user_id": {"$in": user_ids}} if user_ids else {}
+    projection = {**PREFS_PROJECTION, "user_id": 1}
+    profiles: Dict[str, Dict[str, Any]] = {}
+    members: Dict[str, List[ObjectId]] = {}
+    cursor = db.user_prefs.find(query, projection, batch_size=1000)
+    if limit:
+        cursor = cursor.limit(limit)
+    rows = [(_prefs_from_doc(doc), doc["user_id"]) for doc in cursor]
+    fill_targets([prefs for prefs, _ in rows])
+    for prefs, user_id in rows:
+        # the body profile only matters through the targets it produced, so
+        # users with different bodies but the same targets still share a plan
+        for k in intake.PROFILE_FIELDS:
+            prefs.pop(k, None)
+        key = profile_key(prefs)
+        profiles.setdefault(key, prefs)
+        members.setdefault(key, []).append(user_id)
+    return profiles, members
+
+def fill_targets(prefs_list: List[Dict[str, Any]]) -> int:
+    """
+    Fill unset calorie/macro targets in place from each body profile, in one
+    vectorized intake.compute_targets_batch() call. Returns how many were filled.
+    """
+    todo = [p for p in prefs_list if not p.get("calorie_target") and intake.has_profile(p)]
+    if not todo:
+        return 0
+    try:
+        computed = intake.compute_targets_batch(todo)
+    except intake.IntakeError:
+        # one bad profile: fall back to per-profile, which skips invalid ones
+        computed = [intake.with_targets(p) for p in todo]
+    for prefs, targets in zip(todo, computed):
+        for k in intake.TARGET_FIELDS:
+            prefs[k] = prefs.get(k) or targets.get(k)
+    return sum(1 for p in todo if p.get("calorie_target"))
+
+def run(profiles: Dict[str, Dict[str, Any]], members: Dict[str, List[ObjectId]],
+        workers: int = BATCH_WORKERS, rpm: int = BATCH_MODEL_RPM,
+        write_size: int = BATCH_WRITE_SIZE) -> Dict[str, Any]:
+    limiter = RateLimiter(rpm, burst=workers)
+    stats = {"profiles": len(profiles), "users": sum(len(v) for v in members.values()),
+             "written": 0, "failed_profiles": 0, "sources": {}}
+    pending_writes: List[tuple] = []
+
+    def flush():
+        if pending_writes:
+            stats["written"] += len(mealplans.save_plans_bulk(pending_writes))
+            pending_writes.clear()
+
+    def collect(key, fut):
+        try:
+            plan, source = fut.result()
+        except Exception as e:
+            stats["failed_profiles"] += 1
+            print(f"  profile {key[:12]} failed: {e}", file=sys.stderr)
+            return
+        stats["sources"][source] = stats["sources"].get(source, 0) + 1
+        for uid in members[key]:
+            pending_writes.append((uid, plan, source))
+            if len(pending_writes) >= write_size:
+                flush()
+
+    # keep at most 2x workers futures alive so 100k profiles don't all queue up front
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batchgen") as pool:
+        inflight = {}
+        for key, prefs in profiles.items():
+            if len(inflight) >= 2 * workers:
+                done, _ = wait(inflight, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    collect(inflight.pop(fut), fut)
+            inflight[pool.submit(generate_plan, prefs, None, limiter.acquire)] = key
+        for fut in list(inflight):
+            wait([fut])
+            collect(inflight.pop(fut), fut)
+    flush()
+    return stats
+
+def _read_ids(path: str) -> List[ObjectId]:
+    with open(path, encoding="utf-8") as fh:
+        return [ObjectId(line.strip()) for line in fh if line.strip()]
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate meal plans for many users.")
+    parser.add_argument("--user-ids", help="file with one user ObjectId per line (default: all users)")
+    parser.add_argument("--limit", type=int, default=0, help="at most this many users")
+    parser.add_argument("--workers", type=int, default=BATCH_WORKERS, help="concurrent generations")
+    parser.add_argument("--rpm", type=int, default=BATCH_MODEL_RPM,
+                        help="Bedrock requests per minute per model (0 = unlimited)")
+    parser.add_argument("--write-size", type=int, default=BATCH_WRITE_SIZE, help="plans per bulk_write")
+    parser.add_argument("--dry-run", action="store_true", help="only count users and distinct profiles")
+    args = parser.parse_args()
+
+    t0 = time.perf_counter()
+    user_ids = _read_ids(args.user_ids) if args.user_ids else None
+    profiles, members = load_profiles(user_ids, args.limit)
+    users = sum(len(v) for v in members.values())
+    print(f"{users} users, {len(profiles)} distinct profiles ({time.perf_counter() - t0:.1f}s)")
+    if args.dry_run:
+        return
+
+    stats = run(profiles, members, max(1, args.workers), args.rpm, max(1, args.write_size))
+    stats["seconds"] = round(time.perf_counter() - t0, 1)
+    print(json.dumps(stats, indent=2))
+    if stats["failed_profiles"]:
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
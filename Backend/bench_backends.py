@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Compare meal-plan generation backends on the same profiles.
+
+Each backend is called directly (no plan cache, no local fallback), so a
+failure counts as a failure. Per backend it reports wall time (p50/p95),
+how many plans were valid (7 days, every day within the calorie tolerance),
+why the others were not (unparseable / missed target / error), the mean
+calorie deviation of valid plans, macro-audit flags and how many days split
+mode filled from the local engine. For the swarm it also prints per-agent
+latency and token totals.
+
+Usage:
+  python bench_backends.py                               # strands vs swarm vs local, 4 profiles
+  python bench_backends.py --backends strands,swarm --runs 3 --workers 4
+  python bench_backends.py --profiles profiles.jsonl --json results.json
+"""
+import argparse
+import json
+import statistics
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List
+
+from backend_common import llm_json, meal_engine, plan_schema, swarm_planner
+import routes_prefs_meals as meals
+
+SAMPLE_PROFILES: List[Dict[str, Any]] = [
+    {"calorie_target": 1800, "diet": "balanced", "meals_per_day": 3, "exclude_ingredients": []},
+    {"calorie_target": 2200, "diet": "vegetarian", "meals_per_day": 3, "exclude_ingredients": ["mushrooms"]},
+    {"calorie_target": 2600, "diet": "high-protein", "meals_per_day": 4, "exclude_ingredients": ["peanuts"]},
+    {"calorie_target": 2000, "diet": "pescatarian", "meals_per_day": 4, "exclude_ingredients": ["dairy"]},
+]
+
+BACKENDS: Dict[str, Callable[[Dict[str, Any]], Dict[str, Any]]] = {
+    "strands": meals._call_strands_mealplan,
+    "swarm": meals._call_swarm_mealplan,
+    "local": meals._fallback_mealplan,
+}
+
+def _classify(err: Exception) -> str:
+    if isinstance(err, (llm_json.JSONExtractError, plan_schema.PlanValidationError)):
+        return "unparseable"
+    if "calorie target" in str(err):
+        return "missed_target"
+    return "error"
+
+def run_one(backend: str, prefs: Dict[str, Any]) -> Dict[str, Any]:
+    started = time.monotonic()
+    try:
+        plan = BACKENDS[backend](prefs)
+    except Exception as e:
+        return {"ok": False, "ms": (time.monotonic() - started) * 1e3, "why": _classify(e), "msg": str(e)[:200]}
+    ms = (time.monotonic() - started) * 1e3
+    dev = [abs(d["deviation"]["calories"]) for d in meal_engine.plan_deviation(plan, prefs)]
+    statuses = [m.get("audit", {}).get("status") for d in plan["days"] for m in d["meals"]]
+    return {"ok": len(plan["days"]) == meals.PLAN_DAYS and meal_engine.within_tolerance(plan, prefs),
+            "ms": ms, "why": None, "calorie_dev": sum(dev) / len(dev) if dev else 0.0,
+            "flagged": statuses.count("flagged") + statuses.count("corrected"),
+            "local_days": len(plan.get(meals.LOCAL_DAYS) or [])}  # split mode filled these locally
+
+def _pct(values: List[float], q: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+def summarize(results: List[Dict[str, Any]]) -> Dict[str, Any]:
+    ms = [r["ms"] for r in results]
+    valid = [r for r in results if r["ok"]]
+    why: Dict[str, int] = {}
+    for r in results:
+        if not r["ok"]:
+            k = r["why"] or "missed_target"
+            why[k] = why.get(k, 0) + 1
+    return {
+        "runs": len(results),
+        "valid": len(valid),
+        "valid_pct": round(100.0 * len(valid) / len(results), 1) if results else 0.0,
+        "p50_ms": round(statistics.median(ms), 1) if ms else 0.0,
+        "p95_ms": round(_pct(ms, 0.95), 1),
+        "mean_calorie_dev": round(statistics.mean(r["calorie_dev"] for r in valid), 4) if valid else None,
+        "audit_flags": sum(r.get("flagged", 0) for r in results),
+        "local_days": sum(r.get("local_days", 0) for r in results),
+        "invalid": why,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare meal-plan generation backends.")
+    parser.add_argument("--backends", default="strands,swarm,local", help="comma-separated: " + ",".join(BACKENDS))
+    parser.add_argument("--profiles", help="JSONL file, one prefs object per line (default: 4 sample profiles)")
+    parser.add_argument("--runs", type=int, default=1, help="generations per profile and backend")
+    parser.add_argument("--workers", type=int, default=1, help="concurrent generations per backend")
+    parser.add_argument("--json", help="also write the summary (and every run) to this file")
+    args = parser.parse_args()
+
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = [b for b in backends if b not in BACKENDS]
+    if unknown:
+        sys.exit(f"unknown backend(s): {', '.join(unknown)}")
+    if args.profiles:
+        with open(args.profiles, encoding="utf-8") as fh:
+            profiles = [json.loads(line) for line in fh if line.strip()]
+    else:
+        profiles = SAMPLE_PROFILES
+    jobs = [p for p in profiles for _ in range(max(1, args.runs))]
+
+    report: Dict[str, Any] = {"profiles": len(profiles), "runs_per_profile": args.runs, "backends": {}}
+    for backend in backends:
+        started = time.monotonic()
+        with ThreadPoolExecutor(max_workers=max(1, args.workers)) as pool:
+            results = list(pool.map(lambda p: run_one(backend, p), jobs))
+        summary = summarize(results)
+        summary["total_s"] = round(time.monotonic() - started, 2)
+        report["backends"][backend] = {"summary": summary, "results": results}
+        print(f"{backend:8s} valid {summary['valid']}/{summary['runs']} ({summary['valid_pct']}%)  "
+              f"p50 {summary['p50_ms']:.0f} ms  p95 {summary['p95_ms']:.0f} ms  "
+              f"calorie dev {summary['mean_calorie_dev']}  audit flags {summary['audit_flags']}  "
+              f"local days {summary['local_days']}  "
+              f"invalid {summary['invalid'] or '-'}")
+
+    if "swarm" in backends:
+        report["swarm_stats"] = swarm_planner.stats()
+        for name, a in report["swarm_stats"]["agents"].items():
+            print(f"  swarm/{name:14s} calls {a['calls']:3d}  avg {a['ms_avg']:.0f} ms  "
+                  f"tokens in {a['tokens_in']}  out {a['tokens_out']}")
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(report, fh, indent=2)
+
+if __name__ == "__main__":
+    main()
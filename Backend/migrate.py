@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+One-shot schema migrations: create every index the API relies on.
+
+Workers no longer do this at import time, so run it once per deploy:
+  python migrate.py
+  python migrate.py --move-embedded-plans   # also move user_prefs.meal_plan -> mealplans
+
+Set RUN_MIGRATIONS_ON_START=1 to have app.py run it at boot instead (dev only).
+"""
+import sys
+import time
+
+from pymongo import errors
+
+from backend_common.envdb import ensure_user_indexes
+from backend_common.jobs import ensure_job_indexes
+from backend_common.mealplans import ensure_mealplan_indexes, migrate_embedded_plans
+from backend_common.plan_cache import plan_cache
+
+MIGRATIONS = [
+    ("users indexes", ensure_user_indexes),
+    ("jobs indexes", ensure_job_indexes),
+    ("mealplan_cache indexes", plan_cache.ensure_indexes),
+    ("mealplans indexes", ensure_mealplan_indexes),
+]
+
+def run_migrations(verbose: bool = True):
+    for name, fn in MIGRATIONS:
+        t0 = time.perf_counter()
+        fn()
+        if verbose:
+            print(f"  {name}: ok ({(time.perf_counter() - t0) * 1000:.0f} ms)")
+
+def main():
+    import argparse
+    parser = argparse.ArgumentParser(description="Create indexes and run data migrations.")
+    parser.add_argument("--move-embedded-plans", action="store_true",
+                        help="Move legacy user_prefs.meal_plan blobs into the mealplans collection.")
+    args = parser.parse_args()
+
+    try:
+        print("Running migrations...")
+        run_migrations()
+        if args.move_embedded_plans:
+            moved = migrate_embedded_plans()
+            print(f"  moved {moved} embedded meal plans")
+    except errors.PyMongoError as e:
+        print(f"Migration failed: {e}", file=sys.stderr)
+        sys.exit(2)
+    print("Done.")
+
+if __name__ == "__main__":
+    main()
@@ -1,22 +1,24 @@
 # routes_prefs_meals.py
 from flask import Blueprint, request, jsonify
-from typing import Any, Dict, List
+from typing import Any, Callable, Dict, List, Optional
 from bson import ObjectId
-import os, json, random, traceback
+from pymongo import ReturnDocument
+from concurrent.futures import ThreadPoolExecutor
+import asyncio, os, time, traceback
 
 from backend_common.envdb import db
-from backend_common.jwt_tools import verify_token
+from backend_common.jwt_tools import claims_from_bearer
+from backend_common import agent_pool, async_llm, intake, jobs, json_patch, llm_json, \
+    macro_audit, mealplans, meal_engine, plan_schema, swarm_planner
+from backend_common.plan_cache import plan_cache, cache_key
+from backend_common.recipes import NoRecipesError
 
 bp = Blueprint("prefs_meals", __name__)
 
 # -------------------- auth + helpers --------------------
 
 def _claims_from_auth_header() -> Dict[str, Any]:
-    auth = request.headers.get("Authorization", "")
-    if not auth.lower().startswith("bearer "):
-        raise ValueError("missing bearer token")
-    token = auth.split(" ", 1)[1].strip()
-    return verify_token(token)
+    return claims_from_bearer(request.headers.get("Authorization", ""))
 
 def _oid(s: str) -> ObjectId:
     try:
@@ -25,115 +27,68 @@ def _oid(s: str) -> ObjectId:
         # impossible placeholder to avoid crashes
         return ObjectId("000000000000000000000000")
 
-def _loads_strict_json(txt: str) -> dict:
-    """Strip code fences if present and parse JSON strictly."""
-    s = str(txt).strip()
-    if s.startswith("```"):
-        s = s.strip("`")
-        nl = s.find("\n")
-        if nl > -1 and "{" not in s[:nl]:
-            s = s[nl+1:].strip()
-    return json.loads(s)
+# Bump whenever the meal-plan prompt or its post-processing changes, so cached
+# generations from the old prompt are not served.
+MEALPLAN_PROMPT_VERSION = "mp-2"  # mp-2: meals list their ingredients
 
-# ---------- VERSION-TOLERANT STRANDS HELPERS ----------
+def _mealplan_model_id() -> str:
+    return os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
 
-
-def _mk_agent(model_id: str, strands=None):
-    """
-    Create a Strands Agent that uses Bedrock in a compatible way.
-    """
-    import os
-    import boto3
-    from strands.agent import Agent
-
-    # Force the region
-    region = os.getenv("AWS_REGION", "us-east-1")
-    os.environ['AWS_DEFAULT_REGION'] = region
-
-    # Try different initialization approaches
-    # Priority: Use explicit boto3 client configuration
+def _env_int(name: str, default: int) -> int:
     try:
-        # Create boto3 bedrock-runtime client explicitly
-        bedrock_client = boto3.client(
-            'bedrock-runtime',
-            region_name=region
-        )
-
-        # Try to pass the client to Strands if it accepts it
-        return Agent(
-            model=model_id,
-            provider="bedrock",
-            client=bedrock_client  # Some versions accept this
-        )
-    except (TypeError, Exception) as e:
-        print(f"Approach 1 failed: {e}")
-
-    # Fallback approaches
-    for kwargs in (
-            {"model": model_id, "provider": "bedrock"},
-            {"model_id": model_id, "provider": "bedrock"},
-            {"model": model_id},
-            {"model_id": model_id},
-    ):
-        try:
-            agent = Agent(**kwargs)
-            # Force region on the agent if possible
-            if hasattr(agent, 'client') and hasattr(agent.client, 'meta'):
-                agent.client.meta.region_name = region
-            return agent
-        except TypeError:
-            continue
+        return int(os.getenv(name, default))
+    except Exception:
+        return default
 
-    return Agent()  # last resortt
+PLAN_DAYS = 7
 
-def _agent_invoke(agent, system_prompt: str, user_prompt: str, model_id: str):
-    """
-    Call the agent using whichever interface the installed version supports.
-    Tries (in order):
-      agent(user_prompt, system_prompt=...)
-      agent.run(user_prompt, system_prompt=...)
-      agent(user_prompt, system_prompt=..., model=model_id)
-      agent.run(user_prompt, system_prompt=..., model=model_id)
-    """
-    try:
-        return agent(user_prompt, system_prompt=system_prompt)
-    except TypeError:
-        pass
-    if hasattr(agent, "run"):
-        try:
-            return agent.run(user_prompt, system_prompt=system_prompt)
-        except TypeError:
-            pass
-    try:
-        return agent(user_prompt, system_prompt=system_prompt, model=model_id)
-    except TypeError:
-        pass
-    if hasattr(agent, "run"):
-        return agent.run(user_prompt, system_prompt=system_prompt, model=model_id)
-    raise RuntimeError("Strands Agent invocation method not supported by this version")
+# Split mode: ask for MEALPLAN_SPLIT_DAYS days per call (0 = whole week in one
+# call), run the calls concurrently, re-ask only for days that came back
+# unusable, and fill whatever is still missing from the local engine. A plan
+# with filled days carries their numbers under LOCAL_DAYS until
+# _plan_steps pops it: it is saved as source "<model>+local" and kept out of
+# the shared plan cache, so one bad run is not served to every user with
+# the same prefs.
+MEALPLAN_SPLIT_DAYS = max(0, _env_int("MEALPLAN_SPLIT_DAYS", 0))
+MEALPLAN_SPLIT_RETRIES = max(0, _env_int("MEALPLAN_SPLIT_RETRIES", 1))
+MEALPLAN_SPLIT_WORKERS = max(1, _env_int("MEALPLAN_SPLIT_WORKERS", 8))
 
+LOCAL_DAYS = "local_days"
 
-def _call_strands_mealplan(prefs: dict) -> dict:
-    """Use Strands against Bedrock, tolerant to API differences."""
-    model_id = os.getenv("BEDROCK_MODEL_ID", "anthropic.claude-3-sonnet-20240229-v1:0")
+_split_executor = ThreadPoolExecutor(max_workers=MEALPLAN_SPLIT_WORKERS, thread_name_prefix="plan-split")
 
-    # DEBUG: Print what we're actually using
-    print(f"DEBUG: Using model_id: {model_id}")
-    print(f"DEBUG: AWS_REGION: {os.getenv('AWS_REGION')}")
-    print(f"DEBUG: AWS_ACCESS_KEY_ID: {os.getenv('AWS_ACCESS_KEY_ID', 'NOT SET')[:20]}...")
+def _split_enabled() -> bool:
+    return 0 < MEALPLAN_SPLIT_DAYS < PLAN_DAYS
+
+def _day_groups(days: List[int], size: int) -> List[List[int]]:
+    return [days[i:i + size] for i in range(0, len(days), size)]
 
+def build_mealplan_prompt(prefs: Dict[str, Any], days: Optional[List[int]] = None):
+    """
+    (system_prompt, user_prompt) for the whole week, or only for `days`
+    (split mode). Shared by the sync and async paths.
+    """
     calorie_target = int(prefs.get("calorie_target") or 2200)
     meals_per_day = int(prefs.get("meals_per_day") or 3)
     diet = prefs.get("diet") or "balanced"
     excludes = ", ".join(map(str, prefs.get("exclude_ingredients", []))) or "none"
 
-    # ... rest of the function stays the same ...
+    days = days or list(range(1, PLAN_DAYS + 1))
+    if len(days) == PLAN_DAYS:
+        ask = f"Create a 7-day meal plan with {meals_per_day} meals per day for a {diet} diet."
+        more = "... include days 2..7 ..."
+    else:
+        which = ", ".join(str(d) for d in days)
+        ask = (f"Create meals for day(s) {which} of a 7-day meal plan, "
+               f"{meals_per_day} meals per day, for a {diet} diet.")
+        more = f"... one entry per requested day ({which}) ..."
+
     system = (
         "You are a nutrition planner. Respond with STRICT JSON ONLY. "
         "No markdown, no code fences, no explanations."
     )
     user = f"""
-Create a 7-day meal plan with {meals_per_day} meals per day for a {diet} diet.
+{ask}
 Daily calorie target: {calorie_target} kcal.
 Avoid these ingredients if present: {excludes}.
 
@@ -141,7 +96,7 @@ Return EXACTLY this JSON schema:
 {{
   "days": [
     {{
-      "day": 1,
+      "day": {days[0]},
       "meals": [
         {{
           "name": "string",
@@ -149,74 +104,262 @@ Return EXACTLY this JSON schema:
           "protein_g": number,
           "carbs_g": number,
           "fat_g": number,
+          "ingredients": ["150 g chicken breast", "1 cup cooked brown rice"],
           "recipe_text": "short steps"
         }}
       ]
     }},
-    ... include days 2..7 ...
+    {more}
   ]
 }}
+List every ingredient with its quantity (g, ml, cup, tbsp, tsp or a count);
+calories and macros are checked against those quantities.
 Only output valid JSON (no comments, no trailing commas).
 """
-    agent = _mk_agent(model_id)
-    raw = _agent_invoke(agent, system_prompt=system, user_prompt=user, model_id=model_id)
-    data = _loads_strict_json(raw)
-
-    # validate/normalize
-    days = data.get("days")
-    if not isinstance(days, list) or len(days) != 7:
-        raise ValueError("model did not return 7 days")
-    for d in days:
-        if not isinstance(d.get("meals"), list) or not d["meals"]:
-            raise ValueError("a day is missing meals")
-        for m in d["meals"]:
-            m["name"] = str(m.get("name", "Meal"))
-            m["recipe_text"] = str(m.get("recipe_text", ""))
-            for k in ("calories", "protein_g", "carbs_g", "fat_g"):
-                v = m.get(k, 0)
-                try:
-                    m[k] = float(v)
-                except Exception:
-                    m[k] = 0.0
+    return system, user
+
+def _enforce_targets() -> bool:
+    return os.getenv("MEALPLAN_ENFORCE_TARGETS", "1") not in ("0", "false", "False")
+
+def parse_mealplan(raw: Any, prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Parse and validate a model reply; raises ValueError when it is not a usable plan."""
+    data = plan_schema.normalize_plan(llm_json.extract_object(raw), days=PLAN_DAYS)
+    data = macro_audit.audit_plan(data)  # claimed macros vs. the listed ingredients
+    # the model is not trusted to do arithmetic: reject days that miss the calorie target
+    if _enforce_targets() and not meal_engine.within_tolerance(data, prefs):
+        raise ValueError("model plan misses the calorie target: %s" % [
+            d["deviation"]["calories"] for d in meal_engine.plan_deviation(data, prefs)])
     return data
 
-# ---------- Local fallback generator (always 7 days) ----------
+def parse_mealplan_days(raw: Any, prefs: Dict[str, Any], days: List[int]) -> Dict[int, Dict[str, Any]]:
+    """
+    Split-mode parser: {day number: day} for every requested day that is
+    usable on its own. Bad days are dropped, not fatal, so only they get re-asked.
+    """
+    data = llm_json.extract_object(raw)
+    got = data.get("days") if isinstance(data, dict) else None
+    if not isinstance(got, list):
+        raise ValueError("model reply has no days list")
+
+    # trust the model's numbering when it matches the request, else go by position
+    numbers = [d.get("day") if isinstance(d, dict) else None for d in got]
+    if sorted(n for n in numbers if isinstance(n, int)) != sorted(days):
+        numbers = days[:len(got)]
+
+    usable: Dict[int, Dict[str, Any]] = {}
+    for n, d in zip(numbers, got):
+        if n not in days or n in usable:
+            continue
+        try:
+            usable[n] = plan_schema.normalize_day(d, n)
+        except ValueError:
+            continue
+    if not usable:
+        return {}
+
+    out: Dict[int, Dict[str, Any]] = {}
+    for day in macro_audit.audit_plan({"days": list(usable.values())})["days"]:
+        if _enforce_targets() and not meal_engine.within_tolerance({"days": [day]}, prefs):
+            continue
+        out[day["day"]] = day
+    return out
+
+def _assemble_days(prefs: Dict[str, Any], got: Dict[int, Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Model days in order; days still missing after retries come from the
+    local engine and are listed under LOCAL_DAYS.
+    """
+    if not got:
+        raise ValueError("no usable day from the model")
+    missing = [d for d in range(1, PLAN_DAYS + 1) if d not in got]
+    notes = None
+    if missing:
+        print(f"Split generation: filling day(s) {missing} from the local engine")
+        week = meal_engine.plan_week(prefs, days=PLAN_DAYS)
+        local = {d["day"]: d for d in week["days"]}
+        for d in missing:
+            got[d] = local[d]
+        notes = week.get("notes")  # e.g. the diet could not be kept
+    plan = plan_schema.normalize_plan({"days": [got[d] for d in range(1, PLAN_DAYS + 1)],
+                                       "notes": notes})
+    if missing:
+        plan[LOCAL_DAYS] = missing
+    return plan
+
+def _call_strands_mealplan_split(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Day groups as concurrent calls; only failed days are asked for again."""
+    model_id = _mealplan_model_id()
+
+    def one(days: List[int]) -> Dict[int, Dict[str, Any]]:
+        system, user = build_mealplan_prompt(prefs, days)
+        raw = agent_pool.invoke(model_id, system_prompt=system, user_prompt=user)
+        return parse_mealplan_days(raw, prefs, days)
+
+    got: Dict[int, Dict[str, Any]] = {}
+    pending = list(range(1, PLAN_DAYS + 1))
+    for _ in range(1 + MEALPLAN_SPLIT_RETRIES):
+        groups = _day_groups(pending, MEALPLAN_SPLIT_DAYS)
+        for days, fut in [(g, _split_executor.submit(one, g)) for g in groups]:
+            try:
+                got.update(fut.result())
+            except Exception as e:
+                print(f"Split generation for day(s) {days} failed:", e)
+        pending = [d for d in range(1, PLAN_DAYS + 1) if d not in got]
+        if not pending:
+            break
+    return _assemble_days(prefs, got)
+
+async def _call_strands_mealplan_split_async(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Async twin of _call_strands_mealplan_split (the caller holds the user slot)."""
+    model_id = _mealplan_model_id()
+
+    async def one(days: List[int]) -> Dict[int, Dict[str, Any]]:
+        system, user = build_mealplan_prompt(prefs, days)
+        raw = await async_llm.invoke(model_id, system, user)
+        return await asyncio.to_thread(parse_mealplan_days, raw, prefs, days)  # extraction + audit: CPU
+
+    got: Dict[int, Dict[str, Any]] = {}
+    pending = list(range(1, PLAN_DAYS + 1))
+    for _ in range(1 + MEALPLAN_SPLIT_RETRIES):
+        groups = _day_groups(pending, MEALPLAN_SPLIT_DAYS)
+        results = await asyncio.gather(*(one(g) for g in groups), return_exceptions=True)
+        for days, res in zip(groups, results):
+            if isinstance(res, BaseException):
+                print(f"Split generation for day(s) {days} failed:", res)
+            else:
+                got.update(res)
+        pending = [d for d in range(1, PLAN_DAYS + 1) if d not in got]
+        if not pending:
+            break
+    return await asyncio.to_thread(_assemble_days, prefs, got)
+
+def _call_strands_mealplan(prefs: dict) -> dict:
+    """Use Strands against Bedrock, tolerant to API differences."""
+    model_id = _mealplan_model_id()
+
+    # DEBUG: Print what we're actually using
+    print(f"DEBUG: Using model_id: {model_id}")
+    print(f"DEBUG: AWS_REGION: {os.getenv('AWS_REGION')}")
+    print(f"DEBUG: AWS_ACCESS_KEY_ID: {os.getenv('AWS_ACCESS_KEY_ID', 'NOT SET')[:20]}...")
+
+    if _split_enabled():
+        return _call_strands_mealplan_split(prefs)
+    system, user = build_mealplan_prompt(prefs)
+    raw = agent_pool.invoke(model_id, system_prompt=system, user_prompt=user)
+    return parse_mealplan(raw, prefs)
+
+def _call_swarm_mealplan(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """MEALPLAN_BACKEND=swarm: the Planner/Nutrition swarm gets the same task and its reply the same parser."""
+    _, user = build_mealplan_prompt(prefs)
+    raw, _ = swarm_planner.run(_mealplan_model_id(), user)
+    return parse_mealplan(raw, prefs)
+
+async def _call_swarm_mealplan_async(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Async twin of _call_swarm_mealplan; the whole swarm run holds one model slot."""
+    model_id = _mealplan_model_id()
+    _, user = build_mealplan_prompt(prefs)
+    async with async_llm.model_slot(model_id):
+        raw, _ = await swarm_planner.run_async(model_id, user)
+    return await asyncio.to_thread(parse_mealplan, raw, prefs)
+
+MODEL_BACKENDS = {"strands": _call_strands_mealplan, "swarm": _call_swarm_mealplan}
+
+def _call_model_mealplan(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    return MODEL_BACKENDS.get(_mealplan_backend(), _call_strands_mealplan)(prefs)
+
+async def _call_model_mealplan_async(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    """Async twin of _call_model_mealplan (the caller holds the user slot)."""
+    if _model_source() == "swarm":
+        return await _call_swarm_mealplan_async(prefs)
+    if _split_enabled():
+        return await _call_strands_mealplan_split_async(prefs)
+    system, user = build_mealplan_prompt(prefs)
+    raw = await async_llm.invoke(_mealplan_model_id(), system, user)
+    return await asyncio.to_thread(parse_mealplan, raw, prefs)
+
+def _call_strands_meal_swap(prefs: Dict[str, Any], day_meals: List[Dict[str, Any]], idx: int) -> Dict[str, Any]:
+    """
+    One replacement meal from the model, sized like the meal it replaces so
+    the day's totals hold. A few hundred tokens instead of a whole week.
+    """
+    old = day_meals[idx]
+    keep = ", ".join(m.get("name", "") for i, m in enumerate(day_meals) if i != idx) or "none"
+    excludes = ", ".join(map(str, prefs.get("exclude_ingredients", []))) or "none"
+    system = (
+        "You are a nutrition planner. Respond with STRICT JSON ONLY. "
+        "No markdown, no code fences, no explanations."
+    )
+    user = f"""
+Suggest ONE replacement for the meal "{old.get('name', 'Meal')}" in a {prefs.get('diet') or 'balanced'} diet.
+It must be a different dish from it and from the rest of the day: {keep}.
+Match its macros closely: {old.get('calories', 0):.0f} kcal, {old.get('protein_g', 0):.0f} g protein,
+{old.get('carbs_g', 0):.0f} g carbs, {old.get('fat_g', 0):.0f} g fat.
+Avoid these ingredients if present: {excludes}.
+
+Return EXACTLY: {{"name": "string", "calories": number, "protein_g": number, "carbs_g": number,
+"fat_g": number, "ingredients": ["150 g chicken breast", "..."], "recipe_text": "short steps"}}
+List every ingredient with its quantity.
+"""
+    raw = agent_pool.invoke(_mealplan_model_id(), system_prompt=system, user_prompt=user)
+    meal = plan_schema.normalize_meal(llm_json.extract_object(raw))
+    meal = macro_audit.audit_meals([meal])[0][0]
+
+    want = float(old.get("calories") or 0)
+    if _enforce_targets() and want > 0 and abs(meal["calories"] - want) > meal_engine.CALORIE_TOLERANCE * want:
+        raise ValueError(f"replacement has {meal['calories']:.0f} kcal, wanted about {want:.0f}")
+    return meal
+
+# ---------- Local generator (always 7 days) ----------
 
 def _fallback_mealplan(prefs: Dict[str, Any]) -> Dict[str, Any]:
-    meals_per_day = int(prefs.get("meals_per_day") or 3)
-    excludes = {str(x).lower() for x in prefs.get("exclude_ingredients", [])}
-
-    catalog = [
-        ("Greek Yogurt Parfait",   380, 28, 45, 10, "Layer yogurt, berries, granola. Drizzle honey."),
-        ("Chicken Quinoa Bowl",    620, 45, 60, 18, "Grilled chicken + quinoa + veg. Lemon/olive oil."),
-        ("Salmon Sheet Pan",       560, 38, 35, 24, "Roast salmon & veg; salt/pepper/garlic."),
-        ("Tofu Stir Fry",          520, 32, 55, 16, "Tofu + mixed veg + rice + soy/ginger."),
-        ("Omelet & Toast",         420, 28, 32, 20, "3-egg omelet, spinach, cheese, whole-grain toast."),
-        ("Turkey Wrap",            480, 34, 42, 16, "Whole-wheat wrap, turkey, veg, yogurt sauce."),
-        ("Bean Chili",             540, 28, 68, 14, "Kidney/black beans, tomatoes, chili spices."),
-        ("Shrimp Pasta",           600, 36, 70, 16, "Shrimp, garlic, olive oil, parsley, pasta."),
-        ("Steak & Potatoes",       650, 45, 45, 24, "Pan-seared steak, roasted potatoes, salad."),
-    ]
-    def ok(name: str) -> bool:
-        s = name.lower()
-        if "yogurt" in s and ("dairy" in excludes): return False
-        if "omelet" in s and ("eggs" in excludes): return False
-        if "shrimp" in s and ("shellfish" in excludes): return False
-        if "salmon" in s and ("fish" in excludes): return False
-        if "wrap"   in s and ("gluten" in excludes): return False
-        return True
-
-    pool = [m for m in catalog if ok(m[0])] or catalog
-    random.seed(42)
-
-    days: List[Dict[str, Any]] = []
-    for d in range(1, 8):
-        picks = [pool[(d * i) % len(pool)] for i in range(1, meals_per_day + 1)]
-        meals = [{"name": n, "calories": c, "protein_g": p, "carbs_g": cb, "fat_g": f, "recipe_text": r}
-                 for (n, c, p, cb, f, r) in picks]
-        days.append({"day": d, "meals": meals})
-
-    return {"days": days}
+    """Deterministic plan from the local recipe catalog (see backend_common.meal_engine)."""
+    plan = meal_engine.plan_week(prefs)
+    if not meal_engine.within_tolerance(plan, prefs):  # plan_week repairs days; this should not happen
+        print("Local mealplan misses the calorie tolerance:",
+              [d["deviation"]["calories"] for d in meal_engine.plan_deviation(plan, prefs)])
+    return plan
+
+def _mealplan_backend() -> str:
+    """
+    MEALPLAN_BACKEND: strands (one prompt, default), swarm (multi-agent) or
+    local (the local engine, no Bedrock call).
+    """
+    return (os.getenv("MEALPLAN_BACKEND") or "strands").strip().lower()
+
+def _model_source() -> str:
+    return "swarm" if _mealplan_backend() == "swarm" else "strands"
+
+def _prompt_version() -> str:
+    """Cache namespace: swarm and single-prompt plans are not interchangeable."""
+    return MEALPLAN_PROMPT_VERSION + ("+swarm" if _model_source() == "swarm" else "")
+
+# -------------------- preferences shape --------------------
+
+# field -> default when unset; the projection and the response shape both
+# come from here so reads never pull plan bytes or other stray fields.
+PREFS_DEFAULTS: Dict[str, Any] = {
+    "calorie_target": None,
+    "protein_g_target": None,
+    "carb_g_target": None,
+    "fat_g_target": None,
+    "diet": "balanced",
+    "exclude_ingredients": [],
+    "cuisine_preferences": [],
+    "meals_per_day": 3,
+    "budget": "medium",
+    "max_prep_minutes": 30,
+    # body profile; with it, unset targets are computed (backend_common.intake)
+    "age": None,
+    "sex": None,
+    "height_cm": None,
+    "weight_kg": None,
+    "activity_level": None,
+    "goal": None,
+}
+PREFS_PROJECTION: Dict[str, int] = {"_id": 0, **{k: 1 for k in PREFS_DEFAULTS}}
+
+def _prefs_from_doc(doc: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: doc.get(k, list(v) if isinstance(v, list) else v) for k, v in PREFS_DEFAULTS.items()}
 
 # -------------------- routes --------------------
 
@@ -225,20 +368,8 @@ def get_preferences():
     try:
         claims = _claims_from_auth_header()
         user_id = _oid(claims.get("sub", ""))
-        doc = db.user_prefs.find_one({"user_id": user_id}) or {}
-        prefs = {
-            "calorie_target": doc.get("calorie_target"),
-            "protein_g_target": doc.get("protein_g_target"),
-            "carb_g_target": doc.get("carb_g_target"),
-            "fat_g_target": doc.get("fat_g_target"),
-            "diet": doc.get("diet", "balanced"),
-            "exclude_ingredients": doc.get("exclude_ingredients", []),
-            "cuisine_preferences": doc.get("cuisine_preferences", []),
-            "meals_per_day": doc.get("meals_per_day", 3),
-            "budget": doc.get("budget", "medium"),
-            "max_prep_minutes": doc.get("max_prep_minutes", 30),
-        }
-        return jsonify({"ok": True, "preferences": prefs})
+        doc = db.user_prefs.find_one({"user_id": user_id}, PREFS_PROJECTION) or {}
+        return jsonify({"ok": True, "preferences": _prefs_from_doc(doc)})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "msg": f"failed to load preferences: {e}"}), 500
@@ -262,9 +393,13 @@ def put_preferences():
                     pass
 
         for k in ["calorie_target", "protein_g_target", "carb_g_target", "fat_g_target",
-                  "meals_per_day", "max_prep_minutes"]:
+                  "meals_per_day", "max_prep_minutes", "age", "height_cm", "weight_kg"]:
             copy_num(body, k)
 
+        for k in ["sex", "activity_level", "goal"]:
+            if k in body and (body[k] is None or isinstance(body[k], str)):
+                update[k] = body[k] or None
+
         if "diet" in body and isinstance(body["diet"], str):
             update["diet"] = body["diet"]
 
@@ -284,26 +419,28 @@ def put_preferences():
         if not update:
             return jsonify({"ok": False, "msg": "no valid fields to update"}), 400
 
-        db.user_prefs.update_one(
+        # a changed body profile is validated against the stored one and, unless
+        # the body sets targets itself, recomputes them
+        if any(k in update for k in intake.PROFILE_FIELDS):
+            stored = db.user_prefs.find_one({"user_id": user_id}, PREFS_PROJECTION) or {}
+            merged = {**stored, **update}
+            if intake.has_profile(merged):
+                try:
+                    profile = intake.validate_profile(merged)
+                    targets = intake.compute_targets({**profile, "caloric_goal": update.get("calorie_target")})
+                except intake.IntakeError as e:
+                    return jsonify({"ok": False, "msg": str(e)}), 400
+                for k in intake.TARGET_FIELDS:
+                    update.setdefault(k, targets[k])
+
+        doc = db.user_prefs.find_one_and_update(
             {"user_id": user_id},
             {"$set": update, "$setOnInsert": {"user_id": user_id}},
+            projection=PREFS_PROJECTION,
             upsert=True,
-        )
-
-        doc = db.user_prefs.find_one({"user_id": user_id}) or {}
-        prefs = {
-            "calorie_target": doc.get("calorie_target"),
-            "protein_g_target": doc.get("protein_g_target"),
-            "carb_g_target": doc.get("carb_g_target"),
-            "fat_g_target": doc.get("fat_g_target"),
-            "diet": doc.get("diet", "balanced"),
-            "exclude_ingredients": doc.get("exclude_ingredients", []),
-            "cuisine_preferences": doc.get("cuisine_preferences", []),
-            "meals_per_day": doc.get("meals_per_day", 3),
-            "budget": doc.get("budget", "medium"),
-            "max_prep_minutes": doc.get("max_prep_minutes", 30),
-        }
-        return jsonify({"ok": True, "preferences": prefs})
+            return_document=ReturnDocument.AFTER,
+        ) or {}
+        return jsonify({"ok": True, "preferences": _prefs_from_doc(doc)})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "msg": f"failed to save preferences: {e}"}), 500
@@ -313,12 +450,13 @@ def get_mealplan():
     try:
         claims = _claims_from_auth_header()
         user_id = _oid(claims.get("sub", ""))
-        doc = db.user_prefs.find_one({"user_id": user_id})
+        doc = mealplans.latest_plan(user_id)
 
-        if not doc or "meal_plan" not in doc:
+        if not doc:
             return jsonify({"ok": True, "mealplan": None})
 
-        return jsonify({"ok": True, "mealplan": doc["meal_plan"]})
+        return jsonify({"ok": True, "mealplan": plan_schema.with_totals(doc["plan"]), "version": doc.get("version"),
+                        "rev": doc.get("rev", 0)})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "msg": f"failed to load mealplan: {e}"}), 500
@@ -333,52 +471,357 @@ def save_mealplan():
 
         if not mealplan:
             return jsonify({"ok": False, "msg": "mealplan required"}), 400
+        try:
+            mealplan = plan_schema.normalize_plan(mealplan)
+        except plan_schema.PlanValidationError as e:
+            return jsonify({"ok": False, "msg": f"invalid mealplan: {e}"}), 400
 
-        db.user_prefs.update_one(
-            {"user_id": user_id},
-            {"$set": {"meal_plan": mealplan}, "$setOnInsert": {"user_id": user_id}},
-            upsert=True,
-        )
+        version = mealplans.save_plan(user_id, mealplan, source="manual")
 
-        return jsonify({"ok": True})
+        return jsonify({"ok": True, "version": version})
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "msg": f"failed to save mealplan: {e}"}), 500
 
+@bp.post("/mealplans/days/<int:day>/meals/<int:idx>/regenerate")
+def regenerate_meal(day: int, idx: int):
+    """
+    Swap one meal of the latest plan for a new one with about the same
+    macros. Only that array element is written; the plan keeps its version
+    and its `rev` goes up. Returns { meal, day, idx, day_totals, totals,
+    version, rev, source }.
+    """
+    try:
+        claims = _claims_from_auth_header()
+        user_id = _oid(claims.get("sub", ""))
+        doc = mealplans.latest_plan(user_id)
+        if not doc:
+            return jsonify({"ok": False, "msg": "no mealplan yet"}), 404
+
+        days = (doc.get("plan") or {}).get("days") or []
+        pos = next((i for i, d in enumerate(days) if isinstance(d, dict) and d.get("day") == day), None)
+        day_doc_raw = days[pos] if pos is not None else None
+        day_doc = day_doc_raw or {}
+        meals = day_doc.get("meals") or []
+        if not 0 <= idx < len(meals):
+            return jsonify({"ok": False, "msg": f"no meal {idx} on day {day}"}), 404
+
+        prefs = intake.with_targets(db.user_prefs.find_one({"user_id": user_id}, PREFS_PROJECTION) or {})
+        meal, source = None, "local"
+        if _mealplan_backend() != "local" and _strands_enabled():
+            try:
+                meal, source = _call_strands_meal_swap(prefs, meals, idx), "strands"
+            except Exception as e:
+                print("Strands meal swap failed:", e)
+        if meal is None:
+            meal = meal_engine.replacement_meal(prefs, meals, idx)
+
+        # totals for the swapped day and the week go in the same write
+        meal = plan_schema.normalize_meal(meal)
+        day_doc = plan_schema.normalize_day({**day_doc, "meals": meals[:idx] + [meal] + meals[idx + 1:]}, day)
+        week = plan_schema.with_totals({**doc["plan"], "days": [day_doc if d is day_doc_raw else d for d in days]})
+
+        doc = mealplans.versioned(user_id, doc)
+        version = doc["version"]
+        rev = mealplans.set_meal(user_id, version, doc.get("rev", 0), pos, idx, meal,
+                                 day_totals=day_doc["totals"], plan_totals=week.get("totals"))
+        if rev is None:
+            # another edit landed while the model was busy: tell which kind of miss it was
+            current = mealplans.get_version(user_id, version)
+            cur_day = next((d for d in ((current or {}).get("plan") or {}).get("days") or []
+                            if isinstance(d, dict) and d.get("day") == day), None)
+            if current is None or not 0 <= idx < len((cur_day or {}).get("meals") or []):
+                return jsonify({"ok": False, "msg": f"no meal {idx} on day {day}"}), 404
+            return jsonify({"ok": False, "msg": "mealplan changed, reload and retry",
+                            "version": version, "rev": current.get("rev", 0)}), 409
+
+        return jsonify({"ok": True, "meal": meal, "day": day, "idx": idx, "day_totals": day_doc["totals"],
+                        "totals": week.get("totals"), "version": version, "rev": rev, "source": source})
+    except NoRecipesError as e:
+        return jsonify({"ok": False, "msg": f"cannot build a meal: {e}"}), 422
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "msg": f"failed to regenerate meal: {e}"}), 500
+
+@bp.patch("/mealplans")
+def patch_mealplan():
+    """
+    Body: { version, rev, patch: [RFC 6902 ops on the plan] }.
+    Only the touched paths are written, and only if that version is still at
+    `rev`; otherwise 409 with the current rev so the client can rebase.
+    Returns { version, rev }.
+    """
+    try:
+        claims = _claims_from_auth_header()
+        user_id = _oid(claims.get("sub", ""))
+        body = request.get_json(force=True, silent=True) or {}
+        ops = body.get("patch")
+        try:
+            version, rev = int(body.get("version") or 0), int(body.get("rev") or 0)
+        except (TypeError, ValueError):
+            return jsonify({"ok": False, "msg": "version and rev must be integers"}), 400
+        if not isinstance(ops, list) or not ops:
+            return jsonify({"ok": False, "msg": "patch required"}), 400
+
+        if version:
+            doc = mealplans.get_version(user_id, version)
+        else:  # plans from before versioning
+            doc = mealplans.latest_plan(user_id)
+            doc = mealplans.versioned(user_id, doc) if doc else None
+        if not doc:
+            return jsonify({"ok": False, "msg": "mealplan version not found"}), 404
+        if int(doc.get("rev", 0) or 0) != rev:
+            return jsonify({"ok": False, "msg": "mealplan changed, reload and retry",
+                            "version": doc["version"], "rev": doc.get("rev", 0)}), 409
+
+        try:
+            patched, update = json_patch.to_mongo_update(doc["plan"], ops, root="plan")
+            # written values are the normalized ones; touched days and the week get fresh totals
+            normalized = plan_schema.normalize_plan(patched)
+            update = plan_schema.refresh_update(normalized, update, root="plan")
+        except json_patch.PatchError as e:
+            return jsonify({"ok": False, "msg": f"patch does not apply: {e}"}), 422
+        except plan_schema.PlanValidationError as e:
+            return jsonify({"ok": False, "msg": f"patched mealplan is invalid: {e}"}), 422
+
+        new_rev = mealplans.update_version(user_id, doc["version"], rev, update)
+        if new_rev is None:
+            return jsonify({"ok": False, "msg": "mealplan changed, reload and retry"}), 409
+        return jsonify({"ok": True, "version": doc["version"], "rev": new_rev, "totals": normalized["totals"]})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "msg": f"failed to patch mealplan: {e}"}), 500
+
+def _prefs_used(prefs: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "calorie_target": prefs.get("calorie_target"),
+        "diet": prefs.get("diet", "balanced"),
+        "exclude_ingredients": prefs.get("exclude_ingredients", []),
+        "meals_per_day": prefs.get("meals_per_day", 3),
+    }
+
+def _strands_enabled() -> bool:
+    return os.getenv("USE_STRANDS", "1") not in ("0", "false", "False")
+
+def _plan_cache_enabled() -> bool:
+    return os.getenv("MEALPLAN_CACHE", "1") not in ("0", "false", "False")
+
+def _remember_plan(key: str, mealplan: Dict[str, Any], started: float):
+    plan_cache.record_miss_latency(time.monotonic() - started)
+    plan_cache.put(key, mealplan, meta={"model_id": _mealplan_model_id(),
+                                        "prompt_version": _prompt_version()})
+
+def _plan_steps(prefs: Dict[str, Any]):
+    """
+    The generation decisions shared by generate_plan and generate_plan_async:
+    local backend, shared cache, the model, then the local fallback. A
+    generator that yields each blocking step and is sent its result, so the
+    two drivers differ only in how a step runs (inline, or awaited):
+
+      ("local",)                          -> plan from the local engine
+      ("cache_get", key)                  -> cached plan or None
+      ("model",)                          -> plan from the model (LOCAL_DAYS set if some
+                                             days came from the local engine), or the
+                                             Exception it raised
+      ("cache_put", key, plan, started)   -> None
+      ("fallback",)                       -> plan from the local engine
+
+    Returns (mealplan, source).
+    """
+    if _mealplan_backend() == "local":
+        return (yield ("local",)), "local"
+    mealplan, source = None, "fallback"
+    if _strands_enabled():
+        use_cache = _plan_cache_enabled()
+        key = cache_key(prefs, _mealplan_model_id(), _prompt_version())
+        if use_cache:
+            mealplan = yield ("cache_get", key)
+            source = "cache"
+        if mealplan is None:
+            started = time.monotonic()
+            mealplan = yield ("model",)
+            if isinstance(mealplan, Exception):
+                print(f"{_model_source()} generation failed:", mealplan)  # visible in Flask console
+                mealplan = None
+            elif mealplan.pop(LOCAL_DAYS, None):
+                source = _model_source() + "+local"  # partly local: not cached
+            else:
+                source = _model_source()
+                if use_cache:
+                    yield ("cache_put", key, mealplan, started)
+    if mealplan is None:
+        mealplan, source = (yield ("fallback",)), "fallback"
+    return mealplan, source
+
+def _cached_plan(key: str) -> Optional[Dict[str, Any]]:
+    mealplan = plan_cache.get(key)
+    return plan_schema.with_totals(mealplan) if mealplan else None  # entries may predate totals
+
+def generate_plan(prefs: Dict[str, Any], progress: Optional[Callable[[str, int], None]] = None,
+                  before_model_call: Optional[Callable[[str], None]] = None):
+    """
+    Produce a plan for one prefs profile without saving it (see _plan_steps).
+    Returns (mealplan, source).
+    before_model_call(model_id) runs right before a Bedrock call (batch rate limiting).
+    """
+    report = progress or (lambda stage, pct: None)
+    prefs = intake.with_targets(prefs)
+
+    def run(step):
+        kind = step[0]
+        if kind in ("local", "fallback"):
+            report("generating" if kind == "local" else "fallback", 10 if kind == "local" else 70)
+            return _fallback_mealplan(prefs)
+        if kind == "cache_get":
+            return _cached_plan(step[1])
+        if kind == "cache_put":
+            return _remember_plan(*step[1:])
+        report("generating", 10)
+        if before_model_call:
+            before_model_call(_mealplan_model_id())
+        try:
+            return _call_model_mealplan(prefs)
+        except Exception as e:
+            return e
+
+    steps, result = _plan_steps(prefs), None
+    try:
+        while True:
+            result = run(steps.send(result))
+    except StopIteration as done:
+        return done.value
+
+async def generate_plan_async(prefs: Dict[str, Any], user_key: Optional[str] = None):
+    """
+    generate_plan() for the event loop (asgi.py): the Bedrock call is awaited
+    under async_llm's per-model/per-user limits; Mongo and the local engine
+    run on the default executor. Raises async_llm.UserBusy past the user cap.
+    prefs must already have their targets (intake.with_targets): the caller
+    reports them too, so they are filled once, there.
+    """
+    async def run(step):
+        kind = step[0]
+        if kind in ("local", "fallback"):
+            return await asyncio.to_thread(_fallback_mealplan, prefs)
+        if kind == "cache_get":
+            return await asyncio.to_thread(_cached_plan, step[1])
+        if kind == "cache_put":
+            return await asyncio.to_thread(_remember_plan, *step[1:])
+        try:
+            # one user slot for the whole generation, however many calls split mode makes
+            async with async_llm.user_slot(user_key):
+                return await _call_model_mealplan_async(prefs)
+        except async_llm.UserBusy:
+            raise
+        except Exception as e:
+            return e
+
+    steps, result = _plan_steps(prefs), None
+    try:
+        while True:
+            result = await run(steps.send(result))
+    except StopIteration as done:
+        return done.value
+
+def _generate_for_user(user_id: ObjectId, prefs: Dict[str, Any],
+                       progress: Optional[Callable[[str, int], None]] = None) -> Dict[str, Any]:
+    """
+    Generate (Strands first, local fallback) and persist a plan for one user.
+    Returns { mealplan, version } - the same shape the routes respond with.
+    """
+    report = progress or (lambda stage, pct: None)
+    mealplan, source = generate_plan(prefs, report)
+
+    # Save the generated meal plan as a new version
+    report("saving", 90)
+    version = mealplans.save_plan(user_id, mealplan, source=source)
+    return {"mealplan": mealplan, "version": version}
+
+def _async_generation_enabled(wait: Optional[str] = None) -> bool:
+    """ASYNC_MEALPLANS (default on) unless the request says ?wait=1; asgi.py asks too."""
+    if wait in ("1", "true", "True"):
+        return False
+    return os.getenv("ASYNC_MEALPLANS", "1") not in ("0", "false", "False")
+
 @bp.post("/mealplans/generate")
 def generate_mealplan():
+    """
+    Default: queue a background job and return 202 { ok, job_id } immediately.
+    Poll GET /mealplans/jobs/<id> for the plan (under asgi.py, .../events
+    streams it as Server-Sent Events without holding a worker).
+    ?wait=1 (or ASYNC_MEALPLANS=0) keeps the old blocking behaviour.
+    """
     try:
         claims = _claims_from_auth_header()
         user_id = _oid(claims.get("sub", ""))
-        prefs = db.user_prefs.find_one({"user_id": user_id}) or {}
+        prefs = intake.with_targets(db.user_prefs.find_one({"user_id": user_id}, PREFS_PROJECTION) or {})
 
-        mealplan = None
-        if os.getenv("USE_STRANDS", "1") not in ("0", "false", "False"):
-            try:
-                mealplan = _call_strands_mealplan(prefs)
-            except Exception as strands_err:
-                print("Strands generation failed:", strands_err)  # visible in Flask console
+        if not _async_generation_enabled(request.args.get("wait")):
+            out = _generate_for_user(user_id, prefs)
+            return jsonify({"ok": True, "prefs_used": _prefs_used(prefs), **out})
 
-        if mealplan is None:
-            mealplan = _fallback_mealplan(prefs)
+        job_id = jobs.create_job("mealplan.generate", user_id, meta={"prefs_used": _prefs_used(prefs)})
 
-        # Save the generated meal plan
-        db.user_prefs.update_one(
-            {"user_id": user_id},
-            {"$set": {"meal_plan": mealplan}, "$setOnInsert": {"user_id": user_id}},
-            upsert=True,
-        )
-
-        return jsonify({
-            "ok": True,
-            "prefs_used": {
-                "calorie_target": prefs.get("calorie_target"),
-                "diet": prefs.get("diet", "balanced"),
-                "exclude_ingredients": prefs.get("exclude_ingredients", []),
-                "meals_per_day": prefs.get("meals_per_day", 3),
-            },
-            "mealplan": mealplan,
-        })
+        def work(progress):
+            return {"prefs_used": _prefs_used(prefs), **_generate_for_user(user_id, prefs, progress)}
+
+        try:
+            jobs.submit(job_id, work)
+        except jobs.JobQueueFull:
+            return jsonify({"ok": False, "msg": "generator busy, try again shortly", "job_id": job_id}), 429
+
+        return jsonify({"ok": True, "job_id": job_id, "status": "queued",
+                        "prefs_used": _prefs_used(prefs)}), 202
+    except NoRecipesError as e:
+        return jsonify({"ok": False, "msg": f"cannot build a mealplan: {e}"}), 422
     except Exception as e:
         traceback.print_exc()
         return jsonify({"ok": False, "msg": f"failed to generate mealplan: {e}"}), 500
+
+@bp.get("/mealplans/history")
+def get_mealplan_history():
+    try:
+        claims = _claims_from_auth_header()
+        user_id = _oid(claims.get("sub", ""))
+        try:
+            limit = max(1, min(100, int(request.args.get("limit", 20))))
+        except Exception:
+            limit = 20
+        return jsonify({"ok": True, "versions": mealplans.plan_history(user_id, limit)})
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "msg": f"failed to load mealplan history: {e}"}), 500
+
+@bp.get("/mealplans/cache/stats")
+def mealplan_cache_stats():
+    try:
+        _claims_from_auth_header()
+        return jsonify({"ok": True, "cache": plan_cache.stats()})
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"invalid or expired token: {e}"}), 401
+
+@bp.get("/mealplans/backends/stats")
+def mealplan_backend_stats():
+    """Active backend plus per-agent latency/token totals of the swarm backend."""
+    try:
+        _claims_from_auth_header()
+        return jsonify({"ok": True, "backend": _mealplan_backend(), "swarm": swarm_planner.stats(),
+                        "agent_pool": agent_pool.pool_stats()})
+    except Exception as e:
+        return jsonify({"ok": False, "msg": f"invalid or expired token: {e}"}), 401
+
+@bp.get("/mealplans/jobs/<job_id>")
+def get_mealplan_job(job_id: str):
+    try:
+        claims = _claims_from_auth_header()
+        doc = jobs.get_job(job_id, _oid(claims.get("sub", "")))
+        if not doc:
+            return jsonify({"ok": False, "msg": "job not found"}), 404
+        job = jobs.public_job(doc)
+        out = {"ok": True, "job": job}
+        if job["status"] == "done":
+            out.update(job.get("result") or {})  # same shape as the blocking response
+        return jsonify(out)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"ok": False, "msg": f"failed to load job: {e}"}), 500
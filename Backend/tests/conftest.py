@@ -0,0 +1,22 @@
+# Backend/tests/conftest.py
+import os, sys
+
+import pytest
+
+# pip install -r requirements.txt -r requirements-dev.txt; python -m pytest -q tests
+# (tests needing a missing optional package are skipped)
+#
+# the backend is run from Backend/ (python app.py, python -m backend_common.X);
+# make the same imports work under pytest from any directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# a key of full HS256 length, so tests never run on the dev default
+os.environ.setdefault("JWT_SECRET", "test-secret-" + "x" * 32)
+
+
+@pytest.fixture
+def mongo(monkeypatch):
+    """An in-memory MongoDB behind envdb.db (and every module that imported it)."""
+    mongomock = pytest.importorskip("mongomock")
+    from backend_common import envdb
+    monkeypatch.setattr(envdb, "_client", mongomock.MongoClient())
+    return envdb.db
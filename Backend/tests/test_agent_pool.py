@@ -0,0 +1,85 @@
+import pytest
+
+from backend_common import agent_pool
+
+
+class FakeAgent:
+    def __init__(self, reply="ok"):
+        self.messages = []
+        self.reply = reply
+
+    def __call__(self, prompt, system_prompt=None):
+        self.messages.append(prompt)
+        return self.reply
+
+
+@pytest.fixture(autouse=True)
+def clean_pool(monkeypatch):
+    monkeypatch.setattr(agent_pool, "_idle", {})
+    monkeypatch.setattr(agent_pool, "_ctor_choice", {})
+    monkeypatch.setattr(agent_pool, "_invoke_choice", {})
+
+
+def _candidates(*makers):
+    return lambda model_id, region, system_prompt: list(makers)
+
+
+def _signature_mismatch():
+    raise TypeError("unexpected keyword argument 'model'")
+
+
+def test_probe_skips_signature_mismatches_and_remembers(monkeypatch):
+    monkeypatch.setattr(agent_pool, "_ctor_candidates", _candidates(_signature_mismatch, FakeAgent))
+    assert isinstance(agent_pool._build_agent("m", "us-east-1", "sys"), FakeAgent)
+    assert agent_pool._ctor_choice == {"with_prompt": 1}
+
+
+def test_other_errors_propagate_and_are_not_memoized(monkeypatch):
+    def no_credentials():
+        raise RuntimeError("Unable to locate credentials")
+    monkeypatch.setattr(agent_pool, "_ctor_candidates", _candidates(no_credentials, FakeAgent))
+    with pytest.raises(RuntimeError, match="credentials"):
+        agent_pool._build_agent("m", "us-east-1", "sys")
+    assert agent_pool._ctor_choice == {}
+
+
+def test_agents_are_leased_reset_and_reused(monkeypatch):
+    built = []
+    monkeypatch.setattr(agent_pool, "_ctor_candidates",
+                        _candidates(lambda: built.append(FakeAgent()) or built[-1]))
+    assert agent_pool.invoke("m", "sys", "hello") == "ok"
+    assert agent_pool.invoke("m", "sys", "again") == "ok"
+    assert len(built) == 1 and built[0].messages == []  # history cleared on return
+
+
+def test_failed_call_discards_the_agent(monkeypatch):
+    built = []
+    monkeypatch.setattr(agent_pool, "_ctor_candidates",
+                        _candidates(lambda: built.append(FakeAgent()) or built[-1]))
+    with pytest.raises(ValueError):
+        with agent_pool.lease("m", "sys"):
+            raise ValueError("model reply unusable")
+    agent_pool.invoke("m", "sys", "hello")
+    assert len(built) == 2
+
+
+def test_bedrock_model_uses_the_pooled_session_and_client(monkeypatch):
+    pytest.importorskip("strands")
+    monkeypatch.setattr(agent_pool, "_sessions", {})
+    monkeypatch.setattr(agent_pool, "_clients", {})
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    a = agent_pool.bedrock_model("some-model", "eu-west-1")
+    b = agent_pool.bedrock_model("other-model", "eu-west-1")
+    assert a.client is b.client is agent_pool.bedrock_client("eu-west-1")
+    assert a.client.meta.region_name == "eu-west-1"
+    assert len(agent_pool._sessions) == 1
+
+
+def test_installed_strands_takes_the_preferred_constructor(monkeypatch):
+    pytest.importorskip("strands")
+    monkeypatch.setenv("AWS_ACCESS_KEY_ID", "test")
+    monkeypatch.setenv("AWS_SECRET_ACCESS_KEY", "test")
+    agent = agent_pool._build_agent("some-model", "us-east-1", "be brief")
+    assert agent_pool._ctor_choice == {"with_prompt": 0}
+    assert agent.model.client is agent_pool.bedrock_client("us-east-1")
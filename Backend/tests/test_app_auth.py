@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("flask")
+
+import app as app_module
+from backend_common.security import HashingBusy, HashingTimeout
+
+
+@pytest.fixture
+def client(mongo, monkeypatch):
+    monkeypatch.setattr(app_module, "hash_password", lambda pw, rounds=None: "$2b$04$" + "a" * 53)
+    monkeypatch.setattr(app_module, "verify_password", lambda pw, hashed: pw == "password123")
+    monkeypatch.setattr(app_module, "needs_rehash", lambda hashed: False)
+    return app_module.app.test_client()
+
+
+def _register(client, email="a@example.com"):
+    return client.post("/auth/register", json={"email": email, "username": "alice", "password": "password123"})
+
+
+def _login(client, password="password123"):
+    return client.post("/auth/login", json={"email": "a@example.com", "password": password})
+
+
+def test_register_and_login(client):
+    assert _register(client).status_code == 201
+    assert _login(client).status_code == 200
+    assert _login(client, "nope-nope").status_code == 401
+
+
+@pytest.mark.parametrize("err, status", [(HashingBusy("full"), 429), (HashingTimeout("slow"), 503)])
+def test_hashing_pressure_says_when_to_retry(client, monkeypatch, err, status):
+    assert _register(client).status_code == 201
+
+    def overloaded(*args, **kwargs):
+        raise err
+    monkeypatch.setattr(app_module, "hash_password", overloaded)
+    monkeypatch.setattr(app_module, "verify_password", overloaded)
+    for res in (_register(client, "b@example.com"), _login(client)):
+        assert res.status_code == status and res.headers["Retry-After"] == "1"
@@ -0,0 +1,92 @@
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("asgiref")
+from bson import ObjectId
+
+import asgi
+from backend_common import jwt_tools
+
+
+def _token(user_id):
+    return jwt_tools.mint_access_and_refresh({"_id": user_id, "email": "a@example.com"})["access_token"]
+
+
+async def _call(method, path, token=None, body=b"", query=b""):
+    """One request through asgi.app; returns (status, headers, body bytes)."""
+    headers = [(b"content-type", b"application/json")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {"type": "http", "method": method, "path": path, "query_string": query, "headers": headers,
+             "http_version": "1.1", "scheme": "http", "server": ("test", 80), "client": ("test", 1),
+             "root_path": "", "raw_path": path.encode()}
+    sent, hang = [], asyncio.Event()
+    first = True
+
+    async def receive():
+        nonlocal first
+        if first:
+            first = False
+            return {"type": "http.request", "body": body, "more_body": False}
+        await hang.wait()  # the client never disconnects
+
+    async def send(msg):
+        sent.append(msg)
+
+    await asgi.app(scope, receive, send)
+    start = next(m for m in sent if m["type"] == "http.response.start")
+    return start["status"], dict(start["headers"]), b"".join(m.get("body", b"") for m in sent
+                                                              if m["type"] == "http.response.body")
+
+
+def _events(raw):
+    out = []
+    for block in raw.decode().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.splitlines() if not line.startswith(":"))
+        if "event" in lines:
+            out.append((lines["event"], json.loads(lines["data"])))
+    return out
+
+
+@pytest.fixture
+def local_backend(mongo, monkeypatch):
+    monkeypatch.setenv("MEALPLAN_BACKEND", "local")
+    monkeypatch.setattr(asgi, "JOB_SSE_POLL_SECONDS", 0.01)
+
+
+def test_generate_queues_a_job_that_events_stream_to_done(local_backend, mongo):
+    user = ObjectId()
+    token = _token(user)
+    status, _, body = asyncio.run(_call("POST", "/mealplans/generate", token))
+    assert status == 202
+    job_id = json.loads(body)["job_id"]
+
+    status, headers, raw = asyncio.run(_call("GET", f"/mealplans/jobs/{job_id}/events", token))
+    assert status == 200 and headers[b"content-type"] == b"text/event-stream"
+    events = _events(raw)
+    assert events[-1][0] == "done"
+    result = events[-1][1]["result"]
+    assert len(result["mealplan"]["days"]) == 7 and result["version"] >= 1
+
+
+def test_generate_wait_runs_inline(local_backend):
+    status, _, body = asyncio.run(_call("POST", "/mealplans/generate", _token(ObjectId()), query=b"wait=1"))
+    out = json.loads(body)
+    assert status == 200 and out["ok"] and len(out["mealplan"]["days"]) == 7
+
+
+def test_events_need_the_owner_and_a_header_token(local_backend):
+    owner = ObjectId()
+    _, _, body = asyncio.run(_call("POST", "/mealplans/generate", _token(owner)))
+    job_id = json.loads(body)["job_id"]
+    assert asyncio.run(_call("GET", f"/mealplans/jobs/{job_id}/events"))[0] == 401
+    assert asyncio.run(_call("GET", f"/mealplans/jobs/{job_id}/events", _token(ObjectId())))[0] == 404
+
+
+
+def test_llm_stats_needs_auth(local_backend):
+    assert asyncio.run(_call("GET", "/llm/stats"))[0] == 401
+    status, _, body = asyncio.run(_call("GET", "/llm/stats", _token(ObjectId())))
+    assert status == 200 and json.loads(body)["ok"]
@@ -0,0 +1,44 @@
+from backend_common import chat_context
+
+
+def _plan(name, version=1):
+    return {"version": version, "rev": 0, "days": [
+        {"day": 1, "meals": [{"name": name, "calories": 500, "protein_g": 30, "carbs_g": 50, "fat_g": 15}]},
+    ]}
+
+
+def test_same_version_different_plans_get_different_tables():
+    alice = chat_context.plan_table(_plan("Alice secret salmon"))[0]
+    bob = chat_context.plan_table(_plan("Bob tofu bowl"))[0]
+    assert "Alice secret salmon" in alice
+    assert "Bob tofu bowl" in bob
+    assert "Alice" not in bob
+
+
+def test_key_ignores_client_version_fields():
+    assert chat_context.plan_key(_plan("Same", 1)) == chat_context.plan_key(_plan("Same", 7))
+    assert chat_context.plan_key(_plan("Same")) != chat_context.plan_key(_plan("Other"))
+
+
+def test_prompt_contains_only_the_sent_plan():
+    chat_context.build_user_prompt([{"role": "user", "content": "hi"}], _plan("Alice secret salmon"))
+    prompt, _ = chat_context.build_user_prompt([{"role": "user", "content": "hi"}], _plan("Bob tofu bowl"))
+    assert "Bob tofu bowl" in prompt and "Alice" not in prompt
+
+
+def test_budget_degrades_plan_detail():
+    plan = {"days": [{"day": d, "meals": [{"name": f"Meal {d}-{i} with a fairly long descriptive name",
+                                           "calories": 500} for i in range(4)]} for d in range(1, 8)]}
+    _, level, tokens = chat_context.fit_plan(plan, 10_000)
+    assert level == "full"
+    _, level, small = chat_context.fit_plan(plan, 60)
+    assert level == "totals" and small < tokens
+
+
+def test_history_kept_newest_first_within_budget():
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"message {i} " * 40} for i in range(20)]
+    messages.append({"role": "user", "content": "latest question"})
+    prompt, info = chat_context.build_user_prompt(messages, None, budget=400)
+    assert "latest question" in prompt
+    assert info["history_kept"] < 20
+    assert "message 19" in prompt and "message 0 " not in prompt
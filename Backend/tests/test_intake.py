@@ -0,0 +1,67 @@
+import random
+
+import pytest
+
+from backend_common import intake
+
+
+def _profiles(n, seed=7):
+    rng = random.Random(seed)
+    out = []
+    for _ in range(n):
+        p = {"age": rng.randint(13, 100), "height_cm": rng.uniform(100, 250), "weight_kg": rng.uniform(30, 300),
+             "sex": rng.choice(["male", "female", "M", "f", None, ""]),
+             "activity_level": rng.choice(list(intake.ACTIVITY_MULTIPLIERS) + ["very active", None]),
+             "goal": rng.choice(list(intake.GOAL_OFFSETS) + ["weight loss", None]),
+             "diet": rng.choice(["balanced", "keto", "high-protein", "vegetarian", None])}
+        if rng.random() < 0.2:
+            p["caloric_goal"] = rng.randint(1200, 3500)
+        out.append(p)
+    return out
+
+
+def test_batch_matches_scalar():
+    profiles = _profiles(2000)
+    assert intake.compute_targets_batch(profiles) == [intake.compute_targets(p) for p in profiles]
+
+
+def test_batch_matches_scalar_on_range_edges():
+    lo = {k: v[0] for k, v in intake.LIMITS.items()}
+    hi = {k: v[1] for k, v in intake.LIMITS.items()}
+    profiles = [lo, hi, {**lo, "sex": "female", "goal": "lose"}, {**hi, "calorie_target": 2000}]
+    assert intake.compute_targets_batch(profiles) == [intake.compute_targets(p) for p in profiles]
+
+
+def test_known_values():
+    t = intake.compute_targets({"age": 30, "sex": "male", "height_cm": 180, "weight_kg": 80,
+                                "activity_level": "moderate", "goal": "maintain"})
+    assert t["bmr"] == 1780  # 800 + 1125 - 150 + 5
+    assert t["tdee"] == round(1780 * 1.55)
+    assert t["calorie_target"] == t["tdee"]
+    assert t["protein_g_target"] == 128
+
+
+def test_calorie_floor():
+    t = intake.compute_targets({"age": 90, "sex": "female", "height_cm": 140, "weight_kg": 35,
+                                "activity_level": "sedentary", "goal": "lose"})
+    assert t["calorie_target"] == intake.MIN_CALORIES["female"]
+
+
+@pytest.mark.parametrize("bad, field", [({"age": 5}, "age"), ({"weight_kg": "heavy"}, "weight_kg"),
+                                         ({"sex": "other"}, "sex"), ({"goal": "bulk"}, "goal")])
+def test_batch_names_the_bad_profile(bad, field):
+    profiles = _profiles(5)
+    profiles[3] = {**profiles[3], **bad}
+    with pytest.raises(intake.IntakeError) as err:
+        intake.compute_targets_batch(profiles)
+    assert "profile 3" in str(err.value) and field in str(err.value)
+    with pytest.raises(intake.IntakeError):
+        intake.compute_targets(profiles[3])
+
+
+def test_with_targets_keeps_explicit_targets():
+    prefs = {"age": 30, "height_cm": 170, "weight_kg": 70, "protein_g_target": 150}
+    out = intake.with_targets(prefs)
+    assert out["protein_g_target"] == 150 and out["calorie_target"] > 0
+    assert intake.with_targets({"calorie_target": 1800, "age": 30}) == {"calorie_target": 1800, "age": 30}
+    assert intake.with_targets({"age": 30}) == {"age": 30}
@@ -0,0 +1,94 @@
+import threading
+import time
+from datetime import timedelta
+
+import pytest
+
+pytest.importorskip("bson")
+from bson import ObjectId
+
+from backend_common import jobs
+
+
+def _wait(job_id, user_id, status, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        doc = jobs.get_job(job_id, user_id)
+        if doc["status"] == status:
+            return doc
+        time.sleep(0.01)
+    raise AssertionError(f"job never reached {status}: {doc}")
+
+
+def test_submit_records_progress_and_result(mongo):
+    user = ObjectId()
+    job_id = jobs.create_job("test", user)
+    jobs.submit(job_id, lambda progress: progress("working", 50) or {"answer": 42})
+    doc = _wait(job_id, user, "done")
+    assert doc["result"] == {"answer": 42}
+    assert jobs.public_job(doc)["progress"] == {"stage": "done", "pct": 100}
+    assert jobs.get_job(job_id, ObjectId()) is None  # other users never see it
+    assert not jobs._live
+
+
+def test_failure_is_recorded(mongo):
+    user = ObjectId()
+    job_id = jobs.create_job("test", user)
+
+    def boom(progress):
+        raise RuntimeError("model down")
+    jobs.submit(job_id, boom)
+    assert _wait(job_id, user, "failed")["error"] == "model down"
+
+
+def test_full_queue_raises_and_marks_the_job(mongo, monkeypatch):
+    monkeypatch.setattr(jobs, "_slots", threading.BoundedSemaphore(1))
+    user, release = ObjectId(), threading.Event()
+    first = jobs.create_job("test", user)
+    jobs.submit(first, lambda progress: release.wait(5) and "ok")
+    second = jobs.create_job("test", user)
+    with pytest.raises(jobs.JobQueueFull):
+        jobs.submit(second, lambda progress: "never runs")
+    doc = jobs.get_job(second, user)
+    assert doc["status"] == "failed" and doc["error"] == "job queue full"
+    release.set()
+    _wait(first, user, "done")
+    third = jobs.create_job("test", user)  # the slot came back
+    jobs.submit(third, lambda progress: "ok")
+    _wait(third, user, "done")
+
+
+def test_stale_lease_reads_as_failed(mongo):
+    user = ObjectId()
+    job_id = jobs.create_job("test", user)
+    old = jobs._now() - timedelta(seconds=jobs.JOB_STALE_SECONDS + 5)
+    mongo.jobs.update_one({"_id": ObjectId(job_id)}, {"$set": {"status": "running", "updatedAt": old}})
+    doc = jobs.get_job(job_id, user)
+    assert doc["status"] == "failed" and "stopped responding" in doc["error"]
+    assert mongo.jobs.find_one({"_id": ObjectId(job_id)})["status"] == "failed"  # stored, not just reported
+
+
+def test_fresh_and_terminal_jobs_are_left_alone(mongo):
+    user = ObjectId()
+    running = jobs.create_job("test", user)
+    assert jobs.get_job(running, user)["status"] == "queued"
+    done = jobs.create_job("test", user)
+    old = jobs._now() - timedelta(days=1)
+    mongo.jobs.update_one({"_id": ObjectId(done)}, {"$set": {"status": "done", "updatedAt": old}})
+    assert jobs.get_job(done, user)["status"] == "done"
+
+
+def test_heartbeat_renews_live_jobs_only(mongo):
+    user, release = ObjectId(), threading.Event()
+    live = jobs.create_job("test", user)
+    idle = jobs.create_job("test", user)
+    old = jobs._now() - timedelta(seconds=jobs.JOB_STALE_SECONDS + 5)
+    mongo.jobs.update_many({}, {"$set": {"updatedAt": old}})
+    jobs.submit(live, lambda progress: release.wait(5) and "ok")
+    time.sleep(0.05)
+    mongo.jobs.update_one({"_id": ObjectId(live)}, {"$set": {"updatedAt": old}})
+    jobs._beat()
+    assert jobs.get_job(live, user)["status"] == "running"
+    assert jobs.get_job(idle, user)["status"] == "failed"  # nobody holds it
+    release.set()
+    _wait(live, user, "done")
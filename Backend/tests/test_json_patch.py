@@ -0,0 +1,114 @@
+import copy
+
+import pytest
+
+from backend_common import json_patch, plan_schema
+
+
+def _plan():
+    return plan_schema.normalize_plan({"days": [
+        {"day": 1, "meals": [{"name": "Oats", "calories": 400, "protein_g": 15, "carbs_g": 60, "fat_g": 10},
+                             {"name": "Salad", "calories": 500, "protein_g": 30, "carbs_g": 40, "fat_g": 20}]},
+        {"day": 2, "meals": [{"name": "Eggs", "calories": 350, "protein_g": 25, "carbs_g": 5, "fat_g": 25}]},
+    ]})
+
+
+def _apply(doc, update):
+    """Apply a $set/$unset/$push update to doc the way MongoDB would (dotted paths, numeric indexes)."""
+    doc = copy.deepcopy(doc)
+
+    def walk(path):
+        parts = path.split(".")
+        cur = doc
+        for p in parts[:-1]:
+            cur = cur[int(p)] if isinstance(cur, list) else cur[p]
+        return cur, parts[-1]
+
+    for op, fields in update.items():
+        for path, value in fields.items():
+            parent, key = walk(path)
+            slot = int(key) if isinstance(parent, list) else key
+            if op == "$set":
+                parent[slot] = value
+            elif op == "$unset":
+                parent.pop(slot, None)
+            elif op == "$push":
+                parent[slot].extend(value["$each"])
+    return doc
+
+
+def _patch(plan, ops):
+    doc = {"plan": plan}
+    patched, update = json_patch.to_mongo_update(plan, ops, root="plan")
+    normalized = plan_schema.normalize_plan(patched)
+    update = plan_schema.refresh_update(normalized, update, root="plan")
+    return normalized, update, _apply(doc, update)["plan"]
+
+
+def test_replace_sets_only_that_field():
+    _, update = json_patch.to_mongo_update(_plan(), [{"op": "replace", "path": "/days/0/meals/1/name", "value": "Soup"}],
+                                           root="plan")
+    assert update == {"$set": {"plan.days.0.meals.1.name": "Soup"}}
+
+
+def test_append_is_a_push():
+    meal = {"name": "Apple", "calories": 95, "protein_g": 0.5, "carbs_g": 25, "fat_g": 0.3}
+    _, update = json_patch.to_mongo_update(_plan(), [{"op": "add", "path": "/days/1/meals/-", "value": meal}],
+                                           root="plan")
+    assert update == {"$push": {"plan.days.1.meals": {"$each": [meal]}}}
+
+
+def test_remove_from_array_rewrites_the_array():
+    plan = _plan()
+    patched, update = json_patch.to_mongo_update(plan, [{"op": "remove", "path": "/days/0/meals/0"}], root="plan")
+    assert update == {"$set": {"plan.days.0.meals": patched["days"][0]["meals"]}}
+    assert [m["name"] for m in patched["days"][0]["meals"]] == ["Salad"]
+
+
+def test_nested_changes_collapse_to_the_ancestor():
+    ops = [{"op": "replace", "path": "/days/0/meals/0/calories", "value": 450},
+           {"op": "replace", "path": "/days/0/meals", "value": [{"name": "Toast", "calories": 300}]}]
+    _, update = json_patch.to_mongo_update(_plan(), ops, root="plan")
+    assert list(update["$set"]) == ["plan.days.0.meals"]
+
+
+def test_failed_test_op_and_bad_paths_raise():
+    plan = _plan()
+    with pytest.raises(json_patch.PatchError):
+        json_patch.to_mongo_update(plan, [{"op": "test", "path": "/days/0/meals/0/name", "value": "Pancakes"}])
+    with pytest.raises(json_patch.PatchError):
+        json_patch.to_mongo_update(plan, [{"op": "replace", "path": "/days/5/meals", "value": []}])
+    with pytest.raises(json_patch.PatchError):
+        json_patch.to_mongo_update(plan, [{"op": "add", "path": "/days/0/a.b", "value": 1}], root="plan")
+    assert plan == _plan()  # the input is never mutated
+
+
+def test_refresh_update_recomputes_day_and_plan_totals():
+    normalized, update, stored = _patch(_plan(), [
+        {"op": "replace", "path": "/days/0/meals/0/calories", "value": 600}])
+    assert update["$set"]["plan.days.0.meals.0.calories"] == 600
+    assert stored == normalized
+    assert stored["days"][0]["totals"]["calories"] == 1100
+    assert stored["days"][1]["totals"] == _plan()["days"][1]["totals"]  # untouched day keeps its totals
+    assert stored["totals"]["calories"] == 1450
+
+
+def test_refresh_update_after_push_and_remove_matches_a_full_normalize():
+    ops = [{"op": "add", "path": "/days/1/meals/-", "value": {"name": "Apple", "calories": "95 kcal"}},
+           {"op": "remove", "path": "/days/0/meals/1"}]
+    normalized, _, stored = _patch(_plan(), ops)
+    assert stored == normalized
+    assert stored["days"][1]["meals"][-1]["calories"] == 95.0  # written normalized, not as sent
+    assert stored["totals"]["calories"] == 400 + 350 + 95
+
+
+def test_client_written_totals_are_ignored():
+    normalized, update, stored = _patch(_plan(), [
+        {"op": "replace", "path": "/days/0/totals/calories", "value": 1}])
+    assert stored == normalized
+    assert stored["days"][0]["totals"]["calories"] == 900
+
+
+def test_unknown_field_is_rejected():
+    with pytest.raises(plan_schema.PlanValidationError):
+        _patch(_plan(), [{"op": "add", "path": "/days/0/note", "value": "x"}])
@@ -0,0 +1,70 @@
+import os
+import subprocess
+import sys
+
+import pytest
+
+jwt = pytest.importorskip("jwt")
+
+from backend_common import jwt_tools
+
+
+@pytest.fixture(autouse=True)
+def empty_cache():
+    jwt_tools._cache.clear()
+    yield
+    jwt_tools._cache.clear()
+
+
+def _misses():
+    return jwt_tools.token_cache_stats()["misses"]
+
+
+def test_verified_claims_are_cached_until_exp(monkeypatch):
+    token = jwt_tools.make_token({"sub": "u1"}, ttl_seconds=60)
+    misses = _misses()
+    assert jwt_tools.verify_token_cached(token)["sub"] == "u1"
+    assert jwt_tools.verify_token_cached(token)["sub"] == "u1"
+    assert _misses() == misses + 1  # the second call was a hit
+
+    exp = jwt_tools.verify_token(token)["exp"]
+    real_now = jwt_tools._now
+    monkeypatch.setattr(jwt_tools, "_now", lambda: exp)  # the entry is served only while now < exp
+    calls = []
+    monkeypatch.setattr(jwt_tools, "verify_token", lambda t: calls.append(t) or {"sub": "u1", "exp": real_now() + 60})
+    jwt_tools.verify_token_cached(token)
+    assert calls == [token]
+
+
+def test_expired_tokens_raise_and_are_not_cached(monkeypatch):
+    real_now = jwt_tools._now
+    monkeypatch.setattr(jwt_tools, "_now", lambda: real_now() - 3600)
+    token = jwt_tools.make_token({"sub": "u1"}, ttl_seconds=60)  # expired an hour minus a minute ago
+    monkeypatch.setattr(jwt_tools, "_now", real_now)
+    for _ in range(2):
+        with pytest.raises(jwt.ExpiredSignatureError):
+            jwt_tools.verify_token_cached(token)
+    assert not jwt_tools._cache
+
+
+def test_bad_signature_is_rejected():
+    token = jwt_tools.make_token({"sub": "u1"}, ttl_seconds=60)
+    with pytest.raises(jwt.InvalidSignatureError):
+        jwt_tools.verify_token_cached(token[:-2] + ("AA" if token[-2:] != "AA" else "BB"))
+
+
+def test_cache_is_bounded(monkeypatch):
+    monkeypatch.setattr(jwt_tools, "JWT_CACHE_MAX", 3)
+    for i in range(5):
+        jwt_tools.verify_token_cached(jwt_tools.make_token({"sub": f"u{i}"}, ttl_seconds=60))
+    assert len(jwt_tools._cache) == 3
+
+
+def test_secret_comes_from_the_dotenv_even_when_imported_first(tmp_path):
+    backend = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    (tmp_path / ".env").write_text("JWT_SECRET=from-dotenv-" + "y" * 32 + "\n")
+    env = {k: v for k, v in os.environ.items() if k != "JWT_SECRET"}
+    env["PYTHONPATH"] = backend
+    out = subprocess.run([sys.executable, "-c", "from backend_common import jwt_tools; print(jwt_tools.JWT_SECRET)"],
+                         cwd=tmp_path, env=env, capture_output=True, text=True, check=True)
+    assert out.stdout.strip().startswith("from-dotenv-")
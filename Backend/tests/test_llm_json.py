@@ -0,0 +1,30 @@
+import json
+from pathlib import Path
+
+import pytest
+
+from backend_common import llm_json
+
+CORPUS = Path(__file__).resolve().parent.parent / "data" / "llm_json_corpus.jsonl"
+CASES = [json.loads(line) for line in CORPUS.read_text(encoding="utf-8").splitlines() if line.strip()]
+
+
+@pytest.mark.parametrize("case", CASES, ids=[c["name"] for c in CASES])
+def test_corpus(case):
+    if case.get("expect") is None:
+        with pytest.raises(llm_json.JSONExtractError):
+            llm_json.extract_object(case["text"])
+    else:
+        assert llm_json.extract_object(case["text"]) == case["expect"]
+
+
+def test_braces_inside_strings_do_not_count():
+    text = 'Note {draft}: {"a": "x } y", "b": [1, 2,],} trailing {junk}'
+    assert llm_json.extract_object(text) == {"a": "x } y", "b": [1, 2]}
+
+
+def test_array_and_non_object():
+    assert llm_json.extract_json("list: [1, 2, 3] done", "[") == [1, 2, 3]
+    with pytest.raises(llm_json.JSONExtractError):
+        llm_json.extract_object("no json here")
+    assert llm_json.try_extract_object("nothing") is None
@@ -0,0 +1,48 @@
+from backend_common import macro_audit
+
+
+def _meal(ingredients, calories, protein=14.0):
+    return {"name": "Oatmeal", "calories": calories, "protein_g": protein, "carbs_g": 70.0, "fat_g": 6.0,
+            "ingredients": ingredients}
+
+
+OATMEAL = ["80 g rolled oats", "250 ml water", "1 tbsp honey", "1 banana"]  # about 480 kcal, 12 g protein
+
+
+def test_water_adds_nothing():
+    # water used to resolve to tuna: 400 kcal claimed was "corrected" to 770 kcal / 80 g protein
+    (out,), _ = macro_audit.audit_meals([_meal(OATMEAL, 400.0)], mode="correct")
+    assert out["audit"]["coverage"] == 1.0
+    assert 450 < out["calories"] < 510 and out["protein_g"] < 20
+
+
+def test_claim_within_tolerance_is_ok():
+    (out,), counts = macro_audit.audit_meals([_meal(OATMEAL, 470.0)], mode="correct")
+    assert out["audit"]["status"] == "ok" and out["calories"] == 470.0
+    assert counts["ok"] == 1
+
+
+def test_inflated_claim_is_corrected():
+    (out,), _ = macro_audit.audit_meals([_meal(OATMEAL, 900.0)], mode="correct")
+    assert out["audit"]["status"] == "corrected"
+    assert out["calories"] < 510 and out["audit"]["claimed"]["calories"] == 900.0
+
+
+def test_loose_matches_do_not_count_as_coverage():
+    # "avocado toast" and "chiken thigh" only match approximately/fuzzily
+    meal = _meal(["1 slice avocado toast", "150 g chiken thigh", "1 tbsp olive oil"], 2000.0)
+    (out,), _ = macro_audit.audit_meals([meal], mode="correct")
+    assert out["audit"]["status"] == "unverified" and out["calories"] == 2000.0
+
+
+def test_off_mode_returns_meals_untouched():
+    meals = [_meal(["80 g rolled oats"], 100.0)]
+    out, counts = macro_audit.audit_meals(meals, mode="off")
+    assert out is meals and not any(counts.values())
+
+
+def test_audit_plan_recomputes_totals(capsys):
+    plan = {"days": [{"day": 1, "meals": [_meal(["80 g rolled oats", "1 banana"], 900.0)]}]}
+    out = macro_audit.audit_plan(plan, mode="correct")
+    assert out["days"][0]["totals"]["calories"] == out["days"][0]["meals"][0]["calories"] < 900
+    assert capsys.readouterr().out == ""
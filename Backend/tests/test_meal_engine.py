@@ -0,0 +1,54 @@
+import pytest
+
+from backend_common import meal_engine
+
+SOLVERS = sorted(meal_engine.SOLVERS)
+
+PROFILES = [
+    {"calorie_target": 2000, "meals_per_day": 3},
+    {"calorie_target": 2400, "meals_per_day": 3, "diet": "keto", "exclude_ingredients": ["dairy", "eggs"]},
+    {"calorie_target": 2000, "meals_per_day": 3, "diet": "keto"},
+    {"calorie_target": 2200, "meals_per_day": 1},
+    {"calorie_target": 1800, "meals_per_day": 1, "diet": "vegan"},
+    {"calorie_target": 4000, "meals_per_day": 2},
+    {"calorie_target": 3000, "meals_per_day": 10, "exclude_ingredients": ["dairy", "eggs", "peanuts", "tree nuts"]},
+    {"calorie_target": 1200, "meals_per_day": 10},
+]
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+@pytest.mark.parametrize("prefs", PROFILES, ids=lambda p: f"{p['calorie_target']}-{p['meals_per_day']}-{p.get('diet', '')}")
+def test_local_plans_meet_calorie_tolerance(prefs, solver):
+    plan = meal_engine.plan_week(prefs, solver=meal_engine.SOLVERS[solver])
+    assert len(plan["days"]) == 7
+    assert meal_engine.within_tolerance(plan, prefs), [
+        d["deviation"]["calories"] for d in meal_engine.plan_deviation(plan, prefs)]
+
+
+@pytest.mark.parametrize("solver", SOLVERS)
+@pytest.mark.parametrize("meals_per_day", [6, 10, 12])
+def test_many_meals_never_repeat_within_a_day(meals_per_day, solver):
+    prefs = {"calorie_target": 3000, "meals_per_day": meals_per_day, "exclude_ingredients": ["dairy", "eggs"]}
+    plan = meal_engine.plan_week(prefs, solver=meal_engine.SOLVERS[solver])
+    for d in plan["days"]:
+        names = [m["name"] for m in d["meals"]]
+        assert len(names) == len(set(names))
+
+
+def test_plan_is_deterministic():
+    prefs = {"calorie_target": 2100, "meals_per_day": 4, "diet": "vegetarian"}
+    assert meal_engine.plan_week(prefs) == meal_engine.plan_week(prefs)
+
+
+def test_day_totals_are_stored():
+    plan = meal_engine.plan_week({"calorie_target": 2000, "meals_per_day": 3})
+    day = plan["days"][0]
+    assert day["totals"]["calories"] == pytest.approx(sum(m["calories"] for m in day["meals"]), abs=0.5)
+
+
+def test_replacement_keeps_calories_close():
+    plan = meal_engine.plan_week({"calorie_target": 2000, "meals_per_day": 3})
+    meals = plan["days"][0]["meals"]
+    new = meal_engine.replacement_meal({"calorie_target": 2000}, meals, 1)
+    assert new["name"] != meals[1]["name"]
+    assert abs(new["calories"] - meals[1]["calories"]) <= 0.15 * meals[1]["calories"]
@@ -0,0 +1,100 @@
+import pytest
+
+pytest.importorskip("bson")
+from bson import ObjectId
+
+from backend_common import mealplans, plan_schema
+
+
+def _plan():
+    return plan_schema.normalize_plan({"days": [
+        {"day": 1, "meals": [{"name": "Oats", "calories": 400}, {"name": "Salad", "calories": 500}]},
+        {"day": 2, "meals": [{"name": "Eggs", "calories": 350}]},
+    ]})
+
+
+def test_versions_count_up(mongo):
+    user = ObjectId()
+    assert [mealplans.save_plan(user, _plan()) for _ in range(3)] == [1, 2, 3]
+    assert mealplans.latest_plan(user)["version"] == 3
+    assert [v["version"] for v in mealplans.plan_history(user)] == [3, 2, 1]
+
+
+def test_update_version_only_at_the_read_rev(mongo):
+    user = ObjectId()
+    version = mealplans.save_plan(user, _plan())
+    assert mealplans.update_version(user, version, 0, {"$set": {"plan.days.0.meals.0.name": "Toast"}}) == 1
+    assert mealplans.update_version(user, version, 0, {"$set": {"plan.days.0.meals.0.name": "Stale"}}) is None
+    assert mealplans.update_version(user, version, 1, {"$set": {"plan.days.0.meals.0.name": "Bagel"}}) == 2
+    assert mealplans.get_version(user, version)["plan"]["days"][0]["meals"][0]["name"] == "Bagel"
+
+
+def test_set_meal_writes_the_element_and_totals(mongo):
+    user = ObjectId()
+    version = mealplans.save_plan(user, _plan())
+    meal = plan_schema.normalize_meal({"name": "Soup", "calories": 300})
+    rev = mealplans.set_meal(user, version, 0, 0, 1, meal, day_totals={"calories": 700.0},
+                             plan_totals={"calories": 1050.0})
+    assert rev == 1
+    plan = mealplans.get_version(user, version)["plan"]
+    assert plan["days"][0]["meals"][1]["name"] == "Soup"
+    assert plan["days"][0]["totals"] == {"calories": 700.0}
+    assert plan["days"][1]["totals"]["calories"] == 350  # other days untouched
+    assert plan["totals"] == {"calories": 1050.0}
+
+
+def test_set_meal_refuses_a_stale_rev(mongo):
+    user = ObjectId()
+    version = mealplans.save_plan(user, _plan())
+    mealplans.update_version(user, version, 0, {"$set": {"plan.days.0.meals.0.name": "Toast"}})  # a PATCH
+    meal = plan_schema.normalize_meal({"name": "Soup", "calories": 300})
+    assert mealplans.set_meal(user, version, 0, 0, 1, meal, day_totals={"calories": 1.0}) is None
+    doc = mealplans.get_version(user, version)
+    assert doc["rev"] == 1 and doc["plan"]["days"][0]["meals"][1]["name"] == "Salad"
+    assert mealplans.set_meal(user, version, 1, 0, 1, meal) == 2
+
+
+def test_set_meal_missing_day_or_meal(mongo):
+    user = ObjectId()
+    version = mealplans.save_plan(user, _plan())
+    meal = plan_schema.normalize_meal({"name": "Soup"})
+    assert mealplans.set_meal(user, version, 0, 1, 1, meal) is None
+    assert mealplans.set_meal(user, version, 0, 5, 0, meal) is None
+    assert mealplans.get_version(user, version).get("rev", 0) == 0
+
+
+def test_bulk_save_continues_each_users_versions(mongo):
+    mealplans.ensure_mealplan_indexes()
+    a, b = ObjectId(), ObjectId()
+    mealplans.save_plan(a, _plan())
+    versions = mealplans.save_plans_bulk([(a, _plan(), "batch"), (b, _plan(), "batch")])
+    assert versions == {a: 2, b: 1}
+    assert mealplans.latest_plan(a)["source"] == "batch"
+
+
+def test_version_race_takes_the_next_number(mongo, monkeypatch):
+    mealplans.ensure_mealplan_indexes()
+    user = ObjectId()
+    mealplans.save_plan(user, _plan())
+    coll = mongo.mealplans
+    real_find_one, reads = coll.find_one, []
+
+    def stale_first_read(*args, **kwargs):
+        reads.append(1)  # the first read predates the other save: version 1 looks free
+        return None if len(reads) == 1 else real_find_one(*args, **kwargs)
+    monkeypatch.setattr(coll, "find_one", stale_first_read)
+    assert mongo.mealplans is coll
+    assert mealplans.save_plan(user, _plan()) == 2 and len(reads) == 2
+
+
+def test_legacy_embedded_plan_is_read_then_migrated(mongo):
+    user = ObjectId()
+    mongo.user_prefs.insert_one({"user_id": user, "meal_plan": _plan()})
+    legacy = mealplans.latest_plan(user)
+    assert legacy["version"] == 0 and legacy["source"] == "legacy"
+    assert mealplans.versioned(user, legacy)["version"] == 1
+    other = ObjectId()
+    mongo.user_prefs.insert_one({"user_id": other, "meal_plan": _plan()})
+    assert mealplans.migrate_embedded_plans() == 1  # `user` already has a version
+    assert mealplans.latest_plan(other)["version"] == 1
+    assert mongo.user_prefs.count_documents({"meal_plan": {"$exists": True}}) == 0
@@ -0,0 +1,56 @@
+import pytest
+
+from backend_common import nutrition
+
+
+@pytest.mark.parametrize("query, food", [
+    ("150 g chicken breast", "chicken breast"),
+    ("grilled chicken breast strips", "chicken breast"),
+    ("brocoli", "broccoli"),
+    ("chicken br", "chicken breast"),
+    ("cherry tomatoes", "tomatoes"),
+    ("rice milk", "rice milk"),
+    ("ice cream", "ice cream"),
+    ("potato chips", "potato chips"),
+    ("grapefruit", "grapefruit"),
+])
+def test_confident_matches(query, food):
+    r = nutrition.lookup(query)
+    assert r["found"] and r["food"] == food
+
+
+@pytest.mark.parametrize("query", ["water", "500 ml water", "1 cup ice", "a pinch of salt", "2 cups black coffee"])
+def test_zero_calorie_staples(query):
+    r = nutrition.lookup(query)
+    assert r["found"] and r["calories"] <= 5
+
+
+@pytest.mark.parametrize("query, suggestion", [
+    ("cheese", "cream cheese"),
+    ("avocado toast", "avocado"),
+    ("coconut oil", "olive oil"),
+    ("pot", "potatoes"),
+])
+def test_partial_names_are_not_found(query, suggestion):
+    r = nutrition.lookup(query)
+    assert r["found"] is False and r["match"] == "approximate"
+    assert r["suggestion"] == suggestion and "calories" not in r
+
+
+def test_unknown_food():
+    assert nutrition.lookup("unobtainium stew") == {"query": "unobtainium stew", "found": False}
+
+
+def test_can_is_a_unit():
+    assert nutrition.lookup("1 can black beans")["grams"] == 240.0
+
+
+def test_lookup_many_matches_lookup():
+    texts = ["150 g chicken breast", "1 cup brown rice", "cheese", "water", "nonsense"]
+    assert nutrition.lookup_many(texts) == [nutrition.lookup(t) for t in texts]
+
+
+def test_resolve_many_skips_approximate_hits():
+    ids, grams, hits = nutrition.resolve_many(["100 g oats", "avocado toast"])
+    assert len(ids) == len(grams) == 1
+    assert hits[1] is not None and not nutrition.confident(hits[1])
@@ -0,0 +1,70 @@
+import pytest
+
+from backend_common import meal_engine
+from backend_common.recipes import NoRecipesError, RecipeCatalog, get_catalog, iter_bits
+
+MANY_EXCLUSIONS = ["eggs", "dairy", "gluten", "peanuts", "tree nuts", "mango", "turkey", "chicken", "salmon", "tofu"]
+
+
+def _row(name, slot, allergens="", ingredients="", diets=""):
+    return {"name": name, "slot": slot, "calories": "400", "protein_g": "20", "carbs_g": "40", "fat_g": "15",
+            "allergens": allergens, "ingredients": ingredients, "diets": diets, "cuisine": "", "prep_minutes": "10"}
+
+
+def _names(cat, mask):
+    return {cat.names[i] for i in iter_bits(mask)}
+
+
+def test_exclusions_are_never_relaxed():
+    cat = get_catalog()
+    excluded = cat.excluded_mask(MANY_EXCLUSIONS)
+    for slot in ("breakfast", "lunch", "dinner", "snack"):
+        mask = cat.filter(slot, "balanced", MANY_EXCLUSIONS)
+        assert mask and not mask & excluded
+
+
+def test_emptied_slot_borrows_from_other_slots():
+    cat = RecipeCatalog([_row("Omelet", "breakfast", "eggs", "eggs"), _row("Bean Bowl", "lunch", "", "beans")])
+    assert _names(cat, cat.filter("breakfast", None, ["eggs"])) == {"Bean Bowl"}
+
+
+def test_no_compliant_recipe_raises():
+    cat = RecipeCatalog([_row("Omelet", "breakfast", "eggs", "eggs"), _row("Egg Salad", "lunch", "eggs", "eggs")])
+    with pytest.raises(NoRecipesError):
+        cat.filter("breakfast", None, ["egg"])
+
+
+def test_plan_week_respects_many_exclusions():
+    prefs = {"calorie_target": 2000, "meals_per_day": 3, "exclude_ingredients": MANY_EXCLUSIONS}
+    cat = get_catalog()
+    excluded = _names(cat, cat.excluded_mask(MANY_EXCLUSIONS))
+    plan = meal_engine.plan_week(prefs)
+    served = {m["name"] for d in plan["days"] for m in d["meals"]}
+    assert served and not served & excluded
+
+
+def test_diet_borrows_from_other_slots_before_it_is_dropped():
+    cat = RecipeCatalog([_row("Pancakes", "breakfast"), _row("Egg Cups", "breakfast", "eggs", "eggs", "keto"),
+                         _row("Steak Salad", "lunch", diets="keto")])
+    assert _names(cat, cat.filter("breakfast", "keto", ["eggs"])) == {"Steak Salad"}
+    assert _names(cat, cat.filter("breakfast", "vegan", ["eggs"])) == {"Pancakes"}  # no vegan recipe at all
+
+
+@pytest.mark.parametrize("diet, excludes", [("keto", ["eggs"]),
+                                            ("vegan", ["soy", "gluten", "tree nuts", "peanuts"])])
+def test_plan_week_keeps_the_diet_when_the_catalog_allows(diet, excludes):
+    cat = get_catalog()
+    plan = meal_engine.plan_week({"calorie_target": 2000, "meals_per_day": 3, "diet": diet,
+                                  "exclude_ingredients": excludes})
+    served = {m["name"] for d in plan["days"] for m in d["meals"]}
+    assert served <= _names(cat, cat.diet_mask(diet))
+    assert "notes" not in plan
+
+
+def test_plan_week_notes_a_dropped_diet():
+    cat = get_catalog()
+    excludes = ["dairy", "eggs"]
+    assert not cat.diet_mask("keto") & ~cat.excluded_mask(excludes)  # the catalog has no such recipe
+    plan = meal_engine.plan_week({"calorie_target": 2400, "meals_per_day": 3, "diet": "keto",
+                                  "exclude_ingredients": excludes})
+    assert len(plan["notes"]) == 1 and "not keto" in plan["notes"][0]
@@ -0,0 +1,95 @@
+import pytest
+
+pytest.importorskip("flask")
+from bson import ObjectId
+
+import app as app_module
+import routes_prefs_meals as meals
+from backend_common import jwt_tools, meal_engine, mealplans, plan_schema
+
+
+@pytest.fixture
+def client(mongo, monkeypatch):
+    monkeypatch.setenv("MEALPLAN_BACKEND", "local")
+    return app_module.app.test_client()
+
+
+def _auth(user_id):
+    token = jwt_tools.mint_access_and_refresh({"_id": user_id, "email": "a@example.com"})["access_token"]
+    return {"Authorization": f"Bearer {token}"}
+
+
+def _saved_plan(user_id):
+    plan = meal_engine.plan_week({"calorie_target": 2000, "meals_per_day": 3})
+    return mealplans.save_plan(user_id, plan, source="local")
+
+
+def _swap_url(day=2, idx=1):
+    return f"/mealplans/days/{day}/meals/{idx}/regenerate"
+
+
+def test_regenerate_writes_the_meal_and_totals(client):
+    user = ObjectId()
+    version = _saved_plan(user)
+    res = client.post(_swap_url(), headers=_auth(user))
+    out = res.get_json()
+    assert res.status_code == 200 and out["rev"] == 1 and out["version"] == version
+    stored = mealplans.get_version(user, version)["plan"]
+    assert stored["days"][1]["meals"][1] == out["meal"]
+    assert stored == plan_schema.normalize_plan(stored)  # day and week totals match the meals
+
+
+def test_regenerate_conflicts_with_a_concurrent_patch(client, monkeypatch):
+    user = ObjectId()
+    version = _saved_plan(user)
+    swap = meal_engine.replacement_meal
+
+    def slow_swap(*args):
+        # a PATCH lands while the replacement is being generated
+        mealplans.update_version(user, version, 0, {"$set": {"plan.days.0.meals.0.name": "Edited"}})
+        return swap(*args)
+    monkeypatch.setattr(meals.meal_engine, "replacement_meal", slow_swap)
+
+    res = client.post(_swap_url(), headers=_auth(user))
+    assert res.status_code == 409 and res.get_json()["rev"] == 1
+    stored = mealplans.get_version(user, version)
+    assert stored["rev"] == 1 and stored["plan"]["days"][0]["meals"][0]["name"] == "Edited"
+
+
+def test_regenerate_missing_meal_is_404(client, monkeypatch):
+    user = ObjectId()
+    version = _saved_plan(user)
+    assert client.post(_swap_url(idx=9), headers=_auth(user)).status_code == 404
+    swap = meal_engine.replacement_meal
+
+    def meal_removed(*args):
+        mealplans.update_version(user, version, 0, {"$pop": {"plan.days.1.meals": 1}})
+        return swap(*args)
+    monkeypatch.setattr(meals.meal_engine, "replacement_meal", meal_removed)
+    assert client.post(_swap_url(idx=2), headers=_auth(user)).status_code == 404
+
+
+def test_async_generation_parses_off_the_event_loop(mongo, monkeypatch):
+    import asyncio
+    import threading
+    from backend_common import async_llm
+
+    monkeypatch.setenv("MEALPLAN_BACKEND", "strands")
+    monkeypatch.setenv("MEALPLAN_CACHE", "0")
+    prefs = {"calorie_target": 2000, "meals_per_day": 3}
+    threads = []
+
+    async def invoke(model_id, system, user, user_key=None):
+        return "{}"
+
+    def parse(raw, p):
+        threads.append(threading.current_thread())
+        return meal_engine.plan_week(p)
+    monkeypatch.setattr(async_llm, "invoke", invoke)
+    monkeypatch.setattr(meals, "parse_mealplan", parse)
+
+    async def go():
+        return threading.current_thread(), await meals.generate_plan_async(prefs, user_key="u")
+    loop_thread, (plan, source) = asyncio.run(go())
+    assert source == "strands" and len(plan["days"]) == 7
+    assert threads and threads[0] is not loop_thread
@@ -0,0 +1,63 @@
+import threading
+from concurrent.futures import Future
+
+import pytest
+
+pytest.importorskip("bcrypt")
+
+from backend_common import security
+
+
+class _StuckPool:
+    """An executor whose work never finishes."""
+    def __init__(self):
+        self.futures = []
+
+    def submit(self, fn, *args):
+        self.futures.append(Future())
+        return self.futures[-1]
+
+
+@pytest.fixture
+def pooled(monkeypatch):
+    monkeypatch.setattr(security, "BCRYPT_WORKERS", 1)
+    monkeypatch.setattr(security, "_slots", threading.BoundedSemaphore(2))
+
+
+def test_hash_and_verify_on_the_pool(pooled):
+    hashed = security.hash_password("correct horse", rounds=4)
+    assert security.hash_cost(hashed) == 4
+    assert security.verify_password("correct horse", hashed)
+    assert not security.verify_password("wrong horse", hashed)
+    assert security.needs_rehash(hashed) == (security.BCRYPT_ROUNDS != 4)
+
+
+def test_saturated_pool_raises_busy(pooled):
+    security._slots.acquire()
+    security._slots.acquire()
+    try:
+        with pytest.raises(security.HashingBusy):
+            security.hash_password("pw", rounds=4)
+    finally:
+        security._slots.release()
+        security._slots.release()
+
+
+def test_slow_hash_raises_timeout_and_frees_its_slot(pooled, monkeypatch):
+    stuck = _StuckPool()
+    monkeypatch.setattr(security, "_get_pool", lambda: stuck)
+    monkeypatch.setattr(security, "BCRYPT_TIMEOUT_SECONDS", 0.01)
+    with pytest.raises(security.HashingTimeout) as err:
+        security.verify_password("pw", "$2b$04$" + "a" * 53)
+    assert isinstance(err.value, security.HashingBusy)  # the routes' handlers catch both
+    assert stuck.futures[0].cancelled()  # still queued, so it never runs
+    for _ in range(2):  # both slots are free again
+        assert security._slots.acquire(blocking=False)
+    security._slots.release()
+    security._slots.release()
+
+
+def test_inline_mode_skips_the_pool(monkeypatch):
+    monkeypatch.setattr(security, "BCRYPT_WORKERS", 0)
+    monkeypatch.setattr(security, "_get_pool", lambda: pytest.fail("pool used"))
+    assert security.verify_password("pw", security.hash_password("pw", rounds=4))
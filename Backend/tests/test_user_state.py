@@ -0,0 +1,63 @@
+import pytest
+
+pytest.importorskip("bson")
+from bson import ObjectId
+
+from backend_common import jwt_tools, user_state
+
+
+@pytest.fixture
+def users(mongo, monkeypatch):
+    monkeypatch.setattr(user_state, "_cache", type(user_state._cache)())
+    return mongo.users
+
+
+def _user(users, **extra):
+    doc = {"_id": ObjectId(), "email": "a@example.com", "roles": ["user"], **extra}
+    users.insert_one(doc)
+    return doc
+
+
+def test_state_is_cached_until_the_ttl(users, monkeypatch):
+    u = _user(users)
+    sub = str(u["_id"])
+    assert user_state.get_user_state(sub)["tokenVersion"] == 0
+    users.update_one({"_id": u["_id"]}, {"$set": {"tokenVersion": 5}})  # another worker's write
+    assert user_state.get_user_state(sub)["tokenVersion"] == 0  # served from the cache
+    now = user_state.time.monotonic()
+    monkeypatch.setattr(user_state.time, "monotonic", lambda: now + user_state.USER_STATE_TTL_SECONDS + 1)
+    assert user_state.get_user_state(sub)["tokenVersion"] == 5
+
+
+def test_revoke_is_seen_at_once_on_this_worker(users):
+    u = _user(users, tokenVersion=2)
+    sub = str(u["_id"])
+    assert user_state.get_user_state(sub)["tokenVersion"] == 2
+    user_state.revoke_tokens(u["_id"])
+    assert user_state.get_user_state(sub)["tokenVersion"] == 3
+
+
+def test_unknown_and_malformed_subjects(users):
+    assert user_state.get_user_state(str(ObjectId())) is None
+    assert user_state.get_user_state("not-an-id") is None
+
+
+def test_refresh_route_honours_revocation_and_disabled_logins(users):
+    pytest.importorskip("flask")
+    import app as app_module
+    client = app_module.app.test_client()
+    u = _user(users, meta={"loginDisabled": False})
+
+    def refresh(token):
+        return client.post("/auth/refresh", json={"refresh_token": token})
+
+    token = jwt_tools.mint_access_and_refresh(u)["refresh_token"]
+    res = refresh(token)
+    assert res.status_code == 200 and res.get_json()["access_token"]
+    assert refresh(jwt_tools.mint_access_and_refresh(u)["access_token"]).status_code == 400  # wrong type
+
+    user_state.revoke_tokens(u["_id"])
+    assert refresh(token).status_code == 401
+    users.update_one({"_id": u["_id"]}, {"$set": {"meta.loginDisabled": True}})
+    user_state.invalidate_user_state(str(u["_id"]))
+    assert refresh(jwt_tools.mint_access_and_refresh({**u, "tokenVersion": 1})["refresh_token"]).status_code == 403
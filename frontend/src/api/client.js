@@ -6,18 +6,85 @@ export const authApi = {
     me: () => axiosClient.get("/me"),
 };
 
+const sleep = (ms) => new Promise((r) => setTimeout(r, ms));
+
+// Generation runs as a background job; poll until it finishes so callers
+// still get { ok, mealplan, prefs_used } back.
+async function waitForJob(jobId, { intervalMs = 1500, timeoutMs = 300000 } = {}) {
+    const deadline = Date.now() + timeoutMs;
+    while (Date.now() < deadline) {
+        const res = await axiosClient.get(`/mealplans/jobs/${jobId}`);
+        if (res.job?.status === "done") return res;
+        if (res.job?.status === "failed") throw new Error(res.job.error || "Meal plan generation failed.");
+        await sleep(intervalMs);
+    }
+    throw new Error("Meal plan generation timed out.");
+}
+
 export const prefsApi = {
     get: () => axiosClient.get("/preferences"),
     save: (p) => axiosClient.put("/preferences", p),
-    generate: () => axiosClient.post("/mealplans/generate"),
+    generate: async () => {
+        const res = await axiosClient.post("/mealplans/generate");
+        return res.job_id ? waitForJob(res.job_id) : res;
+    },
 };
 
 export const mealplanApi = {
     get: () => axiosClient.get("/mealplans"),
     save: (mealplan) => axiosClient.post("/mealplans/save", { mealplan }),
+    // ops: RFC 6902 JSON Patch against the plan; 409 means someone else saved first
+    patch: (version, rev, ops) => axiosClient.patch("/mealplans", { version, rev, patch: ops }),
+    regenerateMeal: (day, idx) => axiosClient.post(`/mealplans/days/${day}/meals/${idx}/regenerate`),
 };
 
+// Parse a text/event-stream body, calling onEvent(event, data) per message.
+async function readSse(body, onEvent) {
+    const reader = body.getReader();
+    const decoder = new TextDecoder();
+    let buf = "";
+    for (;;) {
+        const { value, done } = await reader.read();
+        if (done) break;
+        buf += decoder.decode(value, { stream: true });
+        let sep;
+        while ((sep = buf.indexOf("\n\n")) !== -1) {
+            const raw = buf.slice(0, sep);
+            buf = buf.slice(sep + 2);
+            let event = "message";
+            let data = "";
+            for (const line of raw.split("\n")) {
+                if (line.startsWith("event:")) event = line.slice(6).trim();
+                else if (line.startsWith("data:")) data += line.slice(5).trim();
+            }
+            if (data) onEvent(event, JSON.parse(data));
+        }
+    }
+}
+
 export const chatApi = {
     send: (messages, mealplan = null) =>
         axiosClient.post("/chat", { messages, mealplan }),
+    // Streams the reply; onChunk(text) fires per token chunk. Resolves to { reply, source }.
+    stream: async (messages, mealplan = null, onChunk = () => {}) => {
+        const t = localStorage.getItem("access_token");
+        const res = await fetch(`${axiosClient.defaults.baseURL}/chat/stream`, {
+            method: "POST",
+            headers: {
+                "Content-Type": "application/json",
+                ...(t ? { Authorization: `Bearer ${t}` } : {}),
+            },
+            body: JSON.stringify({ messages, mealplan }),
+        });
+        if (!res.ok || !res.body) {
+            // let the axios path handle token refresh / error formatting
+            return axiosClient.post("/chat", { messages, mealplan });
+        }
+        let final = { reply: "", source: "strands" };
+        await readSse(res.body, (event, data) => {
+            if (event === "chunk") onChunk(data.text || "");
+            if (event === "done") final = data;
+        });
+        return final;
+    },
 };
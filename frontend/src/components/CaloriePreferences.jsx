@@ -78,6 +78,7 @@ const CaloriePreferences = () => {
         calorie_target: Number(preferences.dailyCalorieGoal) || undefined,
         diet: preferences.dietType || "balanced",
         exclude_ingredients: preferences.allergens,
+        activity_level: preferences.activityLevel,
         // Add more later if/when your UI collects them:
         // protein_g_target, carb_g_target, fat_g_target, meals_per_day, max_prep_minutes, etc.
     });
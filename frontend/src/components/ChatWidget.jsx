@@ -41,11 +41,25 @@ export default function ChatWidget({ mealplan }) {
                 content: String(m.content ?? "")
             }));
 
-            const res = await chatApi.send(payloadMsgs, mealplan); // two args
-            console.log("chat debug <-", res.debug);
-            setMsgs(m => [...m, { role: "assistant", content: res.reply }]);
+            // stream tokens into a placeholder assistant message
+            let streamed = "";
+            setMsgs(m => [...m, { role: "assistant", content: "" }]);
+            const setLast = (content) =>
+                setMsgs(m => [...m.slice(0, -1), { role: "assistant", content }]);
+
+            const res = await chatApi.stream(payloadMsgs, mealplan, (chunk) => {
+                streamed += chunk;
+                setLast(streamed);
+            });
+            console.log("chat debug <-", res.debug || { source: res.source });
+            setLast(res.reply || streamed);
         } catch (e) {
-            setMsgs(m => [...m, { role: "assistant", content: e.message || "Sorry—something broke." }]);
+            setMsgs(m => {
+                // drop the empty streaming placeholder, if any
+                const last = m[m.length - 1];
+                const base = last?.role === "assistant" && !last.content ? m.slice(0, -1) : m;
+                return [...base, { role: "assistant", content: e.message || "Sorry—something broke." }];
+            });
         } finally {
             setPending(false);
         }
@@ -41,6 +41,7 @@ export default function MealPlan() {
 
     const totals = useMemo(() => {
         if (!mealplan?.days?.length) return null;
+        if (mealplan.totals) return mealplan.totals; // stored by the backend
         let c = 0, p = 0, cb = 0, f = 0;
         for (const d of mealplan.days) {
             for (const m of (d.meals || [])) {